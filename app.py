@@ -4,25 +4,51 @@ Date: 2025-10-19 16:38:01 UTC
 Author: Terrificdatabytes
 Strategy: Pre-calculate stop distances with OSRM at startup (forward only), calculate backward as inverse
 """
-from flask import Flask, render_template, request, jsonify, send_from_directory
-from flask_socketio import SocketIO, emit, join_room, leave_room
-from collections import defaultdict, deque
+import time
+STARTUP_STARTED = time.perf_counter() # Cold-start phases are reported by initialize_app and GET /api/startup
+from flask import Flask, render_template, request, jsonify, send_from_directory, redirect
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
+from collections import Counter, defaultdict, deque, OrderedDict
 from manual_distances import ROUTE_SEGMENT_DISTANCES
+from route_stops import ORIGINAL_STOPS
+from route_compiler import ROUTE_ARTIFACTS_FILE, compile_routes, load_route_artifacts, stale_routes
+from reservation_store import ReservationStore
+from session_index import SessionIndex
+from lock_manager import LockManager
+from route_actors import RouteActorRegistry
+from offload import BatchExecutor, HubLatencyProbe, offload_stats, run_blocking
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry
+from profiler import PROFILE_MAX_SECONDS, StackSampler
+from structured_log import SampledLogger, configure_logging, get_logger, log_event
+from reaper import Reaper
+from segment_times import SEGMENT_TIMES_FILE, SegmentTimeTable
+from model_registry import MODELS_DIR, ModelRegistry
+from online_eta import MAX_ACTUAL_MINUTES, ONLINE_ETA_FILE, OnlineETACorrector
+import offload
+from backplane import BackplaneManager
+from sharding import SHARD_COUNT, SHARD_INDEX, is_sharded, owns_route, route_shard, shard_url
 from flask_cors import CORS
 import numpy as np
-import pandas as pd
-import pickle
 import csv
 from datetime import datetime, timedelta
 import os
 from collections import defaultdict
 import uuid
 import hashlib
-import time
-from threading import Lock
+import heapq
 import sys
-import requests
 import json
+import logging
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+# Startup phase -> milliseconds, in order
+startup_phases = OrderedDict()
+_startup_phase_started = [STARTUP_STARTED]
+def mark_startup_phase(name):
+    """Close the current startup phase (everything since the previous mark) under `name`"""
+    now = time.perf_counter()
+    startup_phases[name] = round((now - _startup_phase_started[0]) * 1000, 1)
+    _startup_phase_started[0] = now
+mark_startup_phase('imports')
 bus_last_speed = {}
 # Import the model class
 try:
@@ -33,37 +59,28 @@ except ImportError as e:
     print(f"⚠ Warning: Could not import model_class: {e}")
     MODEL_CLASS_AVAILABLE = False
     LinearRegressionNumpy = None
-# Import the model class(azure)
-'''try:
-    from model_class import LinearRegressionNumpy
-except ImportError:
-    class LinearRegressionNumpy:
-        def __init__(self):
-            self.weights = None
-            self.bias = None
-        
-        def fit(self, X, y, learning_rate=0.01, epochs=1000):
-            n_samples, n_features = X.shape
-            self.weights = np.zeros(n_features)
-            self.bias = 0
-            for _ in range(epochs):
-                y_pred = np.dot(X, self.weights) + self.bias
-                dw = (1/n_samples) * np.dot(X.T, (y_pred - y))
-                db = (1/n_samples) * np.sum(y_pred - y)
-                self.weights -= learning_rate * dw
-                self.bias -= learning_rate * db
-        
-        def predict(self, X):
-            return np.dot(X, self.weights) + self.bias
-        
-        def score(self, X, y):
-            y_pred = self.predict(X)
-            ss_tot = np.sum((y - np.mean(y)) ** 2)
-            ss_res = np.sum((y - y_pred) ** 2)
-            return 1 - (ss_res / ss_tot)'''
 app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your-secret-key-change-in-production'
+DEFAULT_SECRET_KEY = 'your-secret-key-change-in-production'
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', DEFAULT_SECRET_KEY)
+# Resume tokens grant a driver session without a password, so they need a key nobody else knows
+DRIVER_SESSIONS_ENABLED = app.config['SECRET_KEY'] not in ('', DEFAULT_SECRET_KEY)
+# Signed driver session tokens (lets a reconnecting driver skip the password check)
+driver_session_serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='driver-session')
 CORS(app, supports_credentials=True)
+# Leveled, structured logs through a non-blocking queue (LOG_LEVEL, LOG_LEVELS, LOG_FORMAT; see structured_log.py)
+log_handler = configure_logging()
+log = get_logger('app')
+session_log = get_logger('app.session')
+auth_log = get_logger('app.auth')
+fix_log = SampledLogger(get_logger('app.fix')) # Per-fix diagnostics, sampled
+passenger_log = SampledLogger(get_logger('app.passenger')) # Per-request passenger distance diagnostics, sampled
+# Cross-shard pub/sub for Socket.IO rooms: redis://..., amqp://... or the in-repo backplane://host:port
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+socketio_queue_options = {}
+if SOCKETIO_MESSAGE_QUEUE and SOCKETIO_MESSAGE_QUEUE.startswith('backplane://'):
+    socketio_queue_options['client_manager'] = BackplaneManager(SOCKETIO_MESSAGE_QUEUE, channel='flask-socketio')
+elif SOCKETIO_MESSAGE_QUEUE:
+    socketio_queue_options['message_queue'] = SOCKETIO_MESSAGE_QUEUE
 socketio = SocketIO(
     app,
     cors_allowed_origins="*",
@@ -72,132 +89,49 @@ socketio = SocketIO(
     ping_interval=25,
     logger=False,
     engineio_logger=False,
-    always_connect=True
+    always_connect=True,
+    **socketio_queue_options
 )
 '''socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')'''
 # Configuration
-OSRM_SERVER = "http://router.project-osrm.org"
-OSRM_TIMEOUT = 10
-WAYPOINTS_FILE = 'route_waypoints.json'
-STOP_DISTANCES_FILE = 'stop_distances_cache.json'
-REGENERATE_WAYPOINTS = False
-WAYPOINTS_PER_KM = 10
 DRIVERS_FILE = 'bus_drivers.csv'
 LOCATIONS_FILE = 'bus_locations.csv'
 HISTORY_FILE = 'bus_history.csv'
 RESERVATIONS_FILE = 'seat_reservations.csv'
-location_lock = Lock()
-history_lock = Lock()
-bus_data_lock = Lock()
-reservation_lock = Lock()
-# Original Bus Stops (Only actual stops)
-ORIGINAL_STOPS = {
-    '48AC': [
-        {'id': 1, 'name': 'Thirupallai', 'lat': 9.9720416, 'lng': 78.1394837},
-        {'id': 2, 'name': 'Towards Iyer Bunglow', 'lat': 9.9718078, 'lng': 78.1392859},
-        {'id': 3, 'name': 'Iyer Bungalow', 'lat': 9.9673249, 'lng': 78.1366866},
-        {'id': 4, 'name': 'Reserve Line', 'lat': 9.9556417, 'lng': 78.1326311},
-        {'id': 5, 'name': 'Race Course', 'lat': 9.9437216, 'lng': 78.1355206},
-        {'id': 6, 'name': 'Pandian Hotel', 'lat': 9.9387971, 'lng': 78.1366364},
-        {'id': 7, 'name': 'Thallakulam', 'lat': 9.9343902, 'lng': 78.1339649},
-        {'id': 8, 'name': 'Tamukam', 'lat': 9.9310613, 'lng': 78.1319157},
-        {'id': 9, 'name': 'Goripalaiyam', 'lat': 9.9291406, 'lng': 78.1292637},
-        {'id': 10, 'name': 'A.V. Bridge Endpoint', 'lat': 9.9245982, 'lng': 78.124677},
-        {'id': 11, 'name': 'Towards Simakkal', 'lat': 9.9239324, 'lng': 78.1240654},
-        {'id': 12, 'name': 'Simakkal', 'lat': 9.9245618, 'lng': 78.1223503},
-        {'id': 13, 'name': 'Towards Setupathi School', 'lat': 9.9247943, 'lng': 78.1176725},
-        {'id': 14, 'name': 'Settupathi School', 'lat': 9.9240122, 'lng': 78.1134239},
-        {'id': 15, 'name': 'Railway Junction', 'lat': 9.9178614, 'lng': 78.1121365},
-        {'id': 16, 'name': 'Reaching Preiyar', 'lat': 9.9161166, 'lng': 78.1127373},
-        {'id': 17, 'name': 'Periyar Bus Stand', 'lat': 9.915244, 'lng': 78.1115843},
-        {'id': 18, 'name': 'Crime Branch', 'lat': 9.9117515, 'lng': 78.1118909},
-        {'id': 19, 'name': 'Tamilnadu Polytechnic', 'lat': 9.9094264, 'lng': 78.1098096},
-        {'id': 20, 'name': 'Vasantha Nagar', 'lat': 9.9060655, 'lng': 78.0991451},
-        {'id': 21, 'name': 'Pallanganatham', 'lat': 9.9015843, 'lng': 78.0948536},
-        {'id': 22, 'name': 'Paikara', 'lat': 9.8953204, 'lng': 78.0858491},
-        {'id': 23, 'name': 'Pasumalai', 'lat': 9.8937178, 'lng': 78.0789968},
-        {'id': 24, 'name': 'Mannar College', 'lat': 9.8929532, 'lng': 78.0770855},
-        {'id': 25, 'name': 'Towards Thiruparakundram', 'lat': 9.886379, 'lng': 78.0741243},
-        {'id': 26, 'name': 'Harveypatti', 'lat': 9.8804812, 'lng': 78.0648546},
-        {'id': 27, 'name': 'Amman Tiffen', 'lat': 9.8809416, 'lng': 78.0562862},
-        {'id': 28, 'name': 'Thirunagar 3Rd Stop', 'lat': 9.8821005, 'lng': 78.053083}
-    ],
-    '23': [
-        {'id': 1, 'name': 'Thirupallai', 'lat': 9.9720416, 'lng': 78.1394837},
-        {'id': 2, 'name': 'Towards Iyer Bunglow', 'lat': 9.9718078, 'lng': 78.1392859},
-        {'id': 3, 'name': 'Iyer Bungalow', 'lat': 9.9673249, 'lng': 78.1366866},
-        {'id': 4, 'name': 'Reserve Line', 'lat': 9.9556417, 'lng': 78.1326311},
-        {'id': 5, 'name': 'Race Course', 'lat': 9.9437216, 'lng': 78.1355206},
-        {'id': 6, 'name': 'Pandian Hotel', 'lat': 9.9387971, 'lng': 78.1366364},
-        {'id': 7, 'name': 'Thallakulam', 'lat': 9.9343902, 'lng': 78.1339649},
-        {'id': 8, 'name': 'Tamukam', 'lat': 9.9310613, 'lng': 78.1319157},
-        {'id': 9, 'name': 'Goripalaiyam', 'lat': 9.9291406, 'lng': 78.1292637},
-        {'id': 10, 'name': 'A.V. Bridge Endpoint', 'lat': 9.9245982, 'lng': 78.124677},
-        {'id': 11, 'name': 'Towards Simakkal', 'lat': 9.9239324, 'lng': 78.1240654},
-        {'id': 12, 'name': 'Simakkal', 'lat': 9.9245618, 'lng': 78.1223503},
-        {'id': 13, 'name': 'Towards Setupathi School', 'lat': 9.9247943, 'lng': 78.1176725},
-        {'id': 14, 'name': 'Settupathi School', 'lat': 9.9240122, 'lng': 78.1134239},
-        {'id': 15, 'name': 'Railway Junction', 'lat': 9.9178614, 'lng': 78.1121365},
-        {'id': 16, 'name': 'Reaching Preiyar', 'lat': 9.9161166, 'lng': 78.1127373},
-        {'id': 17, 'name': 'Periyar Bus Stand', 'lat': 9.915244, 'lng': 78.1115843}
-    ],
-    "madurai-saptur": [
-        {'id': 1, 'name': 'Sappur Bus Stand', 'lat': 9.7723817, 'lng': 77.7374431},
-        {'id': 2, 'name': 'Sappur Forest Office', 'lat': 9.7755529, 'lng': 77.737918},
-        {'id': 3, 'name': 'Siva Crusher', 'lat': 9.7737385, 'lng': 77.7858195},
-        {'id': 4, 'name': 'Sappur Road', 'lat': 9.7432873, 'lng': 77.7904612},
-        {'id': 5, 'name': 'Ponnamal CBSC School', 'lat': 9.7665694, 'lng': 77.7882914},
-        {'id': 6, 'name': 'Peraiyur Court', 'lat': 9.7567696, 'lng': 77.7893734},
-        {'id': 7, 'name': 'Peraiyur Mukkusaalai', 'lat': 9.7430768, 'lng': 77.7910007},
-        {'id': 8, 'name': 'Peraiyur Bustand', 'lat': 9.7389502, 'lng': 77.7906355},
-        {'id': 9, 'name': 'Kilangulam', 'lat': 9.7304061, 'lng': 77.8272974},
-        {'id': 10, 'name': 'Linga Bar', 'lat': 9.7226814, 'lng': 77.8362759},
-        {'id': 11, 'name': 'Thevankurichi', 'lat': 9.7235742, 'lng': 77.8410545},
-        {'id': 12, 'name': 'T.Kallupatti Bus Stand', 'lat': 9.7206795, 'lng': 77.8508348},
-        {'id': 13, 'name': 'Kunnathur Bus Stop', 'lat': 9.7505023, 'lng': 77.8888632},
-        {'id': 14, 'name': 'Glanis', 'lat': 9.7740229, 'lng': 77.9093458},
-        {'id': 15, 'name': 'Aalambatti', 'lat': 9.8018663, 'lng': 77.9596753},
-        {'id': 16, 'name': 'Temple City', 'lat': 9.7885873, 'lng': 77.9421658},
-        {'id': 17, 'name': 'Kumaran Sweets', 'lat': 9.8133634, 'lng': 77.9771267},
-        {'id': 18, 'name': 'Tirumangalam Firestation', 'lat': 9.8122745, 'lng': 77.9844116},
-        {'id': 19, 'name': 'Aanandha Theatre', 'lat': 9.8235956, 'lng': 77.986501},
-        {'id': 20, 'name': 'Thirumangalam Bus Stand', 'lat': 9.8270958, 'lng': 77.9903955},
-        {'id': 21, 'name': 'Kappalur Toll Gate', 'lat': 9.8449551, 'lng': 78.0113708},
-        {'id': 22, 'name': 'Mill Gate', 'lat': 9.8352877, 'lng': 78.0011298},
-        {'id': 23, 'name': 'Indian Oil Old Thirumangalam Road', 'lat': 9.8346501, 'lng': 78.0445027},
-        {'id': 24, 'name': 'Mandela Nagar', 'lat': 9.8414792, 'lng': 78.1051064},
-        {'id': 25, 'name': 'Towards Mattuthavani', 'lat': 9.8358971, 'lng': 78.037723},
-        {'id': 26, 'name': 'Towards Mattuthavani', 'lat': 9.8484554, 'lng': 78.0153539},
-        {'id': 27, 'name': 'Towards Mattuthavani', 'lat': 9.8344319, 'lng': 78.0663435},
-        {'id': 28, 'name': 'Towards Mathuthavani', 'lat': 9.831472, 'lng': 78.0781023},
-        {'id': 29, 'name': 'Towards Mattithavani', 'lat': 9.8269897, 'lng': 78.080763},
-        {'id': 30, 'name': 'Towards Mattuthavani', 'lat': 9.8246217, 'lng': 78.0928845},
-        {'id': 31, 'name': 'Towards Mathuthavani', 'lat': 9.829696, 'lng': 78.0955452},
-        {'id': 32, 'name': 'Valayangulam', 'lat': 9.8328868, 'lng': 78.1032648},
-        {'id': 33, 'name': 'Towards Airport', 'lat': 9.8373478, 'lng': 78.1041231},
-        {'id': 34, 'name': 'Chinthamani Toll Plaza', 'lat': 9.8821239, 'lng': 78.1390886},
-        {'id': 35, 'name': 'Vellamal Hospital', 'lat': 9.8851023, 'lng': 78.1498333},
-        {'id': 36, 'name': 'Meenatchi Hotel', 'lat': 9.8971065, 'lng': 78.1625559},
-        {'id': 37, 'name': 'Vandiyur Toll Plaza', 'lat': 9.9222622, 'lng': 78.1697644},
-        {'id': 38, 'name': 'Towards Vasantham Traders', 'lat': 9.9130317, 'lng': 78.1703246},
-        {'id': 39, 'name': 'Service Road', 'lat': 9.9318083, 'lng': 78.1688223},
-        {'id': 40, 'name': 'Pandi Kovil', 'lat': 9.9343941, 'lng': 78.1680154},
-        {'id': 41, 'name': 'HCL Villaku', 'lat': 9.9389473, 'lng': 78.1666767},
-        {'id': 42, 'name': 'Melur Cut Road', 'lat': 9.9491978, 'lng': 78.1634435},
-        {'id': 43, 'name': 'Saravana Stores', 'lat': 9.9477118, 'lng': 78.1604699},
-        {'id': 44, 'name': 'Omni Bus Stand', 'lat': 9.9460579, 'lng': 78.1575302},
-        {'id': 45, 'name': 'Mattuthavani Bus Stand / M.G.R. Nillaiyam', 'lat': 9.9455227, 'lng': 78.1565945}
-    ]
-}
-# This will store routes with OSRM-generated waypoints
+DRIVER_SESSION_MAX_AGE = 12 * 60 * 60 # Token lifetime (one shift)
+DRIVER_RESUME_GRACE_SECONDS = 120 # How long a disconnected driver's bus is kept alive
+# driver_id -> session token generation; leave_route/driver_logout bump it, revoking every older token
+# (in memory only: a restart makes unexpired tokens from before it valid again)
+driver_token_generations = {}
+BUS_STALE_SECONDS = int(os.environ.get('BUS_STALE_SECONDS', 300)) # The reaper removes buses with no fix for this long
+REAPER_INTERVAL = int(os.environ.get('REAPER_INTERVAL', 60)) # Seconds between reaper sweeps (0 disables)
+# Per-bus and file locks; see lock_manager.py for the lock order
+lock_manager = LockManager()
+location_lock = lock_manager.named('locations_file')
+history_lock = lock_manager.named('history_file')
+reservations_file_lock = lock_manager.named('reservations_file')
+# Run model / CSV work in eventlet's native thread pool instead of on the hub (OFFLOAD_BLOCKING=0 to disable)
+OFFLOAD_BLOCKING = offload.configure(os.environ.get('OFFLOAD_BLOCKING', '1') == '1' and socketio.async_mode == 'eventlet')
+hub_latency_probe = HubLatencyProbe(interval=0.05)
+# On-demand stack sampling (POST /api/profile); no thread or hook exists until a profile is requested
+stack_sampler = StackSampler()
+# Handler / request / route-command latency histograms and state gauges, served on GET /metrics
+metrics = MetricsRegistry()
+metrics.instrument_flask(app)
+# Routes with waypoints, loaded from route_artifacts.json (python route_compiler.py)
 STOP_COORDS = {}
+# route_id -> grid index of STOP_COORDS points (see route_compiler.build_grid_index)
+route_grid_index = {}
+ROUTE_GRID_MIN_POINTS = 200 # Shorter routes: one vectorized scan beats the grid lookup
 # Store active buses with enhanced data
 active_buses = defaultdict(dict)
 bus_speed_history = defaultdict(lambda: [])
 bus_start_location = defaultdict(dict)
-bus_arrival_times = defaultdict(dict)
+bus_arrival_times = defaultdict(dict) # bus_id -> stop_id -> first ETA predicted on the approach
 waiting_passengers = defaultdict(lambda: defaultdict(int))
 authenticated_drivers = {}
+# Buses whose driver dropped off: bus_id -> {'route_id', 'driver_id', 'sid', 'parked_at'}
+parked_buses = {}
 bus_logged_locations = defaultdict(set)
 # Bidirectional tracking data structures
 bus_last_passed_stop = defaultdict(lambda: None)
@@ -206,42 +140,58 @@ bus_position_history = defaultdict(list)
 # Current stop and capacity tracking
 bus_current_stop = defaultdict(lambda: None)
 bus_capacity_status = defaultdict(lambda: False)
-# Seat reservation tracking: route -> bus_id -> list of reservations (each {'passenger_name': str, 'session_id': str})
-bus_reservations = defaultdict(lambda: defaultdict(list))
 TOTAL_SEATS_PER_BUS = 50
-# Waiting list for reservations: route_id -> deque of waiting passengers
-waiting_reservations = defaultdict(deque)
+# Seat reservation tracking: indexed by route, bus, passenger name and session
+reservation_store = ReservationStore(TOTAL_SEATS_PER_BUS)
+# Waiting list for reservations: route_id -> session_id -> waiting passenger (FIFO order)
+waiting_reservations = defaultdict(OrderedDict)
+# Reverse index: sid -> buses, reservations, waitlist entries and waiting stops it owns
+session_index = SessionIndex()
+# One single-writer task per route; handlers enqueue commands instead of mutating route state
+route_actors = RouteActorRegistry(socketio, known_routes=lambda: STOP_COORDS, on_command=metrics.observe_route_command)
 # Distance calculation cache
 distance_cache = {}
+# route_id -> (points list, lat radians, lng radians, cumulative km) for vectorized lookups
+route_point_arrays = {}
 # ✅ Stop distance cache (OSRM pre-calculated, directional)
 stop_distance_cache = {}
-# Load ML model(azure)
-'''try:
-    import sys
-    sys.modules['train'] = train = sys.modules[__name__]
-    
-    with open('model.pkl', 'rb') as f:
-        model = pickle.load(f)
-    print("✓ ML Model loaded successfully")
-except FileNotFoundError:
-    model = None
-    print("⚠ Warning: model.pkl not found. Run train.py first.")
-except Exception as e:
-    model = None
-    print(f"⚠ Warning: Could not load model: {e}")'''
-# Load ML model
-model = None
+# (route_id, direction) -> (stop_distance_cache it was built from, stop ids, chainage km) in travel order
+stop_chainage_arrays = {}
+# Load ML model (versioned; newer models in models/ are validated and hot-swapped at runtime)
+def load_model_validation_sample(*models):
+    from train import load_validation_sample
+    return load_validation_sample(*models)
+model_registry = ModelRegistry(MODELS_DIR, fallback_path='model.npz',
+                               validation_sample=load_model_validation_sample, run_blocking=run_blocking)
+MODEL_RELOAD_INTERVAL = int(os.environ.get('MODEL_RELOAD_INTERVAL', 30))
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
 if MODEL_CLASS_AVAILABLE:
     try:
-        with open('model.pkl', 'rb') as f:
-            model = pickle.load(f)
-        print("✓ ML Model loaded successfully")
-    except FileNotFoundError:
-        print("⚠ Warning: model.pkl not found. Using fallback ETA calculation.")
+        if model_registry.load_initial():
+            print(f"✓ ML Model loaded successfully (version {model_registry.active.version})")
+        else:
+            print("⚠ Warning: model.npz not found. Using fallback ETA calculation.")
     except Exception as e:
         print(f"⚠ Warning: Could not load model: {e}. Using fallback ETA calculation.")
 else:
     print("ℹ️ Model class not available. Using fallback ETA calculation.")
+mark_startup_phase('model')
+# Per-route correction of model ETAs, learned online from arrivals (see online_eta.py)
+eta_corrector = OnlineETACorrector(ONLINE_ETA_FILE)
+try:
+    if eta_corrector.load():
+        print(f"✓ Online ETA corrections restored for {len(eta_corrector.stats()['routes'])} routes")
+except Exception as e:
+    print(f"⚠ Warning: Could not load {ONLINE_ETA_FILE}: {e}")
+# Historical per-segment travel times (python segment_times.py); None = model-only ETAs
+try:
+    segment_time_table = SegmentTimeTable.load(SEGMENT_TIMES_FILE)
+    if segment_time_table:
+        print(f"✓ Segment travel-time tables loaded for {len(segment_time_table.routes())} route directions")
+except Exception as e:
+    segment_time_table = None
+    print(f"⚠ Warning: Could not load {SEGMENT_TIMES_FILE}: {e}")
+mark_startup_phase('eta_tables')
 def haversine_distance(lat1, lon1, lat2, lon2):
     """
     Calculate haversine distance between two points
@@ -254,563 +204,33 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
     c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
     return R * c
-def precalculate_stop_distances_manual():
-    """
-    Pre-calculate using AI-calculated segment distances
-    Calculated by GitHub Copilot AI on 2025-10-19
-    ~98-99% accurate
-    """
-    global stop_distance_cache
-    
-    print("\n" + "="*80)
-    print("📏 Pre-calculating Stop Distances (AI-Calculated Segments)")
-    print("="*80)
-    print(" Method: AI-powered road network analysis")
-    print(" Calculated by: GitHub Copilot AI")
-    print(" Date: 2025-10-19 19:49:38 UTC")
-    print(" For: Terrificdatabytes")
-    print(" Accuracy: ~98-99%")
-    print("="*80)
-    
-    total_routes = 0
-    
-    for route_id in STOP_COORDS.keys():
-        bus_stops = get_bus_stops_only(route_id)
-        if not bus_stops or len(bus_stops) == 0:
-            continue
-        
-        # Get AI-calculated segment distances
-        segment_distances = ROUTE_SEGMENT_DISTANCES.get(route_id)
-        
-        if not segment_distances or len(segment_distances) == 0 or segment_distances[0] == 0:
-            print(f"\n⚠️ Route {route_id}: No AI-calculated segments found, skipping...")
-            continue
-        
-        # Verify segment count matches
-        expected_segments = len(bus_stops) - 1
-        if len(segment_distances) != expected_segments:
-            print(f"\n⚠️ Route {route_id}: Expected {expected_segments} segments, got {len(segment_distances)}, skipping...")
-            continue
-        
-        total_routes += 1
-        print(f"\n🚍 Route: {route_id}")
-        print(f" Total stops: {len(bus_stops)}")
-        print(f" AI-calculated segments: {len(segment_distances)}")
-        print(f" Method: Road network analysis with 1.07x factor\n")
-        
-        # Calculate cumulative distances
-        cumulative_distance = 0.0
-        
-        for i, stop in enumerate(bus_stops):
-            if i == 0:
-                distance = 0.0
-                print(f" Stop {stop['id']:2d} ({stop['name'][:35]:35}): {distance:7.3f} km (START)")
-            else:
-                segment_dist = segment_distances[i - 1]
-                cumulative_distance += segment_dist
-                distance = cumulative_distance
-                
-                # Show all stops
-                print(f" Stop {stop['id']:2d} ({stop['name'][:35]:35}): {distance:7.3f} km (+{segment_dist:.3f})")
-            
-            # Cache forward direction
-            cache_key_forward = f"{route_id}_{stop['id']}_forward"
-            stop_distance_cache[cache_key_forward] = distance
-        
-        total_route_distance = cumulative_distance
-        
-        print(f"\n ✅ Total route distance: {total_route_distance:.3f} km")
-        print(f" ✅ All {len(segment_distances)} segments calculated by AI")
-        
-        # Store total
-        cache_key_total = f"{route_id}_total_distance"
-        stop_distance_cache[cache_key_total] = total_route_distance
-        
-        # Calculate backward direction
-        print(f"\n 🔄 Backward direction:")
-        for i, stop in enumerate(bus_stops):
-            forward_distance = stop_distance_cache.get(f"{route_id}_{stop['id']}_forward", 0)
-            backward_distance = total_route_distance - forward_distance
-            cache_key_backward = f"{route_id}_{stop['id']}_backward"
-            stop_distance_cache[cache_key_backward] = backward_distance
-            
-            if i % 7 == 0 or i == len(bus_stops) - 1:
-                print(f" Stop {stop['id']:2d} ({stop['name'][:35]:35}): {backward_distance:7.3f} km from end")
-    
-    print(f"\n{'='*80}")
-    print(f"✅ Pre-calculated {len(stop_distance_cache)} stop distances")
-    print(f" Routes processed: {total_routes}")
-    print(f" Method: AI-powered road network analysis")
-    print(f" Accuracy: ~98-99% (based on road network + 1.07x factor)")
-    print(f" Cost: $0")
-    print(f" Calculated by: GitHub Copilot AI for Terrificdatabytes")
-    print(f" Date: 2025-10-19 19:49:38 UTC")
-    print(f"={'='*80}\n")
-    
-    save_stop_distances_to_file()
-def decode_polyline(polyline_str):
-    """
-    Decode OSRM polyline to list of coordinates
-    Returns list of (lat, lng) tuples
-    """
-    coordinates = []
-    index = 0
-    lat = 0
-    lng = 0
-    
-    while index < len(polyline_str):
-        shift = 0
-        result = 0
-        while True:
-            b = ord(polyline_str[index]) - 63
-            index += 1
-            result |= (b & 0x1f) << shift
-            shift += 5
-            if b < 0x20:
-                break
-        dlat = ~(result >> 1) if (result & 1) else (result >> 1)
-        lat += dlat
-        
-        shift = 0
-        result = 0
-        while True:
-            b = ord(polyline_str[index]) - 63
-            index += 1
-            result |= (b & 0x1f) << shift
-            shift += 5
-            if b < 0x20:
-                break
-        dlng = ~(result >> 1) if (result & 1) else (result >> 1)
-        lng += dlng
-        
-        coordinates.append((lat / 1e5, lng / 1e5))
-    
-    return coordinates
-def get_osrm_route_geometry(lat1, lon1, lat2, lon2, retry_count=0):
-    """
-    Get actual road geometry from OSRM with better error handling
-    Returns list of (lat, lng) waypoints along the route
-    """
-    try:
-        url = f"{OSRM_SERVER}/route/v1/driving/{lon1},{lat1};{lon2},{lat2}"
-        params = {
-            'overview': 'full',
-            'geometries': 'polyline',
-            'steps': 'true',
-            'continue_straight': 'false',
-            'annotations': 'true'
-        }
-        
-        response = requests.get(url, params=params, timeout=OSRM_TIMEOUT)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            if data.get('code') == 'Ok' and 'routes' in data and len(data['routes']) > 0:
-                route = data['routes'][0]
-                geometry = route.get('geometry', '')
-                distance_m = route.get('distance', 0)
-                duration_s = route.get('duration', 0)
-                
-                coordinates = decode_polyline(geometry)
-                
-                haversine_dist = haversine_distance(lat1, lon1, lat2, lon2)
-                
-                if distance_m / 1000 < haversine_dist * 0.5 and haversine_dist > 0.1:
-                    return None, haversine_dist
-                
-                return coordinates, distance_m / 1000.0
-            else:
-                return None, None
-        else:
-            return None, None
-            
-    except Exception as e:
-        return None, None
-def sample_waypoints_from_geometry(coordinates, target_waypoints_per_km, total_distance_km):
-    """
-    Sample waypoints from OSRM geometry at desired density
-    """
-    if not coordinates or total_distance_km == 0:
-        return []
-    
-    if total_distance_km < 0.05:
-        return coordinates
-    
-    target_count = max(1, int(total_distance_km * target_waypoints_per_km))
-    
-    if len(coordinates) <= target_count:
-        return coordinates
-    
-    sampled = []
-    step = len(coordinates) / target_count
-    
-    for i in range(target_count):
-        idx = int(i * step)
-        if idx < len(coordinates):
-            sampled.append(coordinates[idx])
-    
-    if len(sampled) > 0 and sampled[-1] != coordinates[-1]:
-        sampled.append(coordinates[-1])
-    
-    return sampled
-def generate_waypoints_from_osrm(route_stops, waypoints_per_km=10):
+def haversine_distance_many(lat_rad, lng_rad, lat, lng):
     """
-    Generate waypoints using OSRM geometry (ONE-TIME OPERATION)
-    Validates each segment to prevent double-counting
+    Distance (km) from one point to every point of pre-converted radian arrays, in one NumPy call
     """
-    enhanced_route = []
-    total_distance = 0
-    total_waypoints_added = 0
-    osrm_segments = 0
-    haversine_segments = 0
-    
-    # Calculate expected haversine distance for validation
-    expected_haversine = 0
-    for i in range(len(route_stops) - 1):
-        dist = haversine_distance(
-            route_stops[i]['lat'], route_stops[i]['lng'],
-            route_stops[i+1]['lat'], route_stops[i+1]['lng']
-        )
-        expected_haversine += dist
-    
-    print(f" Expected haversine distance: {expected_haversine:.2f} km")
-    
-    for i in range(len(route_stops)):
-        stop = route_stops[i].copy()
-        stop['is_stop'] = True
-        enhanced_route.append(stop)
-        
-        if i < len(route_stops) - 1:
-            current_stop = route_stops[i]
-            next_stop = route_stops[i + 1]
-            
-            haversine_dist = haversine_distance(
-                current_stop['lat'], current_stop['lng'],
-                next_stop['lat'], next_stop['lng']
-            )
-            
-            print(f" Segment {i+1}: {current_stop['name'][:20]:20} → {next_stop['name'][:20]:20} (haversine: {haversine_dist:.3f} km) ... ", end='', flush=True)
-            
-            if haversine_dist < 0.05:
-                total_distance += haversine_dist
-                haversine_segments += 1
-                print(f"skip (too short)")
-                continue
-            
-            geometry, distance = get_osrm_route_geometry(
-                current_stop['lat'], current_stop['lng'],
-                next_stop['lat'], next_stop['lng']
-            )
-            
-            # ✅ VALIDATION: OSRM distance should be within reasonable range of haversine
-            if geometry and distance and distance > 0:
-                # If OSRM distance is more than 2x haversine, reject it
-                if distance > haversine_dist * 2.5:
-                    print(f"REJECTED (OSRM: {distance:.3f} km is {distance/haversine_dist:.1f}x haversine), using haversine")
-                    total_distance += haversine_dist
-                    haversine_segments += 1
-                else:
-                    total_distance += distance
-                    osrm_segments += 1
-                    print(f"OK (OSRM: {distance:.3f} km)")
-                    
-                    if distance > 0.2:
-                        sampled_waypoints = sample_waypoints_from_geometry(
-                            geometry, waypoints_per_km, distance
-                        )
-                        
-                        if len(sampled_waypoints) > 2:
-                            for idx, (lat, lng) in enumerate(sampled_waypoints[1:-1]):
-                                waypoint = {
-                                    'id': None,
-                                    'name': f'WP_{i+1}_{idx+1}',
-                                    'lat': lat,
-                                    'lng': lng,
-                                    'is_stop': False
-                                }
-                                enhanced_route.append(waypoint)
-                                total_waypoints_added += 1
-            else:
-                print(f"OSRM failed, using haversine")
-                total_distance += haversine_dist
-                haversine_segments += 1
-            
-            time.sleep(0.8)
-    
-    print(f"\n Validation:")
-    print(f" Expected (haversine): {expected_haversine:.2f} km")
-    print(f" Calculated (mixed): {total_distance:.2f} km")
-    print(f" Ratio: {total_distance/expected_haversine:.2f}x")
-    
-    # ✅ If total distance is more than 1.5x expected, something is wrong
-    if total_distance > expected_haversine * 1.8:
-        print(f" ⚠️ WARNING: Distance seems doubled! Using haversine fallback.")
-        # Rebuild with haversine only
-        enhanced_route = []
-        total_distance = 0
-        for i in range(len(route_stops)):
-            stop = route_stops[i].copy()
-            stop['is_stop'] = True
-            enhanced_route.append(stop)
-            
-            if i < len(route_stops) - 1:
-                dist = haversine_distance(
-                    route_stops[i]['lat'], route_stops[i]['lng'],
-                    route_stops[i+1]['lat'], route_stops[i+1]['lng']
-                )
-                total_distance += dist
-    
-    return enhanced_route, total_distance
-def save_waypoints_to_file(waypoints_data):
-    """Save generated waypoints to JSON file"""
-    try:
-        with open(WAYPOINTS_FILE, 'w') as f:
-            json.dump(waypoints_data, f, indent=2)
-        print(f"\n✓ Waypoints saved to {WAYPOINTS_FILE}")
-    except Exception as e:
-        print(f"\n✗ Error saving waypoints: {e}")
-def load_waypoints_from_file():
-    """Load pre-generated waypoints from JSON file"""
-    try:
-        if os.path.exists(WAYPOINTS_FILE):
-            with open(WAYPOINTS_FILE, 'r') as f:
-                data = json.load(f)
-            print(f"✓ Loaded waypoints from {WAYPOINTS_FILE}")
-            return data
-        else:
-            return None
-    except Exception as e:
-        print(f"✗ Error loading waypoints: {e}")
-        return None
-def initialize_routes_with_waypoints():
+    lat, lng = np.radians(lat), np.radians(lng)
+    a = np.sin((lat_rad - lat) / 2)**2 + np.cos(lat) * np.cos(lat_rad) * np.sin((lng_rad - lng) / 2)**2
+    return 6371 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+def get_route_point_arrays(route_id):
     """
-    Initialize routes with OSRM-generated waypoints
-    Uses cached waypoints if available, generates from OSRM if not
+    Radian coordinate arrays and cumulative distance (km) along a route's waypoints, built once per route
     """
-    global STOP_COORDS
-    
-    print("\n" + "="*80)
-    print("🔄 Initializing Routes with OSRM-Based Waypoints")
-    print("="*80)
-    
-    if not REGENERATE_WAYPOINTS:
-        cached_waypoints = load_waypoints_from_file()
-        if cached_waypoints:
-            STOP_COORDS = cached_waypoints
-            print("\n📊 Route Statistics (from cache):")
-            for route_id, points in STOP_COORDS.items():
-                stops = [p for p in points if p.get('is_stop', True)]
-                waypoints = [p for p in points if not p.get('is_stop', True)]
-                print(f" Route {route_id}: {len(stops)} stops, {len(waypoints)} waypoints")
-            print("="*80)
-            return
-    
-    print(f"\n🌐 Generating waypoints from OSRM ({OSRM_SERVER})")
-    print(f" Target density: {WAYPOINTS_PER_KM} waypoints/km")
-    print(f" This is a ONE-TIME operation...")
-    print()
-    
-    waypoints_data = {}
-    
-    for route_id, stops in ORIGINAL_STOPS.items():
-        print(f"\n📍 Processing Route: {route_id}")
-        print(f" Stops: {len(stops)}")
-        
-        try:
-            enhanced_route, total_distance = generate_waypoints_from_osrm(
-                stops, WAYPOINTS_PER_KM
-            )
-            
-            waypoints_data[route_id] = enhanced_route
-            
-            total_stops = len([p for p in enhanced_route if p.get('is_stop', True)])
-            total_waypoints = len([p for p in enhanced_route if not p.get('is_stop', True)])
-            
-            print(f"\n ✓ Route {route_id} complete:")
-            print(f" - Actual Stops: {total_stops}")
-            print(f" - OSRM Waypoints: {total_waypoints}")
-            print(f" - Total Points: {len(enhanced_route)}")
-            print(f" - Total Distance: {total_distance:.2f} km")
-            
-        except Exception as e:
-            print(f"\n ✗ Error processing route {route_id}: {e}")
-            waypoints_data[route_id] = [s.copy() for s in stops]
-            for stop in waypoints_data[route_id]:
-                stop['is_stop'] = True
-    
-    save_waypoints_to_file(waypoints_data)
-    
-    STOP_COORDS = waypoints_data
-    
-    print("\n" + "="*80)
-    print("✓ Waypoint generation complete!")
-    print("✓ Future runs will use cached waypoints (fast)")
-    print(f"✓ To regenerate, set REGENERATE_WAYPOINTS = True")
-    print("="*80)
-def get_osrm_distance_between_points(lat1, lon1, lat2, lon2):
-    """
-    Get actual road distance using OSRM
-    Returns distance in kilometers
-    """
-    try:
-        url = f"{OSRM_SERVER}/route/v1/driving/{lon1},{lat1};{lon2},{lat2}"
-        params = {
-            'overview': 'false',
-            'steps': 'false'
-        }
-        
-        response = requests.get(url, params=params, timeout=OSRM_TIMEOUT)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            if data.get('code') == 'Ok' and 'routes' in data and len(data['routes']) > 0:
-                route = data['routes'][0]
-                distance_m = route.get('distance', 0)
-                distance_km = distance_m / 1000.0
-                return distance_km
-            else:
-                return haversine_distance(lat1, lon1, lat2, lon2)
-        else:
-            return haversine_distance(lat1, lon1, lat2, lon2)
-            
-    except Exception as e:
-        return haversine_distance(lat1, lon1, lat2, lon2)
-def precalculate_stop_distances_osrm():
-    """
-    Pre-calculate stop distances with route-specific factors
-    """
-    global stop_distance_cache
-    
-    # ✅ Route-specific configurations
-    ROUTE_CONFIG = {
-        '48AC': {
-            'total_distance': 17.6, # Verified from Google Maps
-            'type': 'city',
-            'fallback_factor': 1.07
-        },
-        '23': {
-            'total_distance': 9.12, # Your verified distance
-            'type': 'city',
-            'fallback_factor': 1.07
-        },
-        'madurai-saptur': {
-            'total_distance': 52.31, # Your verified distance
-            'type': 'highway',
-            'fallback_factor': 1.25
-        }
-    }
-    
-    print("\n" + "="*80)
-    print("📏 Pre-calculating Stop Distances with Route-Specific Settings")
-    print("="*80)
-    
-    for route_id in STOP_COORDS.keys():
-        bus_stops = get_bus_stops_only(route_id)
-        if not bus_stops or len(bus_stops) == 0:
-            continue
-        
-        # Get route configuration
-        config = ROUTE_CONFIG.get(route_id, {
-            'total_distance': None,
-            'type': 'unknown',
-            'fallback_factor': 1.15 # Default for unknown routes
-        })
-        
-        # Calculate haversine total
-        haversine_total = 0
-        haversine_segments = []
-        for i in range(len(bus_stops) - 1):
-            segment = haversine_distance(
-                bus_stops[i]['lat'], bus_stops[i]['lng'],
-                bus_stops[i+1]['lat'], bus_stops[i+1]['lng']
-            )
-            haversine_segments.append(segment)
-            haversine_total += segment
-        
-        # Use known distance or calculate
-        if config['total_distance']:
-            total_route_distance = config['total_distance']
-            method = f"Verified ({config['type']} route)"
-        else:
-            total_route_distance = haversine_total * config['fallback_factor']
-            method = f"Haversine × {config['fallback_factor']} ({config['type']} route)"
-        
-        print(f"\n🚍 Route: {route_id}")
-        print(f" Type: {config['type']}")
-        print(f" Haversine: {haversine_total:.2f} km")
-        print(f" Total distance: {total_route_distance:.2f} km")
-        print(f" Method: {method}")
-        print(f" Effective factor: {total_route_distance/haversine_total:.2f}x\n")
-        
-        # Distribute proportionally
-        cumulative_distance = 0.0
-        
-        for i, stop in enumerate(bus_stops):
-            if i == 0:
-                distance = 0.0
-            else:
-                haversine_segment = haversine_segments[i - 1]
-                road_segment = (haversine_segment / haversine_total) * total_route_distance
-                cumulative_distance += road_segment
-                distance = cumulative_distance
-            
-            # Cache forward
-            cache_key_forward = f"{route_id}_{stop['id']}_forward"
-            stop_distance_cache[cache_key_forward] = distance
-            
-            if i % 7 == 0 or i == len(bus_stops) - 1:
-                print(f" Stop {stop['id']:2d}: {distance:7.3f} km from start")
-        
-        # Store total
-        cache_key_total = f"{route_id}_total_distance"
-        stop_distance_cache[cache_key_total] = total_route_distance
-        
-        # Backward
-        for i, stop in enumerate(bus_stops):
-            forward_distance = stop_distance_cache.get(f"{route_id}_{stop['id']}_forward", 0)
-            backward_distance = total_route_distance - forward_distance
-            cache_key_backward = f"{route_id}_{stop['id']}_backward"
-            stop_distance_cache[cache_key_backward] = backward_distance
-    
-    print(f"\n{'='*80}")
-    print(f"✅ Pre-calculated {len(stop_distance_cache)} stop distances")
-    print(f" Method: Route-specific verified distances + proportional distribution")
-    print(f"={'='*80}\n")
-    
-    save_stop_distances_to_file()
-def save_stop_distances_to_file():
-    """
-    Save pre-calculated stop distances to JSON file
-    """
-    try:
-        with open(STOP_DISTANCES_FILE, 'w') as f:
-            json.dump(stop_distance_cache, f, indent=2)
-        
-        print(f"✓ Stop distances saved to {STOP_DISTANCES_FILE}")
-    except Exception as e:
-        print(f"⚠️ Could not save stop distances: {e}")
-def load_stop_distances_from_file():
-    """
-    Load pre-calculated stop distances from file
-    """
-    global stop_distance_cache
-    
-    if os.path.exists(STOP_DISTANCES_FILE):
-        try:
-            with open(STOP_DISTANCES_FILE, 'r') as f:
-                stop_distance_cache = json.load(f)
-            
-            print("\n" + "="*80)
-            print(f"✓ Loaded {len(stop_distance_cache)} pre-calculated stop distances from {STOP_DISTANCES_FILE}")
-            print("="*80 + "\n")
-            return True
-        except Exception as e:
-            print(f"⚠️ Could not load stop distances: {e}")
-            return False
-    
-    return False
+    points = STOP_COORDS[route_id]
+    cached = route_point_arrays.get(route_id)
+    if cached is not None and cached[0] is points:
+        return cached
+    
+    lat_rad = np.radians([p['lat'] for p in points])
+    lng_rad = np.radians([p['lng'] for p in points])
+    dlat = np.diff(lat_rad)
+    dlng = np.diff(lng_rad)
+    a = np.sin(dlat/2)**2 + np.cos(lat_rad[:-1]) * np.cos(lat_rad[1:]) * np.sin(dlng/2)**2
+    segments = 6371 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    cumulative = np.concatenate(([0.0], np.cumsum(segments)))
+    
+    cached = (points, lat_rad, lng_rad, cumulative)
+    route_point_arrays[route_id] = cached
+    return cached
 def init_drivers_file():
     """Initialize drivers file with default admin driver (registration disabled)"""
     if not os.path.isfile(DRIVERS_FILE):
@@ -832,24 +252,240 @@ def init_drivers_file():
         print("⚠️ Driver registration disabled - add drivers manually to bus_drivers.csv")
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
-def verify_driver(driver_id, password):
+def find_driver(driver_id):
+    """The driver's row in DRIVERS_FILE, or None if it is not (or no longer) there"""
     try:
         with open(DRIVERS_FILE, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
+            for row in csv.DictReader(f):
                 if row['driver_id'] == driver_id:
-                    password_hash = hash_password(password)
-                    if row['password_hash'] == password_hash:
-                        return {
-                            'driver_id': row['driver_id'],
-                            'name': row['name'],
-                            'phone': row['phone'],
-                            'license_number': row['license_number']
-                        }
+                    return row
         return None
     except Exception as e:
-        print(f"Error verifying driver: {e}")
+        log.exception('driver_lookup_failed')
+        return None
+def verify_driver(driver_id, password):
+    row = find_driver(driver_id)
+    if row is None or row['password_hash'] != hash_password(password):
+        return None
+    return {
+        'driver_id': row['driver_id'],
+        'name': row['name'],
+        'phone': row['phone'],
+        'license_number': row['license_number']
+    }
+def issue_driver_session_token(driver, bus_id=None, route_id=None):
+    """Sign the driver's identity (and active bus) so a reconnect can resume without a password
+    None when SECRET_KEY is unset or the public default; clients then log in again with the password
+    """
+    if not DRIVER_SESSIONS_ENABLED:
+        return None
+    return driver_session_serializer.dumps({
+        'driver': {k: driver[k] for k in ('driver_id', 'name', 'phone', 'license_number')},
+        'bus_id': bus_id,
+        'route_id': route_id,
+        'generation': driver_token_generations.get(driver['driver_id'], 0)
+    })
+def load_driver_session_token(token):
+    """Return the token payload, or None if it is forged, older than DRIVER_SESSION_MAX_AGE or revoked"""
+    if not token or not DRIVER_SESSIONS_ENABLED:
+        return None
+    try:
+        session = driver_session_serializer.loads(token, max_age=DRIVER_SESSION_MAX_AGE)
+    except (SignatureExpired, BadSignature):
+        return None
+    driver_id = session['driver']['driver_id']
+    if session.get('generation', 0) != driver_token_generations.get(driver_id, 0):
+        log_event(auth_log, logging.INFO, 'resume_token_revoked', driver_id=driver_id)
         return None
+    return session
+def revoke_driver_session_tokens(driver_id):
+    """Invalidate every session token issued to a driver so far"""
+    driver_token_generations[driver_id] = driver_token_generations.get(driver_id, 0) + 1
+def park_driver_bus(route_id, bus_id, driver_id, sid):
+    """Keep a disconnected driver's bus and tracking state alive for the resume grace window"""
+    parked = {
+        'route_id': route_id,
+        'driver_id': driver_id,
+        'sid': sid,
+        'parked_at': time.time()
+    }
+    parked_buses[bus_id] = parked
+    socketio.start_background_task(schedule_parked_bus_expiry, bus_id, parked)
+def schedule_parked_bus_expiry(bus_id, parked):
+    """Wait out the grace window, then let the route actor decide whether the bus goes"""
+    socketio.sleep(DRIVER_RESUME_GRACE_SECONDS)
+    route_actors.send(parked['route_id'], expire_parked_bus, bus_id, parked)
+def expire_parked_bus(bus_id, parked):
+    """Remove a parked bus once the grace window passed without the driver resuming (route actor)"""
+    if parked_buses.get(bus_id) is not parked:
+        return # Driver resumed (or the bus was re-parked) in the meantime
+    del parked_buses[bus_id]
+    
+    route_id = parked['route_id']
+    bus_data = active_buses[route_id].get(bus_id)
+    if not bus_data or bus_data.get('sid') != parked['sid']:
+        return # Bus was taken over by a fresh session
+    
+    log_event(session_log, logging.INFO, 'resume_expired', route_id=route_id, bus_id=bus_id)
+    del active_buses[route_id][bus_id]
+    reset_bus_route_tracking(bus_id)
+    
+    socketio.emit('bus_removed', {
+        'route_id': route_id,
+        'bus_id': bus_id,
+        'message': 'Bus has stopped tracking'
+    }, room=route_id)
+    socketio.emit('bus_status', {
+        'route_id': route_id,
+        'bus_id': bus_id,
+        'status': 'inactive',
+        'message': 'Bus is no longer active. Waiting for next bus...'
+    }, room=route_id)
+def reap_route(route_id, now):
+    """
+    Remove buses with no fix for BUS_STALE_SECONDS, seats held on buses gone for longer than the
+    resume window, and emptied waiting counters (route actor)
+    A stale bus keeps its capacity status, so a driver who marked it full and comes back is still full
+    """
+    counts = Counter()
+    cutoff = now - timedelta(seconds=BUS_STALE_SECONDS)
+    for bus_id, bus_data in list(active_buses.get(route_id, {}).items()):
+        if bus_id in parked_buses or datetime.fromisoformat(bus_data['timestamp']) > cutoff:
+            continue # Parked buses expire on their own resume window
+        
+        log_event(session_log, logging.INFO, 'bus_stale', route_id=route_id, bus_id=bus_id, last_fix=bus_data['timestamp'])
+        del active_buses[route_id][bus_id]
+        session_index.remove_bus(bus_data['sid'], route_id, bus_id)
+        reset_bus_route_tracking(bus_id, keep_capacity=True)
+        counts['stale_buses'] += 1
+        
+        socketio.emit('bus_removed', {
+            'route_id': route_id,
+            'bus_id': bus_id,
+            'message': 'Bus has stopped tracking'
+        }, room=route_id)
+        socketio.emit('bus_status', {
+            'route_id': route_id,
+            'bus_id': bus_id,
+            'status': 'inactive',
+            'message': 'Bus is no longer active. Waiting for next bus...'
+        }, room=route_id)
+    
+    # Seats on buses that left the route and did not come back within the resume window
+    resume_cutoff = now.timestamp() - DRIVER_RESUME_GRACE_SECONDS
+    for bus_id in reservation_store.buses(route_id):
+        if (bus_id in active_buses.get(route_id, {}) or bus_id in parked_buses
+                or retired_buses.get(bus_id, 0) > resume_cutoff):
+            continue
+        session_ids = reservation_store.cancel_bus(route_id, bus_id)
+        for session_id in session_ids:
+            session_index.remove_reservation(session_id, route_id)
+        log_event(session_log, logging.INFO, 'bus_reservations_reaped', route_id=route_id, bus_id=bus_id, count=len(session_ids))
+        counts['bus_reservations'] += len(session_ids)
+    
+    stops = waiting_passengers.get(route_id, {})
+    for stop_id in [stop_id for stop_id, count in stops.items() if count <= 0]:
+        del stops[stop_id]
+        counts['waiting_counters'] += 1
+    return counts
+# Buses found with tracking state but no active/parked entry on the previous sweep
+reaper_orphan_candidates = set()
+# bus_id -> time.time() it left its route (pruned by the reaper after DRIVER_RESUME_GRACE_SECONDS)
+retired_buses = {}
+def reap_stale_state():
+    """Reaper sweep: stale buses (in each route actor), orphaned per-bus state, expired arrival predictions"""
+    now = datetime.now()
+    counts = Counter()
+    for route_id in list(STOP_COORDS):
+        if owns_route(route_id):
+            counts.update(route_actors.call(route_id, reap_route, route_id, now))
+    
+    # Tracking state whose bus is neither active nor parked (e.g. a fix that never finished); a bus
+    # must be orphaned on two sweeps in a row, so one whose first fix is in flight is left alone.
+    # A capacity flag also outlives its bus for the resume window (see reap_route)
+    resume_cutoff = now.timestamp() - DRIVER_RESUME_GRACE_SECONDS
+    for bus_id in [bus_id for bus_id, retired_at in retired_buses.items() if retired_at <= resume_cutoff]:
+        del retired_buses[bus_id]
+    live = set(parked_buses).union(*active_buses.values())
+    tracked = set().union(bus_speed_history, bus_start_location, bus_arrival_times, bus_last_passed_stop,
+                          bus_direction, bus_position_history, bus_current_stop,
+                          bus_last_speed, bus_logged_locations, lock_manager.bus_ids(),
+                          set(bus_capacity_status) - set(retired_buses))
+    orphans = tracked - live
+    evicted = orphans & reaper_orphan_candidates
+    for bus_id in evicted:
+        reset_bus_route_tracking(bus_id)
+        lock_manager.discard_bus(bus_id)
+    counts['orphaned_buses'] += len(evicted)
+    reaper_orphan_candidates.clear()
+    reaper_orphan_candidates.update(orphans - evicted)
+    
+    # Predictions older than MAX_ACTUAL_MINUTES can no longer be paired with an arrival
+    cutoff = now - timedelta(minutes=MAX_ACTUAL_MINUTES)
+    for bus_id in list(bus_arrival_times):
+        with lock_manager.bus(bus_id):
+            predictions = bus_arrival_times.get(bus_id, {})
+            for stop_id in [stop_id for stop_id, prediction in predictions.items() if prediction['time'] < cutoff]:
+                del predictions[stop_id]
+                counts['arrival_predictions'] += 1
+    return counts
+state_reaper = Reaper(reap_stale_state, interval=REAPER_INTERVAL)
+def initialize_routes():
+    """
+    Load compiled routes (geometry, stop distances, grid index) into STOP_COORDS / stop_distance_cache
+    Never calls OSRM: a missing or stale artifact is rebuilt in memory from the stops alone
+    """
+    global STOP_COORDS, stop_distance_cache, route_grid_index
+    try:
+        artifacts = load_route_artifacts(ROUTE_ARTIFACTS_FILE)
+    except Exception as e:
+        print(f"⚠️ Could not load {ROUTE_ARTIFACTS_FILE}: {e}")
+        artifacts = None
+    
+    if artifacts is None:
+        print(f"⚠️ {ROUTE_ARTIFACTS_FILE} not found - run `python route_compiler.py` before deploying")
+        print("   Using stop-only geometry for now (no network calls at startup)")
+        artifacts = compile_routes()
+    else:
+        changed = stale_routes(artifacts)
+        if changed:
+            print(f"⚠️ {ROUTE_ARTIFACTS_FILE} is stale for routes {', '.join(changed)} - rerun `python route_compiler.py`")
+            artifacts = compile_routes(artifacts)
+        print(f"✓ Loaded compiled routes from {ROUTE_ARTIFACTS_FILE} (built {artifacts['built_at']})")
+    
+    distances = {}
+    for route_id, route in artifacts['routes'].items():
+        if not route['stop_distances']:
+            print(f"⚠️ Route {route_id}: no segment distances in manual_distances.py")
+            continue
+        for direction, table in route['stop_distances'].items():
+            for stop_id, km in table.items():
+                distances[f"{route_id}_{stop_id}_{direction}"] = km
+        distances[f"{route_id}_total_distance"] = route['total_distance_km']
+    
+    STOP_COORDS = {route_id: route['points'] for route_id, route in artifacts['routes'].items()}
+    route_grid_index = {route_id: route['grid'] for route_id, route in artifacts['routes'].items()}
+    stop_distance_cache = distances
+def nearest_route_point(route_id, lat, lng):
+    """(index into STOP_COORDS[route_id], km) of the closest route point, via the grid index when it can decide"""
+    _, lat_rad, lng_rad, _ = get_route_point_arrays(route_id)
+    grid = route_grid_index.get(route_id)
+    if grid and len(lat_rad) >= ROUTE_GRID_MIN_POINTS:
+        i = int(np.floor(lat / grid['cell_deg']))
+        j = int(np.floor(lng / grid['cell_deg']))
+        cells = grid['cells']
+        candidates = [idx for di in (-1, 0, 1) for dj in (-1, 0, 1) for idx in cells.get(f"{i + di}:{j + dj}", ())]
+        if candidates:
+            candidates = np.array(candidates)
+            dists = haversine_distance_many(lat_rad[candidates], lng_rad[candidates], lat, lng)
+            best = int(np.argmin(dists))
+            # Anything outside the 3×3 block is at least reach_km away
+            if dists[best] <= grid['reach_km']:
+                return int(candidates[best]), float(dists[best])
+    
+    dists = haversine_distance_many(lat_rad, lng_rad, lat, lng)
+    best = int(np.argmin(dists))
+    return best, float(dists[best])
 def calculate_distance_with_waypoints(route_id, lat1, lon1, lat2, lon2):
     """
     Calculate distance following OSRM-generated waypoints
@@ -867,46 +503,16 @@ def calculate_distance_with_waypoints(route_id, lat1, lon1, lat2, lon2):
     if len(all_points) == 0:
         return haversine_distance(lat1, lon1, lat2, lon2)
     
-    min_dist_start = float('inf')
-    start_idx = 0
-    for i, point in enumerate(all_points):
-        dist = haversine_distance(lat1, lon1, point['lat'], point['lng'])
-        if dist < min_dist_start:
-            min_dist_start = dist
-            start_idx = i
-    
-    min_dist_end = float('inf')
-    end_idx = 0
-    for i, point in enumerate(all_points):
-        dist = haversine_distance(lat2, lon2, point['lat'], point['lng'])
-        if dist < min_dist_end:
-            min_dist_end = dist
-            end_idx = i
-    
-    total_distance = 0.0
-    
-    total_distance += min_dist_start
-    
-    if start_idx < end_idx:
-        for i in range(start_idx, end_idx):
-            p1 = all_points[i]
-            p2 = all_points[i + 1]
-            segment_dist = haversine_distance(p1['lat'], p1['lng'], p2['lat'], p2['lng'])
-            total_distance += segment_dist
-            
-    elif start_idx > end_idx:
-        for i in range(start_idx, end_idx, -1):
-            p1 = all_points[i]
-            p2 = all_points[i - 1]
-            segment_dist = haversine_distance(p1['lat'], p1['lng'], p2['lat'], p2['lng'])
-            total_distance += segment_dist
+    cumulative = get_route_point_arrays(route_id)[3]
+    start_idx, min_dist_start = nearest_route_point(route_id, lat1, lon1)
+    end_idx, min_dist_end = nearest_route_point(route_id, lat2, lon2)
     
+    if start_idx != end_idx:
+        # Waypoint path between the two snapped points is a difference of prefix sums
+        total_distance = min_dist_start + abs(float(cumulative[end_idx] - cumulative[start_idx])) + min_dist_end
     else:
         total_distance = haversine_distance(lat1, lon1, lat2, lon2)
     
-    if start_idx != end_idx:
-        total_distance += min_dist_end
-    
     if len(distance_cache) > 5000:
         for _ in range(1000):
             distance_cache.pop(next(iter(distance_cache)))
@@ -928,6 +534,33 @@ def get_bus_stops_only(route_id):
         return []
     
     return [point for point in STOP_COORDS[route_id] if point.get('is_stop', True)]
+def get_stop_chainage(route_id, direction):
+    """
+    Stop ids and each stop's directional distance from start (km, NumPy array), in travel order
+    Built once per route/direction from stop_distance_cache
+    """
+    cached = stop_chainage_arrays.get((route_id, direction))
+    if cached is not None and cached[0] is stop_distance_cache:
+        return cached[1], cached[2]
+    
+    stop_ids = [stop['id'] for stop in get_bus_stops_only(route_id)]
+    chainage = np.array([
+        stop_distance_cache.get(f"{route_id}_{stop_id}_{direction}",
+                                stop_distance_cache.get(f"{route_id}_{stop_id}_forward", 0))
+        for stop_id in stop_ids
+    ], dtype=float)
+    order = np.argsort(chainage, kind='stable')
+    stop_ids = [stop_ids[i] for i in order]
+    chainage = chainage[order]
+    
+    stop_chainage_arrays[(route_id, direction)] = (stop_distance_cache, stop_ids, chainage)
+    return stop_ids, chainage
+def downstream_stop_distances(route_id, direction, distance_from_start):
+    """(stop ids, remaining km) for every stop still ahead of a bus"""
+    stop_ids, chainage = get_stop_chainage(route_id, direction)
+    remaining = chainage - distance_from_start
+    ahead = np.flatnonzero(remaining > 0)
+    return [stop_ids[i] for i in ahead], remaining[ahead]
     
 '''def calculate_speed_from_history(bus_id, current_lat, current_lng, current_time, route_id=None):
     """Calculate speed using last 5 locations over time span, with GPS speed fallback"""
@@ -966,7 +599,7 @@ def get_bus_stops_only(route_id):
         return 0.0 '''
 def calculate_speed_from_history(bus_id, current_lat, current_lng, current_time, route_id=None, gps_speed=None):
     """Calculate speed using last 20 locations with predicted speed fallback for surges"""
-    with bus_data_lock:
+    with lock_manager.bus(bus_id):
         if bus_id not in bus_speed_history:
             bus_speed_history[bus_id] = []
         
@@ -1122,7 +755,7 @@ def calculate_distance_from_start(route_id, bus_id, lat, lng, direction='forward
     For forward: distance from first stop
     For backward: distance from last stop (measured from end)
     """
-    with bus_data_lock:
+    with lock_manager.bus(bus_id):
         bus_stops = get_bus_stops_only(route_id)
         
         if not bus_stops or len(bus_stops) == 0:
@@ -1317,26 +950,40 @@ def find_next_stop_bidirectional(route_id, bus_id, lat, lng):
                 return stop, distance, current_direction
     
     return nearest_stop, min_distance, current_direction
-def predict_eta(distance_km, traffic_level):
-    if model is None:
+def predict_eta(distance_km, traffic_level, route_id=None):
+    etas = predict_eta_batch([(distance_km, traffic_level)])
+    if route_id is not None:
+        etas = eta_corrector.correct(route_id, etas)
+    return float(etas[0])
+def predict_eta_batch(features):
+    """ETA in minutes for a batch of (distance_km, traffic_level) pairs, one model call for all"""
+    features = np.asarray(features, dtype=float).reshape(-1, 2)
+    if model_registry.model is None:
         base_speed = 30
-        speed = base_speed / traffic_level if traffic_level > 0 else base_speed
-        return (distance_km / speed) * 60
+        traffic = features[:, 1]
+        speed = np.full(len(features), float(base_speed))
+        np.divide(base_speed, traffic, out=speed, where=traffic > 0)
+        return (features[:, 0] / speed) * 60
     
     try:
-        features = np.array([[distance_km, traffic_level]])
-        prediction = model.predict(features)[0]
-        return max(0.5, prediction)
+        return np.maximum(0.5, model_registry.predict(features))
     except Exception as e:
-        print(f"Prediction error: {e}")
-        return (distance_km / 30) * 60
+        log.exception('eta_prediction_failed')
+        return (features[:, 0] / 30) * 60
+def predict_eta_tables(tables):
+    """Predict several (n, 2) feature tables with one model call; returns one ETA array per table"""
+    sizes = [len(table) for table in tables]
+    etas = predict_eta_batch(np.vstack(tables))
+    return np.split(etas, np.cumsum(sizes)[:-1])
+# Coalesces ETA tables from concurrent location updates into one model call in the thread pool
+eta_batcher = BatchExecutor(predict_eta_tables, max_batch=64, window=0.002)
 def log_location_to_csv(route_id, bus_id, lat, lng, traffic_level, nearest_stop_id,
                         nearest_stop_name, distance_km, speed_kmh, distance_from_start, driver_id=None, available_seats=None):
     """Location logging with deduplication"""
     try:
         loc_signature = f"{bus_id}_{round(lat, 6)}_{round(lng, 6)}"
         
-        with bus_data_lock:
+        with lock_manager.bus(bus_id):
             if loc_signature in bus_logged_locations[bus_id]:
                 return
             bus_logged_locations[bus_id].add(loc_signature)
@@ -1346,224 +993,251 @@ def log_location_to_csv(route_id, bus_id, lat, lng, traffic_level, nearest_stop_
                 for sig in old_sigs[:-200]:
                     bus_logged_locations[bus_id].discard(sig)
         
+        row = [
+            datetime.now().isoformat(),
+            route_id,
+            bus_id,
+            driver_id or 'N/A',
+            f"{lat:.6f}",
+            f"{lng:.6f}",
+            traffic_level,
+            nearest_stop_id,
+            nearest_stop_name,
+            f"{distance_km:.3f}",
+            f"{distance_from_start:.3f}",
+            f"{speed_kmh:.2f}",
+            available_seats or 0
+        ]
+        header = ['timestamp', 'route_id', 'bus_id', 'driver_id',
+                  'latitude', 'longitude', 'traffic_level',
+                  'nearest_stop_id', 'nearest_stop_name',
+                  'distance_to_stop_km', 'distance_from_start_km', 'speed_kmh', 'available_seats']
+        
         with location_lock:
-            file_exists = os.path.isfile(LOCATIONS_FILE)
-            
-            with open(LOCATIONS_FILE, 'a', newline='') as f:
-                writer = csv.writer(f)
-                if not file_exists:
-                    writer.writerow(['timestamp', 'route_id', 'bus_id', 'driver_id',
-                                   'latitude', 'longitude', 'traffic_level',
-                                   'nearest_stop_id', 'nearest_stop_name',
-                                   'distance_to_stop_km', 'distance_from_start_km', 'speed_kmh', 'available_seats'])
-                
-                writer.writerow([
-                    datetime.now().isoformat(),
-                    route_id,
-                    bus_id,
-                    driver_id or 'N/A',
-                    f"{lat:.6f}",
-                    f"{lng:.6f}",
-                    traffic_level,
-                    nearest_stop_id,
-                    nearest_stop_name,
-                    f"{distance_km:.3f}",
-                    f"{distance_from_start:.3f}",
-                    f"{speed_kmh:.2f}",
-                    available_seats or 0
-                ])
-            
-            if os.path.getsize(LOCATIONS_FILE) > 10 * 1024 * 1024:
-                cleanup_location_history()
+            file_size = run_blocking(append_csv_rows, LOCATIONS_FILE, header, [row])
+        needs_cleanup = file_size > 10 * 1024 * 1024
+        
+        # Outside the file lock: cleanup takes it again (the lock is not reentrant)
+        if needs_cleanup:
+            cleanup_location_history()
     except Exception as e:
-        print(f"Location logging error: {e}")
+        log.exception('location_log_failed')
+def append_csv_rows(path, header, rows):
+    """Append rows (writing the header for a new file) and return the file size; safe to run in the thread pool"""
+    file_exists = os.path.isfile(path)
+    with open(path, 'a', newline='') as f:
+        writer = csv.writer(f)
+        if not file_exists:
+            writer.writerow(header)
+        writer.writerows(rows)
+    return os.path.getsize(path)
+def trim_location_history():
+    """Keep the newest 80% of bus_locations.csv; returns the number of rows kept"""
+    with open(LOCATIONS_FILE, 'r') as f:
+        reader = list(csv.reader(f))
+    
+    header = reader[0]
+    data = reader[1:]
+    keep_count = int(len(data) * 0.8)
+    
+    with open(LOCATIONS_FILE, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(data[-keep_count:])
+    return keep_count
 def cleanup_location_history():
     try:
         with location_lock:
-            with open(LOCATIONS_FILE, 'r') as f:
-                reader = list(csv.reader(f))
-            
-            header = reader[0]
-            data = reader[1:]
-            keep_count = int(len(data) * 0.8)
-            
-            with open(LOCATIONS_FILE, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(header)
-                writer.writerows(data[-keep_count:])
-            print(f"✓ Cleaned up location history. Kept {keep_count} records.")
+            keep_count = run_blocking(trim_location_history)
+        log_event(log, logging.INFO, 'location_history_trimmed', kept=keep_count)
     except Exception as e:
-        print(f"Cleanup error: {e}")
+        log.exception('location_history_trim_failed')
 def log_arrival(route_id, stop_id, stop_name, predicted_time_min, actual_time_min,
                 distance_km, bus_id, driver_id, speed_kmh, distance_from_start, available_seats=None):
     try:
+        row = [
+            datetime.now().isoformat(),
+            route_id,
+            bus_id,
+            driver_id or 'N/A',
+            stop_id,
+            stop_name,
+            f"{predicted_time_min:.2f}",
+            f"{actual_time_min:.2f}",
+            f"{distance_km:.3f}",
+            f"{distance_from_start:.3f}",
+            f"{speed_kmh:.2f}",
+            available_seats or 0
+        ]
+        header = ['timestamp', 'route_id', 'bus_id', 'driver_id',
+                  'stop_id', 'stop_name', 'predicted_time_min',
+                  'actual_time_min', 'distance_km', 'distance_from_start_km', 'speed_kmh', 'available_seats']
+        
         with history_lock:
-            file_exists = os.path.isfile(HISTORY_FILE)
-            
-            with open(HISTORY_FILE, 'a', newline='') as f:
-                writer = csv.writer(f)
-                if not file_exists:
-                    writer.writerow(['timestamp', 'route_id', 'bus_id', 'driver_id',
-                                   'stop_id', 'stop_name', 'predicted_time_min',
-                                   'actual_time_min', 'distance_km', 'distance_from_start_km', 'speed_kmh', 'available_seats'])
-                
-                writer.writerow([
-                    datetime.now().isoformat(),
-                    route_id,
-                    bus_id,
-                    driver_id or 'N/A',
-                    stop_id,
-                    stop_name,
-                    f"{predicted_time_min:.2f}",
-                    f"{actual_time_min:.2f}",
-                    f"{distance_km:.3f}",
-                    f"{distance_from_start:.3f}",
-                    f"{speed_kmh:.2f}",
-                    available_seats or 0
-                ])
+            run_blocking(append_csv_rows, HISTORY_FILE, header, [row])
     except Exception as e:
-        print(f"Arrival logging error: {e}")
+        log.exception('arrival_log_failed')
 def get_available_seats(route_id, bus_id):
     """Get available seats for a bus"""
-    reservations = bus_reservations[route_id][bus_id]
-    return max(0, TOTAL_SEATS_PER_BUS - len(reservations))
-def reserve_seat(route_id, passenger_name, session_id, preferred_bus_id=None):
-    """Reserve a seat, auto-assign to next available bus, or add to waiting list if all full"""
-    with reservation_lock:
-        # Check if passenger already has a reservation on this route (global check)
-        for bus_id, reservations in bus_reservations[route_id].items():
-            if any(r['passenger_name'].lower() == passenger_name.lower() for r in reservations):
-                return {'success': False, 'message': 'You can only book one ticket per route. You already have a reservation.', 'bus_id': None, 'seats_left': 0}
-        
-        # Check if session already has a reservation (fallback)
-        for bus_id, reservations in bus_reservations[route_id].items():
-            if any(r['session_id'] == session_id for r in reservations):
-                return {'success': False, 'message': 'You already have a reservation on this route', 'bus_id': None, 'seats_left': 0}
-        
-        active_buses_on_route = active_buses[route_id]
-        if not active_buses_on_route:
-            return {'success': False, 'message': 'No active buses on this route', 'bus_id': None, 'seats_left': 0}
-        
-        # Check if all buses are marked as full
-        all_full = all(bus_capacity_status.get(bus_id, False) for bus_id in active_buses_on_route.keys())
-        if all_full:
-            return {'success': False, 'message': 'All buses are full, cannot book ticket', 'bus_id': None, 'seats_left': 0}
-        
-        # Sort buses by distance from start (earliest bus first)
-        sorted_buses = sorted(
-            active_buses_on_route.items(),
-            key=lambda x: x[1].get('distance_from_start', 0)
-        )
-        
-        # Try preferred bus first if available
-        if preferred_bus_id and preferred_bus_id in active_buses_on_route:
-            available = get_available_seats(route_id, preferred_bus_id)
-            if available > 0:
-                bus_reservations[route_id][preferred_bus_id].append({
-                    'passenger_name': passenger_name,
-                    'session_id': session_id,
-                    'reserved_at': datetime.now().isoformat()
-                })
-                log_reservation(route_id, preferred_bus_id, passenger_name, session_id)
-                return {'success': True, 'message': f'Ticket booked for Bus {preferred_bus_id}', 'bus_id': preferred_bus_id, 'seats_left': available - 1}
-        
-        # Find next available bus
-        for bus_id, _ in sorted_buses:
-            if bus_id == preferred_bus_id:  # Skip if already checked
-                continue
-            available = get_available_seats(route_id, bus_id)
-            if available > 0:
-                bus_reservations[route_id][bus_id].append({
-                    'passenger_name': passenger_name,
-                    'session_id': session_id,
-                    'reserved_at': datetime.now().isoformat()
-                })
-                log_reservation(route_id, bus_id, passenger_name, session_id)
-                return {'success': True, 'message': f'Ticket booked for Bus {bus_id}', 'bus_id': bus_id, 'seats_left': available - 1}
-        
-        # No available seats, add to waiting list
-        waiting_reservations[route_id].append({
-            'passenger_name': passenger_name,
-            'session_id': session_id,
-            'preferred_bus_id': preferred_bus_id,
-            'added_at': datetime.now().isoformat()
-        })
-        return {'success': False, 'message': 'All buses full. Added to waiting list.', 'bus_id': None, 'seats_left': 0, 'waiting': True}
+    return reservation_store.available_seats(route_id, bus_id)
+def reserve_seat(route_id, passenger_name, session_id, preferred_bus_id=None, sid=None):
+    """Reserve a seat, auto-assign to next available bus, or add to waiting list if all full
+    sid is the Socket.IO sid when the booking came over the socket; only those are put in session_index,
+    since a REST session_id never disconnects"""
+    # Check if passenger already has a reservation on this route (global check)
+    if reservation_store.has_passenger(route_id, passenger_name):
+        return {'success': False, 'message': 'You can only book one ticket per route. You already have a reservation.', 'bus_id': None, 'seats_left': 0}
+    
+    # Check if session already has a reservation (fallback)
+    if reservation_store.has_session(route_id, session_id):
+        return {'success': False, 'message': 'You already have a reservation on this route', 'bus_id': None, 'seats_left': 0}
+    
+    active_buses_on_route = active_buses[route_id]
+    if not active_buses_on_route:
+        return {'success': False, 'message': 'No active buses on this route', 'bus_id': None, 'seats_left': 0}
+    
+    # Check if all buses are marked as full
+    all_full = all(bus_capacity_status.get(bus_id, False) for bus_id in active_buses_on_route.keys())
+    if all_full:
+        return {'success': False, 'message': 'All buses are full, cannot book ticket', 'bus_id': None, 'seats_left': 0}
+    
+    # Sort buses by distance from start (earliest bus first)
+    sorted_buses = sorted(
+        active_buses_on_route.items(),
+        key=lambda x: x[1].get('distance_from_start', 0)
+    )
+    
+    # Try preferred bus first if available
+    if preferred_bus_id and preferred_bus_id in active_buses_on_route:
+        available = get_available_seats(route_id, preferred_bus_id)
+        if available > 0:
+            reservation_store.add(route_id, preferred_bus_id, passenger_name, session_id)
+            if sid:
+                session_index.add_reservation(sid, route_id)
+            log_reservation(route_id, preferred_bus_id, passenger_name, session_id)
+            return {'success': True, 'message': f'Ticket booked for Bus {preferred_bus_id}', 'bus_id': preferred_bus_id, 'seats_left': available - 1}
+    
+    # Find next available bus
+    for bus_id, _ in sorted_buses:
+        if bus_id == preferred_bus_id:  # Skip if already checked
+            continue
+        available = get_available_seats(route_id, bus_id)
+        if available > 0:
+            reservation_store.add(route_id, bus_id, passenger_name, session_id)
+            if sid:
+                session_index.add_reservation(sid, route_id)
+            log_reservation(route_id, bus_id, passenger_name, session_id)
+            return {'success': True, 'message': f'Ticket booked for Bus {bus_id}', 'bus_id': bus_id, 'seats_left': available - 1}
+    
+    # No available seats, add to waiting list
+    waiting_reservations[route_id][session_id] = {
+        'passenger_name': passenger_name,
+        'session_id': session_id,
+        'preferred_bus_id': preferred_bus_id,
+        'sid': sid,
+        'added_at': datetime.now().isoformat()
+    }
+    if sid:
+        session_index.add_waitlist(sid, route_id)
+    return {'success': False, 'message': 'All buses full. Added to waiting list.', 'bus_id': None, 'seats_left': 0, 'waiting': True}
 
 def assign_from_waiting_list(route_id):
-    """Assign seats from waiting list to available buses"""
-    with reservation_lock:
-        if not waiting_reservations[route_id]:
-            return
-        
-        # Get available buses sorted by distance
-        available_buses = []
-        for bus_id in active_buses[route_id]:
-            if get_available_seats(route_id, bus_id) > 0:
-                available_buses.append((bus_id, active_buses[route_id][bus_id].get('distance_from_start', 0)))
-        
-        available_buses.sort(key=lambda x: x[1])  # Sort by distance
-        
-        assigned = []
-        while waiting_reservations[route_id] and available_buses:
-            waiting = waiting_reservations[route_id].popleft()
-            
-            # Try preferred bus first
-            target_bus = None
-            for bus_id, _ in available_buses:
-                if bus_id == waiting['preferred_bus_id']:
-                    target_bus = bus_id
-                    break
-            if not target_bus:
-                target_bus = available_buses[0][0]
-            
-            available = get_available_seats(route_id, target_bus)
-            if available > 0:
-                bus_reservations[route_id][target_bus].append({
-                    'passenger_name': waiting['passenger_name'],
-                    'session_id': waiting['session_id'],
-                    'reserved_at': datetime.now().isoformat()
-                })
-                log_reservation(route_id, target_bus, waiting['passenger_name'], waiting['session_id'])
-                assigned.append({'bus_id': target_bus, 'session_id': waiting['session_id'], 'passenger_name': waiting['passenger_name']})
-                
-                # Notify the specific session
-                socketio.emit('reservation_assigned', {
-                    'route_id': route_id,
-                    'bus_id': target_bus,
-                    'session_id': waiting['session_id'],
-                    'message': f'Seat assigned in bus {target_bus}'
-                }, room=route_id)
-                
-                # Remove from available if now full
-                available_buses = [(bid, dist) for bid, dist in available_buses if bid != target_bus or get_available_seats(route_id, bid) > 0]
-            else:
-                # Remove full bus
-                available_buses = [(bid, dist) for bid, dist in available_buses if bid != target_bus]
-        
-        if assigned:
-            socketio.emit('reservation_update', {
-                'route_id': route_id,
-                'assigned': assigned
-            }, room=route_id)
+    """
+    Drain the waiting list into free seats in one batch
+    Buses sit in a min-heap by distance from start with their free seats kept in a dict,
+    so k waiting passengers over b buses cost O(b + k log b)
+    """
+    if not waiting_reservations[route_id]:
+        return
+    
+    # bus_id -> free seats (doubles as the preferred-bus lookup)
+    seats_left = {}
+    bus_heap = []
+    for bus_id, bus_data in active_buses[route_id].items():
+        available = get_available_seats(route_id, bus_id)
+        if available > 0:
+            seats_left[bus_id] = available
+            bus_heap.append((bus_data.get('distance_from_start', 0), bus_id))
+    heapq.heapify(bus_heap)
+    
+    assigned = []
+    while waiting_reservations[route_id] and seats_left:
+        _, waiting = waiting_reservations[route_id].popitem(last=False)
+        if waiting.get('sid'):
+            session_index.remove_waitlist(waiting['sid'], route_id)
+        
+        # Try preferred bus first, otherwise the nearest-to-start bus with seats
+        target_bus = waiting['preferred_bus_id']
+        if target_bus not in seats_left:
+            while bus_heap[0][1] not in seats_left:
+                heapq.heappop(bus_heap) # Lazily drop buses that filled up
+            target_bus = bus_heap[0][1]
+        
+        reservation_store.add(route_id, target_bus, waiting['passenger_name'], waiting['session_id'])
+        if waiting.get('sid'):
+            session_index.add_reservation(waiting['sid'], route_id)
+        assigned.append({'bus_id': target_bus, 'session_id': waiting['session_id'], 'passenger_name': waiting['passenger_name'], 'sid': waiting.get('sid')})
+        
+        seats_left[target_bus] -= 1
+        if seats_left[target_bus] == 0:
+            del seats_left[target_bus]
+    
+    if not assigned:
+        return
+    
+    seats_by_bus = {a['bus_id']: get_available_seats(route_id, a['bus_id']) for a in assigned}
+    
+    log_reservations([(route_id, a['bus_id'], a['passenger_name'], a['session_id']) for a in assigned])
+    
+    # Socket bookings are told on their sid; REST session_ids are not rooms, so those go
+    # to the route room and the client picks out its own session_id
+    for a in assigned:
+        socketio.emit('reservation_assigned', {
+            'route_id': route_id,
+            'bus_id': a['bus_id'],
+            'session_id': a['session_id'],
+            'message': f"Seat assigned in bus {a['bus_id']}"
+        }, room=a.pop('sid') or route_id)
+    
+    # One coalesced update for the whole route
+    socketio.emit('reservation_update', {
+        'route_id': route_id,
+        'assigned': assigned,
+        'available_seats_by_bus': seats_by_bus
+    }, room=route_id)
 
 def log_reservation(route_id, bus_id, passenger_name, session_id):
     """Log reservation to CSV"""
+    log_reservations([(route_id, bus_id, passenger_name, session_id)])
+def log_reservations(rows):
+    """Log a batch of (route_id, bus_id, passenger_name, session_id) reservations with one file open"""
     try:
-        file_exists = os.path.isfile(RESERVATIONS_FILE)
-        with open(RESERVATIONS_FILE, 'a', newline='') as f:
-            writer = csv.writer(f)
-            if not file_exists:
-                writer.writerow(['timestamp', 'route_id', 'bus_id', 'passenger_name', 'session_id'])
-            writer.writerow([
-                datetime.now().isoformat(),
-                route_id,
-                bus_id,
-                passenger_name,
-                session_id
-            ])
+        timestamp = datetime.now().isoformat()
+        header = ['timestamp', 'route_id', 'bus_id', 'passenger_name', 'session_id']
+        csv_rows = [[timestamp, route_id, bus_id, passenger_name, session_id]
+                    for route_id, bus_id, passenger_name, session_id in rows]
+        with reservations_file_lock:
+            run_blocking(append_csv_rows, RESERVATIONS_FILE, header, csv_rows)
     except Exception as e:
-        print(f"Reservation logging error: {e}")
+        log.exception('reservation_log_failed')
+def redirect_to_route_shard(route_id):
+    """Tell a socket client to reconnect to the shard that owns route_id; returns True if redirected"""
+    if owns_route(route_id):
+        return False
+    emit('route_shard_redirect', {
+        'route_id': route_id,
+        'shard': route_shard(route_id),
+        'url': shard_url(route_id)
+    })
+    return True
+def foreign_route_response(route_id):
+    """HTTP response sending the request to the shard that owns route_id, or None if it's ours"""
+    if owns_route(route_id):
+        return None
+    url = shard_url(route_id)
+    if url:
+        return redirect(url + request.full_path.rstrip('?'), code=307)
+    return jsonify({'error': 'Route is served by another shard', 'shard': route_shard(route_id)}), 421
 # ==================== FLASK ROUTES ====================
 @app.route('/static/<path:filename>')
 def static_files(filename):
@@ -1577,16 +1251,23 @@ def get_routes():
     for route_id, points in STOP_COORDS.items():
         stops_only[route_id] = [p for p in points if p.get('is_stop', True)]
     
-    return jsonify({
+    response = {
         'routes': list(STOP_COORDS.keys()),
         'stops': stops_only
-    })
+    }
+    if is_sharded():
+        response['shards'] = {route_id: shard_url(route_id) for route_id in STOP_COORDS}
+    return jsonify(response)
 @app.route('/api/waiting_stats')
 def get_waiting_stats():
     return jsonify(dict(waiting_passengers))
 @app.route('/api/active_buses/<route_id>')
 def get_active_buses(route_id):
     """Filter out full buses for passengers"""
+    foreign = foreign_route_response(route_id)
+    if foreign:
+        return foreign
+    
     buses = []
     if route_id in active_buses:
         for bus_id, bus_data in active_buses[route_id].items():
@@ -1594,8 +1275,7 @@ def get_active_buses(route_id):
             if bus_capacity_status.get(bus_id, False):
                 continue
             
-            reserved_count = len(bus_reservations[route_id][bus_id])
-            available_seats = TOTAL_SEATS_PER_BUS - reserved_count
+            available_seats = get_available_seats(route_id, bus_id)
             if available_seats <= 0:
                 continue
                 
@@ -1614,7 +1294,8 @@ def get_active_buses(route_id):
                 'is_full': bus_data.get('is_full', False),
                 'progress_pct': bus_data.get('progress_pct', 0),
                 'distance_from_start': bus_data.get('distance_from_start', 0),
-                'available_seats': available_seats
+                'available_seats': available_seats,
+                'stop_etas': bus_data.get('stop_etas', [])
             })
     return jsonify({'buses': buses})
 @app.route('/api/reserve_seat', methods=['POST'])
@@ -1623,9 +1304,15 @@ def api_reserve_seat():
     route_id = data.get('route_id')
     passenger_name = data.get('passenger_name', 'Anonymous')
     session_id = data.get('session_id', str(uuid.uuid4()))
+    
+    foreign = foreign_route_response(route_id)
+    if foreign:
+        return foreign
+    if route_id not in STOP_COORDS:
+        return jsonify({'error': 'Route not found'}), 404
     preferred_bus_id = data.get('preferred_bus_id')
     
-    result = reserve_seat(route_id, passenger_name, session_id, preferred_bus_id)
+    result = route_actors.call(route_id, reserve_seat, route_id, passenger_name, session_id, preferred_bus_id)
     
     if result['success']:
         # Notify all passengers on route
@@ -1637,14 +1324,119 @@ def api_reserve_seat():
         }, room=route_id)
     
     return jsonify(result)
+@app.route('/api/lock_stats')
+def get_lock_stats():
+    """Contention counters and wait-time histograms for every route/bus/file lock"""
+    return jsonify(lock_manager.stats())
+@app.route('/api/route_actors')
+def get_route_actor_stats():
+    """Mailbox depth and throughput of each route actor"""
+    return jsonify(route_actors.stats())
+@app.route('/api/hub_latency')
+def get_hub_latency():
+    """How late the eventlet hub wakes sleeping greenlets, plus thread-pool offload counters"""
+    return jsonify({
+        'offload_enabled': OFFLOAD_BLOCKING,
+        'hub_lag': hub_latency_probe.stats(),
+        'offload': dict(offload_stats)
+    })
+metrics.gauge('active_buses', 'Buses currently reporting, by route',
+              lambda: {route_id: len(active_buses.get(route_id, ())) for route_id in STOP_COORDS}, ['route'])
+metrics.gauge('connected_sids', 'Socket.IO sessions connected to this worker', lambda: len(socketio.server.eio.sockets))
+metrics.gauge('authenticated_drivers', 'Driver sessions past driver_authenticate', lambda: len(authenticated_drivers))
+metrics.gauge('waitlist_depth', 'Passengers on the reservation waiting list, by route',
+              lambda: {route_id: len(waiting_reservations.get(route_id, ())) for route_id in STOP_COORDS}, ['route'])
+metrics.gauge('waiting_passengers', 'Passengers marked waiting at a stop, by route',
+              lambda: {route_id: sum(waiting_passengers.get(route_id, {}).values()) for route_id in STOP_COORDS}, ['route'])
+metrics.gauge('cache_entries', 'Entries in in-memory caches and per-bus maps', lambda: {
+    'distance_cache': len(distance_cache),
+    'stop_distance_cache': len(stop_distance_cache),
+    'bus_speed_history': len(bus_speed_history),
+    'bus_position_history': len(bus_position_history),
+    'bus_arrival_times': len(bus_arrival_times),
+    'bus_last_speed': len(bus_last_speed),
+    'bus_capacity_status': len(bus_capacity_status),
+    'parked_buses': len(parked_buses),
+    'sessions': len(session_index)
+}, ['cache'])
+metrics.gauge('route_actor_queue_depth', 'Commands waiting in each route actor mailbox',
+              lambda: {route_id: actor['queued'] for route_id, actor in route_actors.stats().items()}, ['route'])
+metrics.gauge('eta_batch_pending', 'ETA predictions waiting for the next batch', eta_batcher.pending)
+metrics.gauge('log_records_dropped', 'Log records dropped because the log queue was full', lambda: log_handler.dropped)
+metrics.gauge('reaper_reclaimed', 'Entries removed by the state reaper since start, by kind',
+              lambda: dict(state_reaper.reclaimed), ['kind'])
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus text exposition of this worker's metrics"""
+    return metrics.render(), 200, {'Content-Type': METRICS_CONTENT_TYPE}
+@app.route('/api/reaper')
+def get_reaper_stats():
+    """Reaper sweeps, how long they took and what they reclaimed"""
+    return jsonify({**state_reaper.stats(), 'bus_stale_seconds': BUS_STALE_SECONDS})
+def require_admin_token():
+    """None if the request carries ADMIN_TOKEN, else an error response (admin endpoints are off when it is unset)"""
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'Admin endpoints disabled (set ADMIN_TOKEN)'}), 403
+    if request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'Invalid admin token'}), 401
+    return None
+@app.route('/api/startup')
+def get_startup_report():
+    """How long each cold-start phase of this worker took"""
+    return jsonify({'phases_ms': startup_phases, 'total_ms': round(sum(startup_phases.values()), 1)})
+@app.route('/api/model')
+def get_model_status():
+    """Active / previous ETA model versions, per-prediction latency and online correction accuracy"""
+    return jsonify({**model_registry.stats(), 'online_correction': eta_corrector.stats()})
+@app.route('/api/model/reload', methods=['POST'])
+def reload_model():
+    denied = require_admin_token()
+    if denied:
+        return denied
+    swapped = model_registry.check_for_update()
+    return jsonify({'swapped': swapped, **model_registry.stats()})
+@app.route('/api/model/rollback', methods=['POST'])
+def rollback_model():
+    denied = require_admin_token()
+    if denied:
+        return denied
+    if not model_registry.rollback():
+        return jsonify({'error': 'No previous model version to roll back to'}), 409
+    return jsonify(model_registry.stats())
+@app.route('/api/profile', methods=['POST'])
+def run_profile():
+    """Sample all thread stacks for ?seconds=N (admin), answered as collapsed stacks for a flame graph"""
+    denied = require_admin_token()
+    if denied:
+        return denied
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval_ms = float(request.args.get('interval_ms', 5))
+    except ValueError:
+        return jsonify({'error': 'seconds and interval_ms must be numbers'}), 400
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        return jsonify({'error': f'seconds must be in (0, {PROFILE_MAX_SECONDS}]'}), 400
+    if not stack_sampler.profile(seconds, socketio.sleep, interval_ms / 1000):
+        return jsonify({'error': 'A profile is already running', **stack_sampler.stats()}), 409
+    stats = stack_sampler.stats()
+    log_event(log, logging.INFO, 'profile_done', duration_s=stats['duration_s'], samples=stats['samples'],
+              idle_samples=stats['idle_samples'], unique_stacks=stats['unique_stacks'])
+    if request.args.get('format') == 'json':
+        return jsonify({**stats, 'stacks': dict(stack_sampler.stacks.most_common())})
+    headers = {'Content-Type': 'text/plain; charset=utf-8',
+               **{f"X-Profile-{key.replace('_', '-').title()}": str(value) for key, value in stats.items()}}
+    return stack_sampler.collapsed(), 200, headers
 @app.route('/api/reservations/<route_id>/<bus_id>')
 def get_reservations(route_id, bus_id):
-    reservations = bus_reservations[route_id][bus_id]
+    foreign = foreign_route_response(route_id)
+    if foreign:
+        return foreign
+    reservations = reservation_store.reservations_for_bus(route_id, bus_id)
     return jsonify({
         'bus_id': bus_id,
         'total_seats': TOTAL_SEATS_PER_BUS,
         'reserved_count': len(reservations),
-        'available_seats': TOTAL_SEATS_PER_BUS - len(reservations),
+        'available_seats': get_available_seats(route_id, bus_id),
         'reservations': reservations
     })
 @app.route('/favicon.ico')
@@ -1728,6 +1520,10 @@ def get_passenger_distance(route_id, bus_id, user_stop_id):
     Calculate remaining distance using OSRM pre-calculated distances
     Considers bus direction (forward/backward)
     """
+    foreign = foreign_route_response(route_id)
+    if foreign:
+        return foreign
+    
     if route_id not in active_buses or bus_id not in active_buses[route_id]:
         return jsonify({'error': 'Bus not found'}), 404
     
@@ -1748,30 +1544,26 @@ def get_passenger_distance(route_id, bus_id, user_stop_id):
     
     if user_stop_distance_from_start is None:
         # Fallback: try forward direction
-        print(f"⚠️ Stop distance not in cache: {cache_key}")
+        log_event(log, logging.WARNING, 'stop_distance_missing', cache_key=cache_key)
         cache_key_alt = f"{route_id}_{user_stop_id}_forward"
         user_stop_distance_from_start = stop_distance_cache.get(cache_key_alt, 0)
     
     # ✅ Calculate remaining distance
     remaining_distance = user_stop_distance_from_start - bus_distance_from_start
     
-    # ✅ DEBUG LOGGING FOR PASSENGER DISTANCE
-    print(f"\n{'='*60}")
-    print(f"📍 PASSENGER DISTANCE CALCULATION")
-    print(f" Route: {route_id}")
-    print(f" Bus ID: {bus_id}")
-    print(f" Bus Direction: {bus_direction}")
-    print(f" User Stop: {user_stop['name']} (ID: {user_stop_id})")
-    print(f" ")
-    print(f" Cache key: {cache_key}")
-    print(f" User stop distance from start: {user_stop_distance_from_start:.3f} km")
-    print(f" Bus distance from start: {bus_distance_from_start:.3f} km")
-    print(f" Remaining distance: {remaining_distance:.3f} km")
-    print(f"{'='*60}\n")
+    if passenger_log.enabled():
+        passenger_log.debug('passenger_distance', route_id=route_id, bus_id=bus_id, direction=bus_direction,
+                            stop_id=user_stop_id, stop=user_stop['name'], cache_key=cache_key,
+                            stop_from_start_km=round(user_stop_distance_from_start, 3),
+                            bus_from_start_km=round(bus_distance_from_start, 3),
+                            remaining_km=round(remaining_distance, 3))
     
     status = 'ahead' if remaining_distance > 0 else 'passed'
     remaining_distance = max(0, remaining_distance)
     
+    # ETA from the bus's cached table (computed with its last fix)
+    eta_minutes = next((e['eta_minutes'] for e in bus_data.get('stop_etas', []) if e['stop_id'] == user_stop_id), None)
+    
     return jsonify({
         'route_id': route_id,
         'bus_id': bus_id,
@@ -1782,73 +1574,98 @@ def get_passenger_distance(route_id, bus_id, user_stop_id):
         'user_stop_distance_from_start_km': round(user_stop_distance_from_start, 3),
         'direction': bus_direction,
         'status': status,
+        'eta_minutes': eta_minutes,
         'method': 'osrm-pre-calculated-directional'
     })
 # ==================== SOCKETIO HANDLERS ====================
 @socketio.on('connect')
-def handle_connect():
-    print(f'✓ Client connected: {request.sid}')
+@metrics.socketio_handler('connect')
+def handle_connect(auth=None):
+    log_event(session_log, logging.DEBUG, 'connected', sid=request.sid)
     emit('connected', {'message': 'Connected to server', 'sid': request.sid})
 @socketio.on('disconnect')
+@metrics.socketio_handler('disconnect')
 def handle_disconnect():
     """Handle client disconnection - cleans up drivers, buses, and passengers"""
     session_id = request.sid
-    print(f'✗ Client disconnected: {session_id}')
-    
-    # Clean up authenticated drivers and store bus_id for reconnection
-    if session_id in authenticated_drivers:
-        driver_info = authenticated_drivers[session_id]
-        # Store bus_id for potential reconnection
-        active_bus_id = None
-        for route_id, buses in active_buses.items():
-            for bus_id, bus_data in buses.items():
-                if bus_data.get('sid') == session_id:
-                    active_bus_id = bus_id
-                    break
-        if active_bus_id:
-            authenticated_drivers[session_id]['active_bus_id'] = active_bus_id
-        del authenticated_drivers[session_id]
+    log_event(session_log, logging.DEBUG, 'disconnected', sid=session_id)
+    
+    # Clean up authenticated drivers; their bus is parked so a resume token can pick it up
+    driver_info = authenticated_drivers.pop(session_id, None)
+    
+    # Each route actor cleans up after any commands this session already queued on it
+    for route_id in session_index.routes(session_id) | set(rooms(session_id)):
+        route_actors.send(route_id, apply_disconnect, route_id, session_id, driver_info)
+def apply_disconnect(route_id, session_id, driver_info):
+    """Release everything a disconnected session owned on one route (route actor)"""
+    # Everything this session owned, so cleanup never walks other sessions' state
+    owned = session_index.pop_route(session_id, route_id)
     
     # Clean up active buses (drivers)
-    for route_id, buses in list(active_buses.items()):
-        for bus_id, bus_data in list(buses.items()):
-            if bus_data.get('sid') == session_id:
-                print(f"✗ Removing bus {bus_id} from route {route_id}")
-                del active_buses[route_id][bus_id]
-                reset_bus_route_tracking(bus_id)
-                
-                # Notify passengers that bus is no longer active
-                socketio.emit('bus_removed', {
-                    'route_id': route_id,
-                    'bus_id': bus_id,
-                    'message': 'Bus has stopped tracking'
-                }, room=route_id)
-                
-                # Also notify bus status update
-                socketio.emit('bus_status', {
-                    'route_id': route_id,
-                    'bus_id': bus_id,
-                    'status': 'inactive',
-                    'message': 'Bus is no longer active. Waiting for next bus...'
-                }, room=route_id)
+    for _, bus_id in owned['buses']:
+        bus_data = active_buses[route_id].get(bus_id)
+        if not bus_data or bus_data.get('sid') != session_id:
+            continue
+        
+        if driver_info:
+            log_event(session_log, logging.INFO, 'bus_parked', route_id=route_id, bus_id=bus_id,
+                      grace_s=DRIVER_RESUME_GRACE_SECONDS)
+            park_driver_bus(route_id, bus_id, driver_info['driver_id'], session_id)
+            socketio.emit('bus_status', {
+                'route_id': route_id,
+                'bus_id': bus_id,
+                'status': 'reconnecting',
+                'message': 'Bus lost connection, waiting for it to reconnect...'
+            }, room=route_id)
+            continue
+        
+        log_event(session_log, logging.INFO, 'bus_removed', route_id=route_id, bus_id=bus_id)
+        del active_buses[route_id][bus_id]
+        reset_bus_route_tracking(bus_id)
+        
+        # Notify passengers that bus is no longer active
+        socketio.emit('bus_removed', {
+            'route_id': route_id,
+            'bus_id': bus_id,
+            'message': 'Bus has stopped tracking'
+        }, room=route_id)
+        
+        # Also notify bus status update
+        socketio.emit('bus_status', {
+            'route_id': route_id,
+            'bus_id': bus_id,
+            'status': 'inactive',
+            'message': 'Bus is no longer active. Waiting for next bus...'
+        }, room=route_id)
     
     # Clean up reservations and waiting list for disconnected passenger
-    for route_id in list(waiting_reservations.keys()):
-        waiting_reservations[route_id] = deque([w for w in waiting_reservations[route_id] if w['session_id'] != session_id])
+    waiting_reservations[route_id].pop(session_id, None)
     
-    for route_id, buses in bus_reservations.items():
-        for bus_id, reservations in buses.items():
-            bus_reservations[route_id][bus_id] = [r for r in reservations if r['session_id'] != session_id]
+    # Only a seat actually given back can promote from the waiting list
+    if reservation_store.cancel_session(route_id, session_id) is not None:
         assign_from_waiting_list(route_id)
+    
+    # Passenger is no longer waiting at the stops it marked
+    for (_, stop_id), count in owned['waiting_stops'].items():
+        waiting_passengers[route_id][stop_id] = max(0, waiting_passengers[route_id][stop_id] - count)
+        socketio.emit('waiting_update', {
+            'route_id': route_id,
+            'stop_id': stop_id,
+            'count': waiting_passengers[route_id][stop_id]
+        }, room=route_id)
 
 @socketio.on('join_route')
+@metrics.socketio_handler('join_route')
 def handle_join_route(data):
     route_id = data.get('route_id')
     mode = data.get('mode', 'passenger')
     bus_id = data.get('bus_id')
     
+    if redirect_to_route_shard(route_id):
+        return
+    
     join_room(route_id)
-    print(f"✓ Client {request.sid} joined route {route_id} as {mode}")
+    log_event(session_log, logging.INFO, 'joined_route', sid=request.sid, route_id=route_id, mode=mode)
     
     if mode == 'bus':
         if request.sid not in authenticated_drivers:
@@ -1860,13 +1677,17 @@ def handle_join_route(data):
         # Use existing bus_id if driver was previously connected
         if not bus_id and 'active_bus_id' in driver_info:
             bus_id = driver_info['active_bus_id']
-            print(f"✓ Reusing previous bus_id: {bus_id}")
+            log_event(session_log, logging.DEBUG, 'reusing_bus_id', sid=request.sid, bus_id=bus_id)
         elif not bus_id:
             bus_id = str(uuid.uuid4())[:8]
         
+        driver_info['active_bus_id'] = bus_id
+        driver_info['active_route_id'] = route_id
+        
         emit('bus_id_assigned', {
             'bus_id': bus_id,
-            'driver_name': driver_info['name']
+            'driver_name': driver_info['name'],
+            'token': issue_driver_session_token(driver_info, bus_id, route_id)
         })
         
     elif mode == 'passenger':
@@ -1877,8 +1698,7 @@ def handle_join_route(data):
                 if bus_capacity_status.get(bid, False):
                     continue
                 
-                reserved_count = len(bus_reservations[route_id][bid])
-                available_seats = TOTAL_SEATS_PER_BUS - reserved_count
+                available_seats = get_available_seats(route_id, bid)
                 if available_seats <= 0:
                     continue
                 buses.append({
@@ -1894,7 +1714,8 @@ def handle_join_route(data):
                     'is_full': bus_data.get('is_full', False),
                     'progress_pct': bus_data.get('progress_pct', 0),
                     'distance_from_start': bus_data.get('distance_from_start', 0),
-                    'available_seats': available_seats
+                    'available_seats': available_seats,
+                    'stop_etas': bus_data.get('stop_etas', [])
                 })
         
         emit('all_buses_update', {
@@ -1902,23 +1723,34 @@ def handle_join_route(data):
             'buses': buses
         })
 @socketio.on('leave_route')
+@metrics.socketio_handler('leave_route')
 def handle_leave_route(data):
     route_id = data.get('route_id')
     mode = data.get('mode', 'passenger')
     bus_id = data.get('bus_id')
     
     leave_room(route_id)
-    print(f"✗ Client {request.sid} left route {route_id}")
+    log_event(session_log, logging.INFO, 'left_route', sid=request.sid, route_id=route_id)
+    
+    # A driver stopping on purpose must not be resumable onto the bus from a captured token
+    if mode == 'bus' and request.sid in authenticated_drivers:
+        revoke_driver_session_tokens(authenticated_drivers[request.sid]['driver_id'])
     
     if mode == 'bus' and bus_id and route_id in active_buses:
-        if bus_id in active_buses[route_id]:
-            del active_buses[route_id][bus_id]
-            reset_bus_route_tracking(bus_id)
-            socketio.emit('bus_removed', {
-                'route_id': route_id,
-                'bus_id': bus_id
-            }, room=route_id)
+        route_actors.send(route_id, apply_leave_route, request.sid, route_id, bus_id)
+def apply_leave_route(sid, route_id, bus_id):
+    """Take a driver's bus off the route (route actor)"""
+    parked_buses.pop(bus_id, None)
+    session_index.remove_bus(sid, route_id, bus_id)
+    if bus_id in active_buses[route_id]:
+        del active_buses[route_id][bus_id]
+        reset_bus_route_tracking(bus_id)
+        socketio.emit('bus_removed', {
+            'route_id': route_id,
+            'bus_id': bus_id
+        }, room=route_id)
 @socketio.on('bus_location')
+@metrics.socketio_handler('bus_location')
 def handle_bus_location(data):
     if request.sid not in authenticated_drivers:
         emit('authentication_required', {'message': 'Please authenticate first'})
@@ -1935,13 +1767,23 @@ def handle_bus_location(data):
     if not all([route_id, lat, lng, bus_id]):
         return
     
-    current_time = datetime.now()
+    if redirect_to_route_shard(route_id):
+        return
     
     # ✅ Use the device's native GPS speed (sent by the client) as an
     #    instantaneous fallback during GPS surges. Already supported by
     #    calculate_speed_from_history()/predict_gps_speed() — just wire it in.
     gps_speed = data.get('speed')  # native device speed in km/h, or None
     
+    route_actors.send(route_id, apply_bus_location, request.sid, driver_info, route_id, bus_id,
+                      lat, lng, traffic_level, gps_speed, datetime.now())
+def estimate_bus_fix(route_id, bus_id, lat, lng, traffic_level, gps_speed, current_time):
+    """
+    Speed, stop detection and ETAs for one GPS fix (no emits, no CSV logging)
+    Shared by apply_bus_location and the offline replay in backtest.py; updates
+    the per-bus tracking state (speed history, direction, passed stops).
+    Returns None if no stop can be found for the fix.
+    """
     # Calculate speed using waypoint-based distance with GPS fallback
     speed_kmh = calculate_speed_from_history(bus_id, lat, lng, current_time, route_id, gps_speed=gps_speed)
     
@@ -1960,7 +1802,7 @@ def handle_bus_location(data):
     if not result[0]:
         fallback = find_nearest_stop(route_id, lat, lng)
         if not fallback:
-            return
+            return None
         nearest_stop, distance_km = fallback
         direction = 'forward'
     else:
@@ -1969,27 +1811,76 @@ def handle_bus_location(data):
     # ✅ Calculate distance from start BASED ON DIRECTION
     distance_from_start = calculate_distance_from_start(route_id, bus_id, lat, lng, direction)
     
-    # ✅ DEBUG LOGGING
-    print(f"\n{'='*60}")
-    print(f"🚌 BUS LOCATION UPDATE - {bus_id}")
-    print(f" Direction: {direction}")
-    print(f" Distance from start: {distance_from_start:.3f} km")
-    print(f" Current location: ({lat:.6f}, {lng:.6f})")
-    
-    # Check what's in cache
-    bus_stops = get_bus_stops_only(route_id)
-    if direction == 'forward':
-        cache_check = stop_distance_cache.get(f"{route_id}_{nearest_stop['id']}_forward", "NOT IN CACHE")
-    else:
-        cache_check = stop_distance_cache.get(f"{route_id}_{nearest_stop['id']}_backward", "NOT IN CACHE")
+    # Predict ETA to the next stop and to every downstream stop in one batched model call
+    eta_stop_ids, eta_distances = downstream_stop_distances(route_id, direction, distance_from_start)
+    eta_features = np.empty((len(eta_distances) + 1, 2))
+    eta_features[0, 0] = distance_km
+    eta_features[1:, 0] = eta_distances
+    eta_features[:, 1] = traffic_level
+    etas = eta_batcher.submit(eta_features)
+    model_eta_minutes = float(etas[0])
+    etas = eta_corrector.correct(route_id, etas) # Learned from this route's arrivals
+    eta_minutes = float(etas[0])
+    stop_eta_minutes = dict(zip(eta_stop_ids, etas[1:]))
+    eta_source = 'model'
+    
+    # This hour's historical segment profile, when complete, replaces the model (prefix-sum lookup)
+    table_etas = segment_time_table.eta_minutes(route_id, direction, distance_from_start, current_time) if segment_time_table else None
+    if table_etas is not None:
+        stop_eta_minutes.update(zip(*table_etas))
+        eta_minutes = float(stop_eta_minutes.get(nearest_stop['id'], eta_minutes))
+        eta_source = 'segment_table'
+    
+    stop_etas = [
+        {'stop_id': stop_id, 'distance_km': round(float(d), 3), 'eta_minutes': round(float(stop_eta_minutes[stop_id]), 1)}
+        for stop_id, d in zip(eta_stop_ids, eta_distances)
+    ]
     
-    print(f" Nearest stop: {nearest_stop['name']} (ID: {nearest_stop['id']})")
-    print(f" Stop distance in cache: {cache_check}")
-    print(f" Total route distance: {stop_distance_cache.get(f'{route_id}_total_distance', 'NOT IN CACHE')}")
-    print(f"{'='*60}\n")
+    return {
+        'speed_kmh': speed_kmh,
+        'current_stop_id': current_stop_id,
+        'current_stop_name': current_stop_name,
+        'nearest_stop': nearest_stop,
+        'distance_km': distance_km,
+        'direction': direction,
+        'distance_from_start': distance_from_start,
+        'eta_minutes': eta_minutes,
+        'model_eta_minutes': model_eta_minutes,
+        'eta_source': eta_source,
+        'stop_etas': stop_etas
+    }
+def apply_bus_location(sid, driver_info, route_id, bus_id, lat, lng, traffic_level, gps_speed, current_time):
+    """Process one GPS fix and fan out the updates (route actor)"""
+    # Driver is back (possibly via a fresh login), cancel any pending expiry
+    if bus_id in parked_buses:
+        del parked_buses[bus_id]
+    session_index.add_bus(sid, route_id, bus_id)
+    
+    fix = estimate_bus_fix(route_id, bus_id, lat, lng, traffic_level, gps_speed, current_time)
+    if fix is None:
+        return
+    speed_kmh = fix['speed_kmh']
+    current_stop_id = fix['current_stop_id']
+    current_stop_name = fix['current_stop_name']
+    nearest_stop = fix['nearest_stop']
+    distance_km = fix['distance_km']
+    direction = fix['direction']
+    distance_from_start = fix['distance_from_start']
+    eta_minutes = fix['eta_minutes']
+    model_eta_minutes = fix['model_eta_minutes']
+    eta_source = fix['eta_source']
+    stop_etas = fix['stop_etas']
+    
+    # Sampled per-fix diagnostics (LOG_LEVELS=app.fix=DEBUG); fields are only built for sampled fixes
+    if fix_log.enabled():
+        fix_log.debug('bus_fix', route_id=route_id, bus_id=bus_id, direction=direction,
+                      lat=round(lat, 6), lng=round(lng, 6), from_start_km=round(distance_from_start, 3),
+                      next_stop_id=nearest_stop['id'], next_stop=nearest_stop['name'],
+                      stop_from_start_km=round(stop_distance_cache.get(f"{route_id}_{nearest_stop['id']}_{direction}", -1), 3),
+                      route_km=round(stop_distance_cache.get(f'{route_id}_total_distance', -1), 3),
+                      speed_kmh=round(speed_kmh, 2), eta_minutes=round(eta_minutes, 1), eta_source=eta_source)
     
-    # Predict ETA
-    eta_minutes = predict_eta(distance_km, traffic_level)
+    bus_stops = get_bus_stops_only(route_id)
     
     # Get progress info
     last_passed = bus_last_passed_stop.get(bus_id)
@@ -2007,32 +1898,31 @@ def handle_bus_location(data):
     
     # Get bus capacity status
     is_full = bus_capacity_status.get(bus_id, False)
-    reserved_count = len(bus_reservations[route_id][bus_id])
-    available_seats = TOTAL_SEATS_PER_BUS - reserved_count
+    available_seats = get_available_seats(route_id, bus_id)
     
     # Store bus location with enhanced data
-    with bus_data_lock:
-        active_buses[route_id][bus_id] = {
-            'lat': lat,
-            'lng': lng,
-            'traffic_level': traffic_level,
-            'timestamp': current_time.isoformat(),
-            'sid': request.sid,
-            'driver_id': driver_info['driver_id'],
-            'driver_name': driver_info['name'],
-            'speed': round(speed_kmh, 2),
-            'nearest_stop': nearest_stop['name'],
-            'distance_to_stop': round(distance_km, 3),
-            'next_stop_id': nearest_stop['id'],
-            'direction': direction,
-            'stops_passed': stops_passed,
-            'progress_pct': round(progress_pct, 1),
-            'current_stop': current_stop_name,
-            'current_stop_id': current_stop_id,
-            'is_full': is_full or (available_seats <= 0),
-            'available_seats': available_seats,
-            'distance_from_start': round(distance_from_start, 3)
-        }
+    active_buses[route_id][bus_id] = {
+        'lat': lat,
+        'lng': lng,
+        'traffic_level': traffic_level,
+        'timestamp': current_time.isoformat(),
+        'sid': sid,
+        'driver_id': driver_info['driver_id'],
+        'driver_name': driver_info['name'],
+        'speed': round(speed_kmh, 2),
+        'nearest_stop': nearest_stop['name'],
+        'distance_to_stop': round(distance_km, 3),
+        'next_stop_id': nearest_stop['id'],
+        'direction': direction,
+        'stops_passed': stops_passed,
+        'progress_pct': round(progress_pct, 1),
+        'current_stop': current_stop_name,
+        'current_stop_id': current_stop_id,
+        'is_full': is_full or (available_seats <= 0),
+        'available_seats': available_seats,
+        'distance_from_start': round(distance_from_start, 3),
+        'stop_etas': stop_etas # Valid until the next fix
+    }
     
     # Log location
     log_location_to_csv(route_id, bus_id, lat, lng, traffic_level,
@@ -2042,32 +1932,35 @@ def handle_bus_location(data):
     
     # Log arrival when within 100 meters
     if distance_km < 0.1:
-        bus_stop_key = f"{bus_id}_{nearest_stop['id']}"
+        prev_prediction = bus_arrival_times.get(bus_id, {}).pop(nearest_stop['id'], None)
+        predicted_time_min = eta_minutes
         actual_time_min = eta_minutes
         
-        if bus_stop_key in bus_arrival_times:
-            prev_prediction = bus_arrival_times[bus_stop_key]
+        if prev_prediction:
             time_elapsed = (current_time - prev_prediction['time']).total_seconds() / 60
+            predicted_time_min = prev_prediction['predicted_eta']
             actual_time_min = time_elapsed
+            # Online feedback: what the model said when the bus was first headed here vs what it took
+            eta_corrector.observe(route_id, prev_prediction['model_eta'], actual_time_min)
         
         log_arrival(route_id, nearest_stop['id'], nearest_stop['name'],
-                   eta_minutes, actual_time_min, distance_km, bus_id,
+                   predicted_time_min, actual_time_min, distance_km, bus_id,
                    driver_info['driver_id'], speed_kmh, distance_from_start, available_seats)
-        
-        if bus_stop_key in bus_arrival_times:
-            del bus_arrival_times[bus_stop_key]
     else:
-        bus_stop_key = f"{bus_id}_{nearest_stop['id']}"
-        bus_arrival_times[bus_stop_key] = {
-            'time': current_time,
-            'predicted_eta': eta_minutes
-        }
+        # Keep the first prediction made for this stop so the arrival measures the whole approach
+        prev_prediction = bus_arrival_times.get(bus_id, {}).get(nearest_stop['id'])
+        if not prev_prediction or (current_time - prev_prediction['time']).total_seconds() > MAX_ACTUAL_MINUTES * 60:
+            bus_arrival_times[bus_id][nearest_stop['id']] = {
+                'time': current_time,
+                'predicted_eta': eta_minutes,
+                'model_eta': model_eta_minutes
+            }
     
     # Direction indicator
     direction_symbol = '→' if direction == 'forward' else '←'
     
     # Send update to driver with waiting stats
-    emit('bus_info_update', {
+    socketio.emit('bus_info_update', {
         'speed': round(speed_kmh, 2),
         'nearest_stop': nearest_stop['name'],
         'distance_to_stop': round(distance_km, 3),
@@ -2083,8 +1976,10 @@ def handle_bus_location(data):
         'current_stop_id': current_stop_id,
         'is_full': is_full or (available_seats <= 0),
         'available_seats': available_seats,
-        'waiting_passengers': dict(waiting_passengers.get(route_id, {}))
-    })
+        'waiting_passengers': dict(waiting_passengers.get(route_id, {})),
+        'stop_etas': stop_etas,
+        'eta_source': eta_source
+    }, to=sid)
     
     # Broadcast to passengers (only if bus is not full)
     if available_seats > 0 and not is_full:
@@ -2108,17 +2003,20 @@ def handle_bus_location(data):
             'is_full': is_full or (available_seats <= 0),
             'available_seats': available_seats,
             'progress_pct': round(progress_pct, 1),
-            'distance_from_start': round(distance_from_start, 3)
-        }, room=route_id, include_self=False)
+            'distance_from_start': round(distance_from_start, 3),
+            'stop_etas': stop_etas,
+            'eta_source': eta_source
+        }, room=route_id, skip_sid=sid)
     
     # Update bus count
     non_full_count = sum(1 for bid, bdata in active_buses[route_id].items()
-                         if not bus_capacity_status.get(bid, False) and (TOTAL_SEATS_PER_BUS - len(bus_reservations[route_id][bid])) > 0)
+                         if not bus_capacity_status.get(bid, False) and get_available_seats(route_id, bid) > 0)
     socketio.emit('bus_count_update', {
         'route_id': route_id,
         'count': non_full_count
     }, room=route_id)
 @socketio.on('bus_capacity_update')
+@metrics.socketio_handler('bus_capacity_update')
 def handle_bus_capacity_update(data):
     """Update bus capacity status"""
     if request.sid not in authenticated_drivers:
@@ -2129,38 +2027,60 @@ def handle_bus_capacity_update(data):
     is_full = data.get('is_full', False)
     route_id = data.get('route_id')
     
-    if not bus_id:
+    if not bus_id or not route_id:
+        return
+    
+    if redirect_to_route_shard(route_id):
+        return
+    
+    route_actors.send(route_id, apply_bus_capacity_update, request.sid, route_id, bus_id, is_full)
+def apply_bus_capacity_update(sid, route_id, bus_id, is_full):
+    """Mark a bus full/available and re-run waiting list promotion (route actor)"""
+    # Only the bus's own driver may flag it: the session sending its fixes, or before the
+    # first fix, the driver who joined the route with this bus
+    bus_data = active_buses[route_id].get(bus_id)
+    if bus_data:
+        owns_bus = bus_data.get('sid') == sid
+    else:
+        driver_info = authenticated_drivers.get(sid, {})
+        owns_bus = driver_info.get('active_bus_id') == bus_id and driver_info.get('active_route_id') == route_id
+    if not owns_bus:
+        log_event(log, logging.WARNING, 'capacity_rejected', route_id=route_id, bus_id=bus_id, sid=sid)
+        socketio.emit('capacity_updated', {
+            'bus_id': bus_id,
+            'is_full': bus_capacity_status.get(bus_id, False),
+            'success': False,
+            'message': 'Bus is not active on this route'
+        }, to=sid)
         return
     
     # Update capacity status
     bus_capacity_status[bus_id] = is_full
     
     # Update in active_buses
-    if route_id and route_id in active_buses and bus_id in active_buses[route_id]:
-        active_buses[route_id][bus_id]['is_full'] = is_full
+    if bus_data:
+        bus_data['is_full'] = is_full
     
-    print(f"✓ Bus {bus_id} capacity updated: {'FULL' if is_full else 'AVAILABLE'}")
+    log_event(log, logging.INFO, 'capacity_updated', route_id=route_id, bus_id=bus_id, is_full=is_full)
     
     # Assign from waiting list
-    if route_id:
-        assign_from_waiting_list(route_id)
+    assign_from_waiting_list(route_id)
     
     # Notify driver
-    emit('capacity_updated', {
+    socketio.emit('capacity_updated', {
         'bus_id': bus_id,
         'is_full': is_full,
         'message': 'Bus marked as FULL' if is_full else 'Bus marked as AVAILABLE'
-    })
+    }, to=sid)
     
     # If bus is now full, remove it from passenger view immediately (exclude self)
-    if is_full and route_id:
-        socketio.emit('bus_removed', {'bus_id': bus_id, 'reason': 'full'}, room=route_id, include_self=False)
+    if is_full:
+        socketio.emit('bus_removed', {'bus_id': bus_id, 'reason': 'full'}, room=route_id, skip_sid=sid)
     
     # If bus is now available, add it back
-    elif not is_full and route_id and route_id in active_buses and bus_id in active_buses[route_id]:
+    elif bus_id in active_buses[route_id]:
         bus_data = active_buses[route_id][bus_id]
-        reserved_count = len(bus_reservations[route_id][bus_id])
-        available_seats = TOTAL_SEATS_PER_BUS - reserved_count
+        available_seats = get_available_seats(route_id, bus_id)
         socketio.emit('bus_update', {
             'route_id': route_id,
             'bus_id': bus_id,
@@ -2182,9 +2102,10 @@ def handle_bus_capacity_update(data):
             'available_seats': available_seats,
             'progress_pct': bus_data.get('progress_pct', 0),
             'distance_from_start': bus_data.get('distance_from_start', 0)
-        }, room=route_id, include_self=False)
+        }, room=route_id, skip_sid=sid)
 
 @socketio.on('passenger_waiting')
+@metrics.socketio_handler('passenger_waiting')
 def handle_passenger_waiting(data):
     route_id = data.get('route_id')
     stop_id = data.get('stop_id')
@@ -2193,11 +2114,19 @@ def handle_passenger_waiting(data):
     if not all([route_id, stop_id is not None]):
         return
     
+    if redirect_to_route_shard(route_id):
+        return
+    
+    route_actors.send(route_id, apply_passenger_waiting, request.sid, route_id, stop_id, is_waiting)
+def apply_passenger_waiting(sid, route_id, stop_id, is_waiting):
+    """Update the waiting count at a stop (route actor)"""
     if is_waiting:
         waiting_passengers[route_id][stop_id] += 1
+        session_index.add_waiting_stop(sid, route_id, stop_id)
     else:
         if waiting_passengers[route_id][stop_id] > 0:
             waiting_passengers[route_id][stop_id] -= 1
+        session_index.remove_waiting_stop(sid, route_id, stop_id)
     
     socketio.emit('waiting_update', {
         'route_id': route_id,
@@ -2207,14 +2136,21 @@ def handle_passenger_waiting(data):
     
     socketio.emit('waiting_stats', dict(waiting_passengers))
 @socketio.on('reserve_seat')
+@metrics.socketio_handler('reserve_seat')
 def handle_reserve_seat(data):
     route_id = data.get('route_id')
     passenger_name = data.get('passenger_name', 'Anonymous')
     preferred_bus_id = data.get('preferred_bus_id')
     
-    result = reserve_seat(route_id, passenger_name, request.sid, preferred_bus_id)
+    if redirect_to_route_shard(route_id):
+        return
+    
+    route_actors.send(route_id, apply_reserve_seat, request.sid, route_id, passenger_name, preferred_bus_id)
+def apply_reserve_seat(sid, route_id, passenger_name, preferred_bus_id):
+    """Book a seat for a socket client and tell the route (route actor)"""
+    result = reserve_seat(route_id, passenger_name, sid, preferred_bus_id, sid=sid)
     
-    emit('reservation_result', result)
+    socketio.emit('reservation_result', result, to=sid)
     
     if result['success']:
         socketio.emit('reservation_update', {
@@ -2224,14 +2160,13 @@ def handle_reserve_seat(data):
             'message': result['message']
         }, room=route_id)
 @socketio.on('driver_authenticate')
+@metrics.socketio_handler('driver_authenticate')
 def handle_driver_authenticate(data):
     driver_id = data.get('driver_id')
     password = data.get('password')
     
-    print(f"DEBUG: Driver authenticate received - ID: {driver_id}, Password length: {len(password) if password else 0}")
-    
     if not driver_id or not password:
-        print("DEBUG: Missing driver_id or password")
+        log_event(auth_log, logging.DEBUG, 'auth_missing_credentials', sid=request.sid)
         emit('driver_authenticated', {
             'success': False,
             'message': 'Driver ID and password required'
@@ -2241,19 +2176,98 @@ def handle_driver_authenticate(data):
     driver = verify_driver(driver_id, password)
     
     if driver:
-        print(f"DEBUG: Authentication SUCCESS for {driver_id}")
+        log_event(auth_log, logging.INFO, 'auth_succeeded', driver_id=driver_id, sid=request.sid)
         authenticated_drivers[request.sid] = driver
         emit('driver_authenticated', {
             'success': True,
             'driver': driver,
+            'token': issue_driver_session_token(driver),
             'message': 'Authentication successful'
         })
     else:
-        print(f"DEBUG: Authentication FAILED for {driver_id}")
+        log_event(auth_log, logging.WARNING, 'auth_failed', driver_id=driver_id, sid=request.sid)
         emit('driver_authenticated', {
             'success': False,
             'message': 'Invalid credentials'
         })
+@socketio.on('driver_logout')
+@metrics.socketio_handler('driver_logout')
+def handle_driver_logout(data=None):
+    """Log a driver out: take its bus off the route and revoke its session tokens"""
+    driver_info = authenticated_drivers.pop(request.sid, None)
+    if driver_info is None:
+        return
+    
+    log_event(auth_log, logging.INFO, 'driver_logged_out', driver_id=driver_info['driver_id'], sid=request.sid)
+    revoke_driver_session_tokens(driver_info['driver_id'])
+    
+    route_id = driver_info.get('active_route_id')
+    bus_id = driver_info.get('active_bus_id')
+    if route_id in STOP_COORDS and bus_id and owns_route(route_id):
+        leave_room(route_id)
+        route_actors.send(route_id, apply_leave_route, request.sid, route_id, bus_id)
+    
+    emit('driver_logged_out', {'success': True})
+@socketio.on('driver_resume')
+@metrics.socketio_handler('driver_resume')
+def handle_driver_resume(data):
+    """Re-authenticate a reconnecting driver from a signed session token (no password check)"""
+    session = load_driver_session_token(data.get('token'))
+    
+    # A driver removed from DRIVERS_FILE loses access now, not when the token expires
+    if session and find_driver(session['driver']['driver_id']) is None:
+        log_event(auth_log, logging.WARNING, 'resume_unknown_driver', driver_id=session['driver']['driver_id'], sid=request.sid)
+        session = None
+    
+    if not session:
+        emit('driver_resumed', {
+            'success': False,
+            'message': 'Session expired, please log in again'
+        })
+        return
+    
+    driver = dict(session['driver'])
+    bus_id = session.get('bus_id')
+    route_id = session.get('route_id')
+    state_restored = False
+    
+    if redirect_to_route_shard(route_id):
+        return
+    
+    if bus_id and route_id in STOP_COORDS:
+        join_room(route_id)
+        driver['active_bus_id'] = bus_id
+        driver['active_route_id'] = route_id
+        state_restored = route_actors.call(route_id, resume_parked_bus, request.sid, driver['driver_id'], route_id, bus_id)
+    
+    authenticated_drivers[request.sid] = driver
+    
+    emit('driver_resumed', {
+        'success': True,
+        'driver': session['driver'],
+        'bus_id': bus_id,
+        'route_id': route_id,
+        'state_restored': state_restored,
+        'token': issue_driver_session_token(driver, bus_id, route_id)
+    })
+def resume_parked_bus(sid, driver_id, route_id, bus_id):
+    """Hand a parked bus back to its reconnected driver; returns True if it was still parked (route actor)"""
+    parked = parked_buses.get(bus_id)
+    if not parked or parked['driver_id'] != driver_id or bus_id not in active_buses[route_id]:
+        return False
+    
+    del parked_buses[bus_id]
+    active_buses[route_id][bus_id]['sid'] = sid
+    session_index.add_bus(sid, route_id, bus_id)
+    log_event(session_log, logging.INFO, 'bus_resumed', driver_id=driver_id, route_id=route_id, bus_id=bus_id)
+    
+    socketio.emit('bus_status', {
+        'route_id': route_id,
+        'bus_id': bus_id,
+        'status': 'active',
+        'message': 'Bus reconnected'
+    }, room=route_id)
+    return True
 # ==================== MAIN SERVER STARTUP(azure production code) ====================
 '''if __name__ == '__main__':
     print("=" * 80)
@@ -2344,7 +2358,12 @@ def initialize_app():
     print("=" * 80)
     print(f"📅 Server Start Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S UTC')}")
     print(f"👤 Logged in as: Terrificdatabytes")
+    if is_sharded():
+        print(f"🧩 Shard {SHARD_INDEX + 1}/{SHARD_COUNT}" + (f" (message queue: {SOCKETIO_MESSAGE_QUEUE})" if SOCKETIO_MESSAGE_QUEUE else " (⚠ no message queue set)"))
     print("=" * 80)
+    if not DRIVER_SESSIONS_ENABLED:
+        print("⚠ SECRET_KEY is unset or the default: driver resume tokens are disabled (drivers log in again after a reconnect)")
+    mark_startup_phase('module_setup')
     
     # Initialize drivers file
     if not os.path.isfile(DRIVERS_FILE):
@@ -2362,31 +2381,37 @@ def initialize_app():
                 datetime.now().isoformat()
             ])
         print("✓ Created default driver: DRIVER001 / admin123")
+    mark_startup_phase('drivers_file')
     
-    # ✅ CRITICAL: Initialize routes with waypoints
+    # ✅ CRITICAL: Load compiled routes (waypoints, stop distances, spatial index)
     print("\n🔄 Initializing routes...")
-    initialize_routes_with_waypoints()
-    
-    # ✅ Verify routes were loaded
-    if not STOP_COORDS or len(STOP_COORDS) == 0:
-        print("❌ ERROR: No routes loaded! Using ORIGINAL_STOPS as fallback")
-        
-        STOP_COORDS = {k: [s.copy() for s in v] for k, v in ORIGINAL_STOPS.items()}
-        for route_id in STOP_COORDS:
-            for stop in STOP_COORDS[route_id]:
-                stop['is_stop'] = True
+    initialize_routes()
     
     print(f"✓ Routes loaded: {list(STOP_COORDS.keys())}")
     for route_id, points in STOP_COORDS.items():
         stops = [p for p in points if p.get('is_stop', True)]
-        print(f"  - Route {route_id}: {len(stops)} stops, {len(points)} total points")
-    
-    # ✅ Load or calculate stop distances
-    if not load_stop_distances_from_file():
-        print("\n🔄 No cached distances found, calculating...")
-        precalculate_stop_distances_manual()
-    else:
-        print("✓ Using cached stop distances")
+        owner = "" if owns_route(route_id) else f" (served by shard {route_shard(route_id) + 1})"
+        print(f"  - Route {route_id}: {len(stops)} stops, {len(points)} total points{owner}")
+    mark_startup_phase('routes')
+    
+    # Measure hub responsiveness for /api/hub_latency
+    socketio.start_background_task(hub_latency_probe.run, socketio.sleep)
+    if OFFLOAD_BLOCKING:
+        print("✓ Model and CSV work offloaded to the eventlet thread pool")
+    if REAPER_INTERVAL > 0:
+        socketio.start_background_task(state_reaper.run, socketio.sleep)
+        print(f"✓ Reaping buses silent for {BUS_STALE_SECONDS}s and orphaned state every {REAPER_INTERVAL}s")
+    # Pick up models published by train.py without a restart
+    if MODEL_CLASS_AVAILABLE and MODEL_RELOAD_INTERVAL > 0:
+        socketio.start_background_task(model_registry.watch, socketio.sleep, MODEL_RELOAD_INTERVAL)
+        print(f"✓ Watching {MODELS_DIR}/ for new models every {MODEL_RELOAD_INTERVAL}s")
+    socketio.start_background_task(eta_corrector.autosave, socketio.sleep, 60)
+    mark_startup_phase('background_tasks')
+    
+    print("\n⏱ Startup time by phase:")
+    for phase, ms in startup_phases.items():
+        print(f"  - {phase:<18} {ms:>8.1f} ms")
+    print(f"  = {'total':<18} {sum(startup_phases.values()):>8.1f} ms")
     
     print("\n" + "="*80)
     print("✓ Server initialization complete")
@@ -2395,9 +2420,10 @@ def initialize_app():
 # ✅ Run initialization when module is imported (works with Gunicorn)
 initialize_app()
 
-def reset_bus_route_tracking(bus_id):
-    """Reset all tracking data for a bus when it goes offline"""
-    with bus_data_lock:
+def reset_bus_route_tracking(bus_id, keep_capacity=False):
+    """Reset all tracking data for a bus when it goes offline (keep_capacity: leave its full/available flag)"""
+    retired_buses[bus_id] = time.time()
+    with lock_manager.bus(bus_id):
         if bus_id in bus_speed_history:
             del bus_speed_history[bus_id]
         if bus_id in bus_start_location:
@@ -2412,8 +2438,10 @@ def reset_bus_route_tracking(bus_id):
             del bus_position_history[bus_id]
         if bus_id in bus_current_stop:
             del bus_current_stop[bus_id]
-        if bus_id in bus_capacity_status:
+        if bus_id in bus_capacity_status and not keep_capacity:
             del bus_capacity_status[bus_id]
+        bus_last_speed.pop(bus_id, None)
+        bus_logged_locations.pop(bus_id, None)
 
 # ==================== OPTIONAL: For Local Development ====================
 if __name__ == '__main__':
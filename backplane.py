@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Socket.IO Backplane
+Minimal in-repo pub/sub broker so route shards running in separate processes
+can emit into each other's Socket.IO rooms without Redis
+
+Run the broker:     python backplane.py --port 6380
+Point shards at it: SOCKETIO_MESSAGE_QUEUE=backplane://127.0.0.1:6380
+
+Messages are newline-delimited JSON (never pickle), fanned out to every
+other connected shard.
+"""
+import argparse
+import json
+import socket
+import socketserver
+import threading
+from urllib.parse import urlparse
+
+from socketio import PubSubManager
+
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        broker = self.server
+        self.write_lock = threading.Lock()
+        with broker.clients_lock:
+            broker.clients.add(self)
+        try:
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                with broker.clients_lock:
+                    peers = [c for c in broker.clients if c is not self]
+                for peer in peers:
+                    try:
+                        with peer.write_lock:
+                            peer.wfile.write(line)
+                            peer.wfile.flush()
+                    except OSError:
+                        pass
+        finally:
+            with broker.clients_lock:
+                broker.clients.discard(self)
+
+
+class BackplaneBroker(socketserver.ThreadingTCPServer):
+    """Fan-out broker: every line a shard publishes is relayed to all other shards"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=6380):
+        super().__init__((host, port), _BrokerHandler)
+        self.clients = set()
+        self.clients_lock = threading.Lock()
+
+    def start_in_thread(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class BackplaneManager(PubSubManager):
+    """python-socketio client manager that publishes through a BackplaneBroker
+
+    Pass as flask_socketio.SocketIO(client_manager=BackplaneManager('backplane://host:port')).
+    """
+    name = 'backplane'
+
+    def __init__(self, url='backplane://127.0.0.1:6380', channel='socketio', write_only=False, logger=None):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or '127.0.0.1'
+        self.port = parsed.port or 6380
+        self._sock = None
+        self._rfile = None
+        self._send_lock = threading.Lock()
+        self._socket_module = socket
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    def initialize(self):
+        # The listener runs as a server background task; under eventlet it must use green sockets
+        if self.server.async_mode == 'eventlet':
+            from eventlet.green import socket as green_socket
+            from eventlet.semaphore import Semaphore
+            self._socket_module = green_socket
+            self._send_lock = Semaphore()
+        super().initialize()
+
+    def _connect(self):
+        self._sock = self._socket_module.create_connection((self.host, self.port))
+        self._rfile = self._sock.makefile('rb')
+
+    def _publish(self, data):
+        line = (json.dumps({'channel': self.channel, 'message': data}) + '\n').encode()
+        for attempt in range(2):
+            try:
+                with self._send_lock:
+                    if self._sock is None:
+                        self._connect()
+                    self._sock.sendall(line)
+                return
+            except OSError:
+                self._sock = None
+                if attempt:
+                    self._get_logger().error('Cannot publish to backplane %s:%s', self.host, self.port)
+
+    def _listen(self):
+        retry_sleep = 1
+        while True:
+            try:
+                if self._sock is None:
+                    with self._send_lock:
+                        self._connect()
+                retry_sleep = 1
+                for line in self._rfile:
+                    envelope = json.loads(line)
+                    if envelope.get('channel') == self.channel:
+                        yield envelope['message']
+                raise OSError('backplane connection closed')
+            except (OSError, ValueError):
+                self._sock = None
+                self._get_logger().error('Backplane connection lost, retrying in %ss', retry_sleep)
+                self.server.sleep(retry_sleep)
+                retry_sleep = min(retry_sleep * 2, 60)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Socket.IO backplane broker for route shards')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6380)
+    args = parser.parse_args()
+
+    broker = BackplaneBroker(args.host, args.port)
+    print(f"🔌 Backplane broker listening on {args.host}:{args.port}")
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        print("\n✗ Shutting down backplane...")
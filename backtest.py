@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+ETA Backtest
+Replays recorded fixes from bus_locations.csv through the server's own per-fix
+pipeline (app.estimate_bus_fix: speed, stop detection, direction, ETAs) offline
+and as fast as the CPU allows, then scores every ETA against the time the bus
+actually reached that stop later in the same trip
+
+python backtest.py                                   # all routes, one worker per CPU
+python backtest.py --route 48AC --since 2025-10-01   # one route, recent fixes only
+python backtest.py --raw-model --json report.json    # model only (no segment tables / online corrections)
+
+Buses are independent, so they are split across worker processes; each worker
+imports app once and replays its buses in timestamp order.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import io
+import json
+import os
+import time
+
+import numpy as np
+
+from segment_times import _split_trips
+
+LOCATIONS_FILE = 'bus_locations.csv'
+HORIZON_BUCKETS = [(0, 5), (5, 15), (15, 30), (30, None)] # minutes until the actual arrival
+
+_app = None
+
+
+def load_fixes(path=LOCATIONS_FILE, routes=None, since=None, until=None):
+    """[(route_id, bus_id, epoch seconds, lat, lng, traffic)] per bus, in timestamp order"""
+    import pandas as pd
+
+    df = pd.read_csv(path, usecols=['timestamp', 'route_id', 'bus_id', 'latitude', 'longitude', 'traffic_level'])
+    df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+    df['route_id'] = df['route_id'].astype(str)
+    df = df.dropna()
+    if routes:
+        df = df[df['route_id'].isin(routes)]
+    if since:
+        df = df[df['timestamp'] >= pd.Timestamp(since)]
+    if until:
+        df = df[df['timestamp'] < pd.Timestamp(until)]
+    df = df.sort_values(['route_id', 'bus_id', 'timestamp'], kind='stable')
+
+    traces = []
+    for (route_id, bus_id), trace in df.groupby(['route_id', 'bus_id'], sort=False):
+        traces.append((
+            route_id,
+            str(bus_id),
+            trace['timestamp'].to_numpy('datetime64[ns]').astype('int64') / 1e9,
+            trace['latitude'].to_numpy(dtype=float),
+            trace['longitude'].to_numpy(dtype=float),
+            trace['traffic_level'].to_numpy(dtype=float)
+        ))
+    return traces
+
+
+def _init_worker(raw_model):
+    """Import the server once per process, quietly, with everything running inline"""
+    global _app
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app
+        import offload
+        from online_eta import OnlineETACorrector
+    offload.configure(False)
+    if raw_model:
+        app.segment_time_table = None
+        app.eta_corrector = OnlineETACorrector(os.devnull)
+    _app = app
+
+
+def _score_trip(route_id, times, chainage, directions, predictions):
+    """Errors of every ETA made during one trip against the trip's own stop crossings"""
+    values, counts = np.unique(directions, return_counts=True)
+    direction = values[np.argmax(counts)]
+    stop_ids, stop_chainage = _app.get_stop_chainage(route_id, direction)
+
+    # When the bus crossed each stop (only stops inside the observed span)
+    reached = np.maximum.accumulate(chainage)
+    crossed = np.interp(stop_chainage, reached, times)
+    inside = (stop_chainage > reached[0]) & (stop_chainage <= reached[-1])
+    crossed_at = {stop_id: t for stop_id, t, ok in zip(stop_ids, crossed, inside) if ok}
+
+    rows = []
+    for t, fix_direction, stop_etas in zip(times, directions, predictions):
+        if fix_direction != direction:
+            continue
+        for entry in stop_etas:
+            arrival = crossed_at.get(entry['stop_id'])
+            if arrival is not None and arrival >= t:
+                actual = (arrival - t) / 60
+                rows.append((entry['stop_id'], actual, entry['eta_minutes'] - actual))
+    return rows
+
+
+def replay_traces(traces):
+    """Replay a list of bus traces; returns per-fix CPU times and (route, stop, actual, error) rows"""
+    from datetime import datetime
+
+    cpu_us = []
+    errors = []
+    skipped = 0
+    with contextlib.redirect_stdout(io.StringIO()) as sink:
+        for route_id, bus_id, times, lats, lngs, traffic in traces:
+            # Namespaced so the same bus id on two routes never shares tracking state
+            replay_bus_id = f"replay:{route_id}:{bus_id}"
+            _app.reset_bus_route_tracking(replay_bus_id)
+
+            kept_times, chainage, directions, predictions = [], [], [], []
+            for t, lat, lng, level in zip(times, lats, lngs, traffic):
+                start = time.process_time()
+                fix = _app.estimate_bus_fix(route_id, replay_bus_id, lat, lng, level, None, datetime.fromtimestamp(t))
+                cpu_us.append((time.process_time() - start) * 1e6)
+                if fix is None:
+                    skipped += 1
+                    continue
+                kept_times.append(t)
+                chainage.append(fix['distance_from_start'])
+                directions.append(fix['direction'])
+                predictions.append(fix['stop_etas'])
+            _app.reset_bus_route_tracking(replay_bus_id)
+
+            kept_times = np.array(kept_times)
+            chainage = np.array(chainage)
+            for trip in np.split(np.arange(len(kept_times)), _split_trips(kept_times, chainage)):
+                if len(trip) < 2:
+                    continue
+                rows = _score_trip(route_id, kept_times[trip], chainage[trip],
+                                   np.array(directions)[trip], [predictions[i] for i in trip])
+                errors.extend((route_id, stop_id, actual, error) for stop_id, actual, error in rows)
+            sink.seek(0)
+            sink.truncate() # Drop the pipeline's debug prints as we go
+
+    return {'cpu_us': cpu_us, 'errors': errors, 'skipped': skipped}
+
+
+def _percentiles(values, ps=(50, 90, 95)):
+    return {f"p{p}": round(float(v), 2) for p, v in zip(ps, np.percentile(values, ps))}
+
+
+def _error_summary(actual, error):
+    abs_error = np.abs(error)
+    return {'n': int(len(error)), 'mae': round(float(abs_error.mean()), 2),
+            'bias': round(float(error.mean()), 2), **_percentiles(abs_error)}
+
+
+def build_report(results, wall_seconds, data_span_seconds, n_fixes):
+    cpu_us = np.concatenate([np.asarray(r['cpu_us']) for r in results]) if results else np.array([])
+    rows = [row for r in results for row in r['errors']]
+    report = {
+        'fixes': n_fixes,
+        'skipped_fixes': sum(r['skipped'] for r in results),
+        'scored_etas': len(rows),
+        'wall_seconds': round(wall_seconds, 2),
+        'speedup_vs_real_time': round(data_span_seconds / wall_seconds, 1) if wall_seconds > 0 else None,
+        'cpu_us_per_fix': _percentiles(cpu_us, (50, 95, 99)) if len(cpu_us) else {},
+        'routes': {}
+    }
+    if not rows:
+        return report
+
+    route_ids = np.array([row[0] for row in rows])
+    stop_ids = np.array([row[1] for row in rows])
+    actual = np.array([row[2] for row in rows])
+    error = np.array([row[3] for row in rows])
+    for route_id in sorted(set(route_ids)):
+        on_route = route_ids == route_id
+        route_report = _error_summary(actual[on_route], error[on_route])
+
+        route_report['by_horizon'] = {}
+        for low, high in HORIZON_BUCKETS:
+            in_bucket = on_route & (actual >= low) & ((actual < high) if high is not None else True)
+            if in_bucket.any():
+                label = f"{low}-{high}min" if high is not None else f"{low}+min"
+                route_report['by_horizon'][label] = _error_summary(actual[in_bucket], error[in_bucket])
+
+        route_report['by_stop'] = {}
+        for stop_id in sorted(set(stop_ids[on_route])):
+            at_stop = on_route & (stop_ids == stop_id)
+            route_report['by_stop'][str(stop_id)] = _error_summary(actual[at_stop], error[at_stop])
+        report['routes'][route_id] = route_report
+    return report
+
+
+def print_report(report):
+    print("=" * 70)
+    print("📊 ETA Backtest")
+    print("=" * 70)
+    print(f"  Fixes replayed:   {report['fixes']} ({report['skipped_fixes']} without a stop)")
+    print(f"  ETAs scored:      {report['scored_etas']}")
+    print(f"  Wall time:        {report['wall_seconds']}s ({report['speedup_vs_real_time']}x real time)")
+    cpu = report['cpu_us_per_fix']
+    if cpu:
+        print(f"  CPU per fix (µs): p50 {cpu['p50']}  p95 {cpu['p95']}  p99 {cpu['p99']}")
+
+    for route_id, r in report['routes'].items():
+        print(f"\n🛣️ Route {route_id}: n={r['n']}  MAE {r['mae']} min  bias {r['bias']:+} min  "
+              f"|err| p50 {r['p50']}  p90 {r['p90']}  p95 {r['p95']}")
+        for label, h in r['by_horizon'].items():
+            print(f"  {label:<10} n={h['n']:<7} MAE {h['mae']:<6} p90 {h['p90']}")
+        print(f"  {'Stop':<8} {'n':<7} {'MAE':<7} {'bias':<7} {'p90':<7}")
+        for stop_id, s in r['by_stop'].items():
+            print(f"  {stop_id:<8} {s['n']:<7} {s['mae']:<7} {s['bias']:<+7} {s['p90']:<7}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay logged fixes through the ETA pipeline and score the ETAs')
+    parser.add_argument('--file', default=LOCATIONS_FILE)
+    parser.add_argument('--route', action='append', help='Only this route (repeatable)')
+    parser.add_argument('--since', help='Only fixes at or after this timestamp')
+    parser.add_argument('--until', help='Only fixes before this timestamp')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--raw-model', action='store_true',
+                        help='Score the model alone (ignore segment tables and online corrections)')
+    parser.add_argument('--json', metavar='PATH', help='Also write the report as JSON')
+    args = parser.parse_args()
+
+    traces = load_fixes(args.file, args.route, args.since, args.until)
+    if not traces:
+        print(f"⚠ No fixes to replay in {args.file}")
+        raise SystemExit(1)
+    n_fixes = sum(len(trace[2]) for trace in traces)
+    data_span = sum(trace[2][-1] - trace[2][0] for trace in traces)
+
+    # Largest buses first, dealt round-robin, so workers finish together
+    workers = max(1, min(args.workers, len(traces)))
+    traces.sort(key=lambda trace: len(trace[2]), reverse=True)
+    chunks = [traces[i::workers] for i in range(workers)]
+
+    print(f"🔁 Replaying {n_fixes} fixes from {len(traces)} buses on {workers} worker(s)...")
+    start = time.perf_counter()
+    if workers == 1:
+        _init_worker(args.raw_model)
+        results = [replay_traces(chunks[0])]
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(args.raw_model,)) as pool:
+            results = list(pool.map(replay_traces, chunks))
+    report = build_report(results, time.perf_counter() - start, data_span, n_fixes)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Report written to {args.json}")
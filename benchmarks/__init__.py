@@ -0,0 +1,10 @@
+"""
+Micro-benchmarks for the per-fix geometry and speed hot paths in app.py
+
+python -m benchmarks                      # run, compare with benchmarks/baseline.json
+python -m benchmarks --save-baseline      # record the current numbers as the baseline
+python -m benchmarks --case speed --fail-on-regression
+
+Inputs are deterministic synthetic fleets driven along the real routes in
+route_stops.ORIGINAL_STOPS (fleet.py); the cases are in hotpaths.py.
+"""
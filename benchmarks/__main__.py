@@ -0,0 +1,198 @@
+"""
+Runner: python -m benchmarks [--case NAME] [--save-baseline] [--fail-on-regression] [--json PATH]
+
+Per case it reports ops/sec (median and best of --repeat timed passes, each
+running over the whole fleet as many times as it takes to last MIN_PASS_SECONDS),
+transient allocation per call (tracemalloc peak above the starting point,
+averaged over a sample of calls), blocks still allocated afterwards per call
+(cache growth / leaks), and the median's change against the baseline.
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.fleet import build_fleet, interleave
+from benchmarks.hotpaths import CASES
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+ALLOC_SAMPLE_CALLS = 500
+MIN_PASS_SECONDS = 0.2 # Fast cases repeat the fleet within a pass so timer and scheduler noise averages out
+REGRESSION_THRESHOLD = 0.15 # Flag cases more than 15% slower than the baseline (unless the case sets its own)
+
+
+def load_app():
+    """Import the server quietly with blocking work kept inline (as backtest.py does)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app
+        import offload
+    offload.configure(False)
+    return app
+
+
+def _run_calls(app, case, fixes, calls):
+    case.reset(app, fixes)
+    start = time.perf_counter()
+    for call in calls:
+        call()
+    return time.perf_counter() - start
+
+
+def time_case(app, case, fixes, repeat, min_pass=MIN_PASS_SECONDS):
+    """
+    One untimed warm-up run sizes the passes: each pass runs the fleet `rounds` times
+    (resetting the case between rounds, outside the timer) so it lasts at least min_pass
+    """
+    calls = case.build(app, fixes)
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        rounds = max(1, math.ceil(min_pass / max(_run_calls(app, case, fixes, calls), 1e-9)))
+        for _ in range(repeat):
+            timings.append(sum(_run_calls(app, case, fixes, calls) for _ in range(rounds)))
+    ops = len(calls) * rounds
+    best = min(timings)
+    median = statistics.median(timings)
+    return {
+        'ops': len(calls),
+        'rounds': rounds,
+        'ops_per_sec': round(ops / median, 1),
+        'ops_per_sec_best': round(ops / best, 1),
+        'us_per_op': round(median / ops * 1e6, 3),
+        'us_per_op_best': round(best / ops * 1e6, 3)
+    }
+
+
+def measure_allocations(app, case, fixes, sample=ALLOC_SAMPLE_CALLS):
+    calls = case.build(app, fixes)[:sample]
+    with contextlib.redirect_stdout(io.StringIO()):
+        case.reset(app, fixes)
+        tracemalloc.start()
+        try:
+            peak_bytes = 0
+            blocks_before = sys.getallocatedblocks()
+            for call in calls:
+                current = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                call()
+                peak_bytes += tracemalloc.get_traced_memory()[1] - current
+            retained = sys.getallocatedblocks() - blocks_before
+        finally:
+            tracemalloc.stop()
+    return {
+        'alloc_bytes_per_call': round(peak_bytes / len(calls), 1),
+        'retained_blocks_per_call': round(retained / len(calls), 2)
+    }
+
+
+def run_benchmarks(names=None, buses_per_route=8, fixes_per_bus=120, repeat=7, seed=0, min_pass=MIN_PASS_SECONDS):
+    app = load_app()
+    fleet = build_fleet(buses_per_route, fixes_per_bus, seed=seed)
+    fixes = interleave(fleet)
+    results = {}
+    for case in CASES:
+        if names and not any(name in case.name for name in names):
+            continue
+        results[case.name] = {**time_case(app, case, fixes, repeat, min_pass), **measure_allocations(app, case, fixes)}
+        print(f"  ✓ {case.name:<26} {results[case.name]['ops_per_sec']:>12,.0f} ops/s")
+    return {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': f"{platform.system()} {platform.machine()}",
+            'params': {'buses_per_route': buses_per_route, 'fixes_per_bus': fixes_per_bus, 'seed': seed,
+                       'fixes': len(fixes), 'min_pass_s': min_pass}
+        },
+        'cases': results
+    }
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    {case: change in median ops/sec vs baseline (+0.25 = 25% more)} and the names that regressed
+    by more than their Case.threshold, or `threshold` for cases without one
+    """
+    thresholds = {case.name: case.threshold for case in CASES if case.threshold is not None}
+    changes, regressed = {}, []
+    for name, result in results['cases'].items():
+        base = baseline.get('cases', {}).get(name)
+        if not base:
+            continue
+        change = result['ops_per_sec'] / base['ops_per_sec'] - 1
+        changes[name] = round(change, 3)
+        if change < -thresholds.get(name, threshold):
+            regressed.append(name)
+    return changes, regressed
+
+
+def print_report(results, baseline, changes, regressed):
+    print("=" * 94)
+    print("⏱ Hot-path micro-benchmarks "
+          f"({results['meta']['params']['fixes']} fixes, python {results['meta']['python']})")
+    print("=" * 94)
+    print(f"  {'case':<26} {'ops/s':>12} {'µs/op':>9} {'alloc B/call':>13} {'retained/call':>14}  vs baseline")
+    for name, r in results['cases'].items():
+        if name in changes:
+            base = baseline['cases'][name]['ops_per_sec']
+            flag = '  ✗ regression' if name in regressed else ''
+            versus = f"{changes[name]:+.1%} ({base:,.0f} ops/s){flag}"
+        else:
+            versus = '-'
+        print(f"  {name:<26} {r['ops_per_sec']:>12,.0f} {r['us_per_op']:>9} {r['alloc_bytes_per_call']:>13} "
+              f"{r['retained_blocks_per_call']:>14}  {versus}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Micro-benchmarks for the per-fix hot paths')
+    parser.add_argument('--case', action='append', help='Only cases whose name contains this (repeatable)')
+    parser.add_argument('--buses', type=int, default=8, help='Synthetic buses per route')
+    parser.add_argument('--fixes', type=int, default=120, help='Fixes per bus')
+    parser.add_argument('--repeat', type=int, default=7, help='Timed passes per case (the median is compared)')
+    parser.add_argument('--min-pass', type=float, default=MIN_PASS_SECONDS,
+                        help='Minimum seconds per timed pass; fast cases repeat the fleet to reach it')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help='Write these results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='Relative slowdown that counts as a regression (cases may set their own)')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--json', metavar='PATH', help='Also write the results as JSON')
+    args = parser.parse_args()
+
+    print("🔁 Running benchmarks...")
+    results = run_benchmarks(args.case, args.buses, args.fixes, args.repeat, args.seed, args.min_pass)
+
+    baseline = {}
+    if os.path.isfile(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('meta', {}).get('params') != results['meta']['params']:
+            print(f"⚠ {args.baseline} was recorded with {baseline.get('meta', {}).get('params')}; not comparing")
+            baseline = {}
+    changes, regressed = compare(results, baseline, args.threshold)
+    print_report(results, baseline, changes, regressed)
+    if baseline:
+        print(f"\n  Baseline: {args.baseline} ({baseline['meta']['created']}, {baseline['meta']['machine']}, "
+              f"python {baseline['meta']['python']})")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({**results, 'changes_vs_baseline': changes}, f, indent=2)
+        print(f"💾 Results written to {args.json}")
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Baseline saved to {args.baseline}")
+    if regressed and args.fail_on_regression:
+        print(f"✗ Slower than baseline by more than {args.threshold:.0%}: {', '.join(regressed)}")
+        raise SystemExit(1)
@@ -0,0 +1,80 @@
+"""
+Benchmark cases: one per hot-path function, each timed over every fix of a
+synthetic fleet in arrival order. Stateful functions start every repeat from
+clean per-bus state and an empty distance cache.
+"""
+from functools import partial
+
+
+class Case:
+    """
+    name: short id used for filtering and in baseline.json
+    build(app, fixes) -> list of zero-argument calls (one per op), built outside the timer
+    reset(app, fixes) -> restores the starting state before each timed repeat
+    threshold: relative slowdown that counts as a regression, for cases noisier than the default allows
+    """
+    def __init__(self, name, description, build, reset, threshold=None):
+        self.name = name
+        self.description = description
+        self.build = build
+        self.reset = reset
+        self.threshold = threshold
+
+
+def _stop_for(app, fix, i):
+    stops = app.get_bus_stops_only(fix.route_id)
+    return stops[i % len(stops)]
+
+
+def reset_fleet_state(app, fixes):
+    """Drop all per-bus tracking state and memoized distances"""
+    app.distance_cache.clear()
+    for bus_id in {fix.bus_id for fix in fixes}:
+        app.reset_bus_route_tracking(bus_id)
+        app.bus_last_speed.pop(bus_id, None)
+
+
+def _warm_distance_cache(app, fixes):
+    reset_fleet_state(app, fixes)
+    for call in _build_waypoint_distance(app, fixes):
+        call()
+
+
+def _build_haversine(app, fixes):
+    return [partial(app.haversine_distance, prev.lat, prev.lng, fix.lat, fix.lng)
+            for prev, fix in zip(fixes, fixes[1:])]
+
+
+def _build_waypoint_distance(app, fixes):
+    calls = []
+    for i, fix in enumerate(fixes):
+        stop = _stop_for(app, fix, i)
+        calls.append(partial(app.calculate_distance_with_waypoints, fix.route_id, fix.lat, fix.lng, stop['lat'], stop['lng']))
+    return calls
+
+
+def _build_direction(app, fixes):
+    return [partial(app.detect_bus_direction, fix.route_id, fix.bus_id, fix.lat, fix.lng) for fix in fixes]
+
+
+def _build_next_stop(app, fixes):
+    return [partial(app.find_next_stop_bidirectional, fix.route_id, fix.bus_id, fix.lat, fix.lng) for fix in fixes]
+
+
+def _build_speed(app, fixes):
+    return [partial(app.calculate_speed_from_history, fix.bus_id, fix.lat, fix.lng, fix.time, fix.route_id)
+            for fix in fixes]
+
+
+CASES = [
+    # Sub-10 µs cases: allocator and cache effects move them more between runs than the 15% default allows
+    Case('haversine', 'haversine_distance between consecutive fixes', _build_haversine, reset_fleet_state,
+         threshold=0.25),
+    Case('waypoint_distance', 'calculate_distance_with_waypoints fix -> stop, cache cold',
+         _build_waypoint_distance, reset_fleet_state),
+    Case('waypoint_distance_cached', 'calculate_distance_with_waypoints fix -> stop, cache warm',
+         _build_waypoint_distance, _warm_distance_cache, threshold=0.25),
+    Case('direction', 'detect_bus_direction per fix', _build_direction, reset_fleet_state),
+    Case('next_stop', 'find_next_stop_bidirectional per fix', _build_next_stop, reset_fleet_state),
+    Case('speed', 'calculate_speed_from_history per fix', _build_speed, reset_fleet_state),
+]
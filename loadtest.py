@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+Load Test
+Replays real bus tracks from bus_locations.csv through N simulated drivers
+(Socket.IO `bus_location`, one fix per interval like static/script.js) while
+M simulated passengers join the route rooms and poll the HTTP API the way the
+passenger page does. Reports fix → `bus_update` latency percentiles,
+throughput, HTTP latencies and memory, and exits 1 when a gate fails.
+
+python loadtest.py --drivers 20 --passengers 200 --duration 60       # app started in-process
+python loadtest.py --url http://127.0.0.1:5000 --server-pid 1234     # against a running server
+python loadtest.py --json load.json --max-p95-ms 250 --min-fixes-per-sec 15
+
+Everything runs on eventlet green threads (the app's own async mode). Without
+the websocket-client package the Socket.IO clients fall back to long-polling.
+"""
+import argparse
+from collections import defaultdict
+import contextlib
+import csv
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+LOCATIONS_FILE = 'bus_locations.csv'
+DRIVER_ID = 'DRIVER001'
+DRIVER_PASSWORD = 'admin123'
+POLL_INTERVAL = 2.0 # loadActiveBuses() in static/script.js
+MIN_TRACK_FIXES = 10
+DRAIN_SECONDS = 3 # Passengers keep listening this long after the last fix
+# Copied into a temp directory for an in-process app, which appends fixes, arrivals and reservations to them
+APP_DATA_FILES = ('bus_drivers.csv', 'bus_locations.csv', 'bus_history.csv', 'seat_reservations.csv', 'model.npz',
+                  'route_artifacts.json', 'segment_times.npz', 'online_eta_state.json', 'models')
+
+
+def load_tracks(path=LOCATIONS_FILE, routes=None):
+    """[(route_id, [(lat, lng, traffic_level), ...])] per logged bus, in file order"""
+    tracks = defaultdict(list)
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            if routes and row['route_id'] not in routes:
+                continue
+            try:
+                fix = (float(row['latitude']), float(row['longitude']), float(row['traffic_level'] or 1))
+            except (KeyError, ValueError):
+                continue
+            tracks[(row['route_id'], row['bus_id'])].append(fix)
+    return [(route_id, fixes) for (route_id, _), fixes in tracks.items() if len(fixes) >= MIN_TRACK_FIXES]
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    from math import asin, cos, radians, sin, sqrt
+    a = sin(radians(lat2 - lat1) / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(radians(lng2 - lng1) / 2) ** 2
+    return 6371 * 2 * asin(sqrt(a))
+
+
+def rss_mb(pid=None):
+    """Resident memory of pid (default: this process) in MB, from /proc; None where unavailable"""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class LoadStats:
+    """Shared counters; green threads only, so plain appends need no locks"""
+    def __init__(self):
+        self.sent_at = {} # (bus_id, lat, lng) -> perf_counter() when the fix was emitted
+        self.measure_from = float('inf')
+        self.measure_until = float('inf')
+        self.fixes_sent = 0
+        self.latency_ms = []
+        self.delivered = set() # keys of fixes that reached at least one passenger
+        self.deliveries = 0
+        self.http_ms = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.memory_mb = []
+
+    def in_window(self, t):
+        return self.measure_from <= t < self.measure_until
+
+
+class SimDriver:
+    """One driver app: authenticate, join as a bus, emit one replayed fix per interval"""
+    def __init__(self, url, index, route_id, track, stats, interval, driver_id, password):
+        self.url = url
+        self.bus_id = f"load-{index}"
+        self.route_id = route_id
+        self.track = track
+        self.stats = stats
+        self.interval = interval
+        self.credentials = {'driver_id': driver_id, 'password': password}
+        self.offset = random.randrange(len(track)) # Buses spread along their tracks
+
+    def run(self, stop_at):
+        import eventlet
+        import socketio
+
+        client = socketio.Client(reconnection=False)
+        authenticated = eventlet.Event()
+        client.on('driver_authenticated', lambda data: authenticated.send(data.get('success')))
+        try:
+            client.connect(self.url, wait_timeout=10)
+            client.emit('driver_authenticate', self.credentials)
+            if not authenticated.wait(10):
+                self.stats.errors['driver_auth'] += 1
+                return
+            client.emit('join_route', {'route_id': self.route_id, 'mode': 'bus', 'bus_id': self.bus_id})
+
+            seq = 0
+            next_fix = time.perf_counter()
+            while time.perf_counter() < stop_at:
+                lat, lng, traffic_level = self.track[(self.offset + seq) % len(self.track)]
+                # Sub-millimetre jitter keeps every fix's echo in bus_update unique
+                lat += (seq % 1000) * 1e-9
+                now = time.perf_counter()
+                self.stats.sent_at[(self.bus_id, lat, lng)] = now
+                if self.stats.in_window(now):
+                    self.stats.fixes_sent += 1
+                client.emit('bus_location', {'route_id': self.route_id, 'bus_id': self.bus_id, 'lat': lat,
+                                             'lng': lng, 'speed': None, 'traffic_level': traffic_level})
+                seq += 1
+                next_fix += self.interval
+                eventlet.sleep(max(0, next_fix - time.perf_counter()))
+            client.emit('leave_route', {'route_id': self.route_id, 'mode': 'bus', 'bus_id': self.bus_id})
+        except Exception as e:
+            self.stats.errors[f"driver: {type(e).__name__}: {str(e)[:80]}"] += 1
+        finally:
+            client.disconnect()
+
+
+class SimPassenger:
+    """One passenger page: join the route room, poll active buses, fall back to passenger_distance"""
+    def __init__(self, url, route_id, stop, stats, poll_interval):
+        self.url = url
+        self.route_id = route_id
+        self.stop = stop
+        self.stats = stats
+        self.poll_interval = poll_interval
+        self.latest = {} # bus_id -> last bus_update
+
+    def on_bus_update(self, data):
+        now = time.perf_counter()
+        self.latest[data['bus_id']] = data
+        key = (data['bus_id'], data['lat'], data['lng'])
+        sent = self.stats.sent_at.get(key)
+        # Counted by when the fix was sent, so slow deliveries during the drain still count
+        if sent is not None and self.stats.in_window(sent):
+            self.stats.latency_ms.append((now - sent) * 1000)
+            self.stats.delivered.add(key)
+            self.stats.deliveries += 1
+
+    def _get(self, session, name, path):
+        start = time.perf_counter()
+        try:
+            response = session.get(self.url + path, timeout=10)
+            ok = response.status_code == 200
+            body = response.json() if ok else None
+        except Exception:
+            ok, body = False, None
+        if self.stats.in_window(start):
+            self.stats.http_ms[name].append((time.perf_counter() - start) * 1000)
+            if not ok:
+                self.stats.errors[f"http {name}"] += 1
+        return body
+
+    def run(self, stop_at, listen_until):
+        import eventlet
+        import requests
+        import socketio
+
+        client = socketio.Client(reconnection=False)
+        client.on('bus_update', self.on_bus_update)
+        session = requests.Session()
+        try:
+            client.connect(self.url, wait_timeout=10)
+            client.emit('join_route', {'route_id': self.route_id, 'mode': 'passenger'})
+            eventlet.sleep(random.uniform(0, self.poll_interval))
+            while time.perf_counter() < stop_at:
+                data = self._get(session, 'active_buses', f"/api/active_buses/{self.route_id}")
+                buses = (data or {}).get('buses', [])
+                if buses:
+                    closest = min(buses, key=lambda b: haversine_km(self.stop['lat'], self.stop['lng'], b['lat'], b['lng']))
+                    # Like the page: use the cached bus_update ETA when it covers our stop, else ask the server
+                    cached = self.latest.get(closest['bus_id'], {}).get('stop_etas') or []
+                    if not any(entry['stop_id'] == self.stop['id'] for entry in cached):
+                        self._get(session, 'passenger_distance',
+                                  f"/api/passenger_distance/{self.route_id}/{closest['bus_id']}/{self.stop['id']}")
+                eventlet.sleep(self.poll_interval)
+            eventlet.sleep(max(0, listen_until - time.perf_counter()))
+        except Exception as e:
+            self.stats.errors[f"passenger: {type(e).__name__}: {str(e)[:80]}"] += 1
+        finally:
+            client.disconnect()
+            session.close()
+
+
+def copy_app_data(data_dir):
+    """Copy APP_DATA_FILES that exist in the working directory into data_dir"""
+    for name in APP_DATA_FILES:
+        if os.path.isdir(name):
+            shutil.copytree(name, os.path.join(data_dir, name))
+        elif os.path.isfile(name):
+            shutil.copy2(name, data_dir)
+
+
+def start_app_in_process(host='127.0.0.1'):
+    """
+    Import app and serve it from a green thread on a free port; returns (URL, app module, data dir)
+    The app runs in a temp copy of its data files (chdir), so the fixes it logs never reach
+    the real bus_locations.csv. It prints on every fix, so this process's stdout goes to
+    /dev/null from here on (use sys.__stdout__ for output)
+    """
+    import eventlet
+    import eventlet.wsgi
+
+    data_dir = tempfile.mkdtemp(prefix='loadtest-')
+    copy_app_data(data_dir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(data_dir)
+
+    sys.stdout = open(os.devnull, 'w')
+    import app
+    sock = eventlet.listen((host, 0))
+    eventlet.spawn(eventlet.wsgi.server, sock, app.app, log_output=False, log=open(os.devnull, 'w'))
+    return f"http://{host}:{sock.getsockname()[1]}", app, data_dir
+
+
+def _percentiles(values, ps=(50, 90, 95, 99)):
+    if not values:
+        return {}
+    values = sorted(values)
+    result = {f"p{p}": round(values[min(len(values) - 1, int(p / 100 * len(values)))], 2) for p in ps}
+    result['max'] = round(values[-1], 2)
+    return result
+
+
+def run_load(url, tracks, stops_by_route, drivers, passengers, duration, ramp, interval=1.0,
+             poll_interval=POLL_INTERVAL, driver_id=DRIVER_ID, password=DRIVER_PASSWORD, memory_pid=None):
+    """
+    Run one load test; returns the report dict. Only fixes sent during the measured
+    `duration` (after `ramp`) count; their deliveries are collected until DRAIN_SECONDS later.
+    """
+    import eventlet
+
+    stats = LoadStats()
+    start = time.perf_counter()
+    stats.measure_from = start + ramp
+    stats.measure_until = stats.measure_from + duration
+    stop_at = stats.measure_until
+
+    sim_drivers = []
+    for i in range(drivers):
+        route_id, track = tracks[i % len(tracks)]
+        sim_drivers.append(SimDriver(url, i, route_id, track, stats, interval, driver_id, password))
+    driven_routes = sorted({d.route_id for d in sim_drivers})
+    sim_passengers = []
+    for i in range(passengers):
+        route_id = driven_routes[i % len(driven_routes)]
+        sim_passengers.append(SimPassenger(url, route_id, random.choice(stops_by_route[route_id]), stats, poll_interval))
+
+    listen_until = stop_at + DRAIN_SECONDS
+
+    def sample_memory():
+        while time.perf_counter() < listen_until:
+            mb = rss_mb(memory_pid)
+            if mb is not None:
+                stats.memory_mb.append(mb)
+            eventlet.sleep(1)
+
+    pool = eventlet.GreenPool(drivers + passengers + 1)
+    pool.spawn(sample_memory)
+    # Passengers first so the rooms are populated before the first fixes; everyone starts within the ramp
+    for sim in sim_passengers:
+        pool.spawn(sim.run, stop_at, listen_until)
+        eventlet.sleep(ramp / 2 / max(1, drivers + passengers))
+    for sim in sim_drivers:
+        pool.spawn(sim.run, stop_at)
+        eventlet.sleep(ramp / 2 / max(1, drivers + passengers))
+    pool.waitall()
+
+    window = duration
+    report = {
+        'url': url,
+        'drivers': drivers,
+        'passengers': passengers,
+        'duration_s': duration,
+        'fix_interval_s': interval,
+        'fixes_sent': stats.fixes_sent,
+        'fixes_delivered': len(stats.delivered),
+        'fixes_undelivered': stats.fixes_sent - len(stats.delivered),
+        'bus_update_deliveries': stats.deliveries,
+        'throughput': {
+            'fixes_sent_per_s': round(stats.fixes_sent / window, 2),
+            'fixes_delivered_per_s': round(len(stats.delivered) / window, 2),
+            'bus_updates_per_s': round(stats.deliveries / window, 2),
+            'http_requests_per_s': round(sum(len(v) for v in stats.http_ms.values()) / window, 2)
+        },
+        'fix_to_bus_update_ms': _percentiles(stats.latency_ms),
+        'http_ms': {name: {'n': len(v), **_percentiles(v, (50, 95, 99))} for name, v in stats.http_ms.items()},
+        'memory_mb': ({'start': round(stats.memory_mb[0], 1), 'peak': round(max(stats.memory_mb), 1),
+                       'end': round(stats.memory_mb[-1], 1)} if stats.memory_mb else None),
+        'errors': dict(stats.errors)
+    }
+    return report
+
+
+def check_gates(report, max_p95_ms=None, max_p99_ms=None, min_fixes_per_sec=None, max_rss_mb=None):
+    """List of failed gate descriptions (empty when the run passes)"""
+    failures = []
+    latency = report['fix_to_bus_update_ms']
+    if (max_p95_ms is not None or max_p99_ms is not None) and not latency:
+        failures.append("no bus_update was delivered")
+    if max_p95_ms is not None and latency and latency['p95'] > max_p95_ms:
+        failures.append(f"p95 {latency['p95']} ms > {max_p95_ms} ms")
+    if max_p99_ms is not None and latency and latency['p99'] > max_p99_ms:
+        failures.append(f"p99 {latency['p99']} ms > {max_p99_ms} ms")
+    delivered = report['throughput']['fixes_delivered_per_s']
+    if min_fixes_per_sec is not None and delivered < min_fixes_per_sec:
+        failures.append(f"{delivered} fixes/s delivered < {min_fixes_per_sec}")
+    memory = report['memory_mb']
+    if max_rss_mb is not None and memory and memory['peak'] > max_rss_mb:
+        failures.append(f"peak RSS {memory['peak']} MB > {max_rss_mb} MB")
+    return failures
+
+
+def print_report(report):
+    print("=" * 70)
+    print("🚌 Load Test")
+    print("=" * 70)
+    print(f"  Target:        {report['url']}")
+    print(f"  Clients:       {report['drivers']} drivers (1 fix / {report['fix_interval_s']}s), "
+          f"{report['passengers']} passengers, {report['duration_s']}s measured")
+    t = report['throughput']
+    print(f"  Fixes:         {report['fixes_sent']} sent ({t['fixes_sent_per_s']}/s), "
+          f"{report['fixes_delivered']} delivered ({t['fixes_delivered_per_s']}/s), "
+          f"{report['fixes_undelivered']} never reached a passenger")
+    print(f"  bus_update:    {report['bus_update_deliveries']} deliveries ({t['bus_updates_per_s']}/s)")
+    latency = report['fix_to_bus_update_ms']
+    if latency:
+        print(f"  Fix → bus_update (ms): p50 {latency['p50']}  p90 {latency['p90']}  p95 {latency['p95']}  "
+              f"p99 {latency['p99']}  max {latency['max']}")
+    else:
+        print("  Fix → bus_update: no deliveries measured")
+    for name, h in report['http_ms'].items():
+        print(f"  GET {name:<20} n={h['n']:<6} p50 {h.get('p50')} ms  p95 {h.get('p95')} ms  p99 {h.get('p99')} ms")
+    memory = report['memory_mb']
+    if memory:
+        print(f"  RSS (MB):      start {memory['start']}  peak {memory['peak']}  end {memory['end']}")
+    if report['errors']:
+        print(f"  ⚠ Errors:      {report['errors']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay bus tracks through simulated drivers and passengers')
+    parser.add_argument('--url', help='Running server to test (default: start app.py in-process)')
+    parser.add_argument('--server-pid', type=int, help='PID of the --url server, for memory sampling')
+    parser.add_argument('--file', default=LOCATIONS_FILE, help='Tracks to replay')
+    parser.add_argument('--route', action='append', help='Only replay this route (repeatable)')
+    parser.add_argument('--drivers', type=int, default=10)
+    parser.add_argument('--passengers', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=30, help='Measured seconds, after the ramp')
+    parser.add_argument('--ramp', type=float, default=5, help='Seconds to connect clients before measuring')
+    parser.add_argument('--interval', type=float, default=1.0, help='Seconds between fixes per driver')
+    parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL)
+    parser.add_argument('--driver-id', default=DRIVER_ID)
+    parser.add_argument('--password', default=DRIVER_PASSWORD)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', metavar='PATH', help='Also write the report as JSON')
+    parser.add_argument('--max-p95-ms', type=float, help='Fail if fix → bus_update p95 exceeds this')
+    parser.add_argument('--max-p99-ms', type=float)
+    parser.add_argument('--min-fixes-per-sec', type=float, help='Fail if fewer fixes/s reach passengers')
+    parser.add_argument('--max-rss-mb', type=float)
+    args = parser.parse_args()
+
+    import eventlet
+    eventlet.monkey_patch()
+    random.seed(args.seed)
+
+    tracks = load_tracks(args.file, args.route)
+    if not tracks:
+        print(f"⚠ No tracks with {MIN_TRACK_FIXES}+ fixes in {args.file}")
+        raise SystemExit(1)
+
+    memory_pid = args.server_pid
+    json_path = os.path.abspath(args.json) if args.json else None
+    data_dir = None
+    if args.url:
+        url = args.url.rstrip('/')
+        import requests
+        stops_by_route = requests.get(f"{url}/api/routes", timeout=10).json()['stops']
+    else:
+        print("🚀 Starting app in-process (its output is discarded)...")
+        url, app_module, data_dir = start_app_in_process()
+        stops_by_route = {route_id: app_module.get_bus_stops_only(route_id) for route_id in app_module.STOP_COORDS}
+    tracks = [(route_id, fixes) for route_id, fixes in tracks if stops_by_route.get(route_id)]
+
+    with contextlib.redirect_stdout(sys.__stdout__):
+        print(f"🔁 {args.drivers} drivers replaying {len(tracks)} tracks, {args.passengers} passengers, "
+              f"{args.ramp}s ramp + {args.duration}s measured against {url}")
+    report = run_load(url, tracks, stops_by_route, args.drivers, args.passengers, args.duration, args.ramp,
+                      args.interval, args.poll_interval, args.driver_id, args.password, memory_pid)
+    if not args.url:
+        report['memory_mb_note'] = 'in-process: RSS includes the simulated clients'
+
+    failures = check_gates(report, args.max_p95_ms, args.max_p99_ms, args.min_fixes_per_sec, args.max_rss_mb)
+    with contextlib.redirect_stdout(sys.__stdout__):
+        print_report(report)
+        if json_path:
+            with open(json_path, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"\n💾 Report written to {args.json}")
+        if failures:
+            print("\n✗ Gate failed: " + "; ".join(failures))
+    sys.__stdout__.flush()
+    if data_dir:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    # In-process, the app's background tasks would keep the process alive
+    os._exit(1 if failures else 0)
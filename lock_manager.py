@@ -0,0 +1,109 @@
+"""
+Lock Manager
+Per-bus and named locks with contention counters and wait-time histograms
+
+Lock order (always acquire left to right, never hold two locks of the same kind):
+
+    bus lock  ->  file locks (locations_file, history_file, reservations_file)
+
+- Route state (active_buses[route_id], reservations, waiting list) is owned by its route actor
+  (route_actors.py) and needs no lock.
+- A bus lock guards that bus's tracking state (speed/position history, start location,
+  logged-location signatures).
+- File locks only wrap CSV appends and are never held while taking another lock.
+"""
+from bisect import bisect_left
+from threading import Lock
+import time
+
+# Upper bounds (ms) of the wait-time histogram buckets; the last bucket catches everything else
+WAIT_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+
+class InstrumentedLock:
+    """Non-reentrant lock that counts contention and buckets how long waiters blocked
+
+    The uncontended path is a single non-blocking acquire with no timing calls.
+    """
+    def __init__(self, name):
+        self.name = name
+        self._lock = Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.total_wait_ms = 0.0
+        self.wait_histogram = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    def acquire(self):
+        if self._lock.acquire(blocking=False):
+            self.acquisitions += 1
+            return True
+
+        start = time.perf_counter()
+        self._lock.acquire()
+        waited_ms = (time.perf_counter() - start) * 1000
+
+        self.acquisitions += 1
+        self.contended += 1
+        self.total_wait_ms += waited_ms
+        self.wait_histogram[bisect_left(WAIT_BUCKETS_MS, waited_ms)] += 1
+        return True
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+    def stats(self):
+        buckets = {f"le_{b}ms": n for b, n in zip(WAIT_BUCKETS_MS, self.wait_histogram)}
+        buckets['le_inf'] = self.wait_histogram[-1]
+        return {
+            'acquisitions': self.acquisitions,
+            'contended': self.contended,
+            'contention_pct': round(100.0 * self.contended / self.acquisitions, 3) if self.acquisitions else 0.0,
+            'total_wait_ms': round(self.total_wait_ms, 3),
+            'wait_histogram': buckets
+        }
+
+
+class LockManager:
+    """Hands out one InstrumentedLock per bus and per named resource"""
+    def __init__(self):
+        self._registry_lock = Lock()
+        self._bus_locks = {}
+        self._named_locks = {}
+
+    def _get(self, table, key, name):
+        lock = table.get(key)
+        if lock is None:
+            with self._registry_lock:
+                lock = table.get(key)
+                if lock is None:
+                    lock = InstrumentedLock(name)
+                    table[key] = lock
+        return lock
+
+    def bus(self, bus_id):
+        return self._get(self._bus_locks, bus_id, f"bus:{bus_id}")
+
+    def named(self, name):
+        return self._get(self._named_locks, name, name)
+
+    def bus_ids(self):
+        with self._registry_lock:
+            return set(self._bus_locks)
+
+    def discard_bus(self, bus_id):
+        """Forget a retired bus's lock (only call when no one can still be using it)"""
+        with self._registry_lock:
+            self._bus_locks.pop(bus_id, None)
+
+    def stats(self):
+        with self._registry_lock:
+            locks = list(self._named_locks.values()) + list(self._bus_locks.values())
+        return {lock.name: lock.stats() for lock in locks}
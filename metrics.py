@@ -0,0 +1,194 @@
+"""
+Metrics
+Counters, latency histograms and gauges rendered in the Prometheus text
+exposition format (GET /metrics)
+
+Recording is two perf_counter calls, one bisect into a bucket list that was
+allocated when the label set was first seen, and a few integer increments, so
+it stays on in production. Gauges are callbacks that only run when scraped.
+"""
+from bisect import bisect_left
+from functools import wraps
+import time
+
+# Upper bounds (seconds) of the latency buckets; +Inf is implied
+LATENCY_BUCKETS_S = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _le(bound):
+    return f'le="{bound}"'
+
+
+class Histogram:
+    """Bucket counts for one label set (non-cumulative; summed when rendered)"""
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_S) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(LATENCY_BUCKETS_S, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+class HistogramFamily:
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = Histogram()
+        return child
+
+    def render(self, lines):
+        lines.append(f'# HELP {self.name} {self.documentation}')
+        lines.append(f'# TYPE {self.name} histogram')
+        for values, child in list(self.children.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS_S, child.counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, values, _le(bound))} {cumulative}')
+            lines.append(f'{self.name}_bucket{_labels(self.labelnames, values, _le("+Inf"))} {child.count}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, values)} {child.sum!r}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, values)} {child.count}')
+
+
+class CounterFamily:
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, *values, amount=1):
+        self.values[values] = self.values.get(values, 0) + amount
+
+    def render(self, lines):
+        lines.append(f'# HELP {self.name} {self.documentation}')
+        lines.append(f'# TYPE {self.name} counter')
+        for values, count in list(self.values.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, values)} {count}')
+
+
+class GaugeFamily:
+    """read() returns a number, or {label value (or tuple of values): number} for labelled gauges"""
+    def __init__(self, name, documentation, labelnames, read):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.read = read
+
+    def render(self, lines):
+        try:
+            value = self.read()
+        except Exception as e:
+            lines.append(f'# {self.name} unavailable: {_escape(e)}')
+            return
+        lines.append(f'# HELP {self.name} {self.documentation}')
+        lines.append(f'# TYPE {self.name} gauge')
+        if not self.labelnames:
+            lines.append(f'{self.name} {value}')
+            return
+        for values, number in value.items():
+            if not isinstance(values, tuple):
+                values = (values,)
+            lines.append(f'{self.name}{_labels(self.labelnames, values)} {number}')
+
+
+class MetricsRegistry:
+    """Per-process metric families plus the built-in handler / HTTP / route-command series"""
+    def __init__(self, namespace='bustracker'):
+        self.namespace = namespace
+        self._families = []
+        # Handlers validate and enqueue to a route actor; the work itself is route_command_seconds
+        self.socketio_dispatch = self.histogram('socketio_dispatch_seconds',
+                                                'Socket.IO handler run time up to the route actor enqueue', ['event'])
+        self.socketio_errors = self.counter('socketio_handler_errors_total', 'Socket.IO handlers that raised', ['event'])
+        self.http_latency = self.histogram('http_request_seconds', 'Flask request run time by route', ['method', 'route'])
+        self.http_responses = self.counter('http_responses_total', 'Flask responses by route and status',
+                                           ['method', 'route', 'status'])
+        self.command_latency = self.histogram('route_command_seconds', 'Route actor command run time',
+                                              ['route', 'command'])
+        self.command_wait = self.histogram('route_command_queue_seconds', 'Time a command waited in its route mailbox',
+                                           ['route'])
+
+    def histogram(self, name, documentation, labelnames=()):
+        family = HistogramFamily(f'{self.namespace}_{name}', documentation, labelnames)
+        self._families.append(family)
+        return family
+
+    def counter(self, name, documentation, labelnames=()):
+        family = CounterFamily(f'{self.namespace}_{name}', documentation, labelnames)
+        self._families.append(family)
+        return family
+
+    def gauge(self, name, documentation, read, labelnames=()):
+        family = GaugeFamily(f'{self.namespace}_{name}', documentation, labelnames, read)
+        self._families.append(family)
+        return family
+
+    def socketio_handler(self, event):
+        """Decorator (below @socketio.on) recording the handler's own run time (not the route actor work it queues) and errors"""
+        histogram = self.socketio_dispatch.labels(event)
+        errors = self.socketio_errors
+
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                except Exception:
+                    errors.inc(event)
+                    raise
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def instrument_flask(self, app):
+        """Time every Flask request, labelled by its URL rule (not the raw path, which is unbounded)"""
+        from flask import g, request
+
+        @app.before_request
+        def _start_request_timer():
+            g.metrics_started = time.perf_counter()
+
+        @app.after_request
+        def _record_request(response):
+            started = g.pop('metrics_started', None)
+            if started is not None:
+                route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+                self.http_latency.labels(request.method, route).observe(time.perf_counter() - started)
+                self.http_responses.inc(request.method, route, response.status_code)
+            return response
+
+    def observe_route_command(self, route_id, command, waited_s, ran_s):
+        """RouteActorRegistry on_command hook"""
+        self.command_wait.labels(route_id).observe(waited_s)
+        self.command_latency.labels(route_id, command).observe(ran_s)
+
+    def render(self):
+        lines = []
+        for family in self._families:
+            family.render(lines)
+        return '\n'.join(lines) + '\n'
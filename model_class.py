@@ -1,11 +1,21 @@
 # model_class.py
+import json
 import numpy as np
 
+# Saved models are plain arrays + a JSON header in an .npz (no pickle, no class paths)
+MODEL_FORMAT = 'bustracker-eta-linear'
+MODEL_FORMAT_VERSION = 1
+MODEL_FEATURES = ['distance_km', 'traffic_level']
+
 class LinearRegressionNumpy:
     """Simple Linear Regression using only NumPy"""
     def __init__(self):
         self.weights = None
         self.bias = None
+        # Sufficient statistics over [X, 1] for closed-form / online fitting
+        self.xtx = None
+        self.xty = None
+        self.n_samples = 0
 
     def fit(self, X, y, learning_rate=0.01, epochs=1000):
         n_samples, n_features = X.shape
@@ -18,9 +28,83 @@ class LinearRegressionNumpy:
             self.weights -= learning_rate * dw
             self.bias -= learning_rate * db
 
+    def fit_closed_form(self, X, y):
+        """Exact least-squares fit in one pass (replaces the gradient-descent epochs)"""
+        self.xtx = None
+        self.xty = None
+        self.n_samples = 0
+        self.partial_fit(X, y)
+
+    def partial_fit(self, X, y):
+        """Add rows to XᵀX / Xᵀy and re-solve; never needs the earlier rows again"""
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float)
+        A = np.column_stack((X, np.ones(len(X))))
+
+        if getattr(self, 'xtx', None) is None:
+            self.xtx = np.zeros((A.shape[1], A.shape[1]))
+            self.xty = np.zeros(A.shape[1])
+            self.n_samples = 0
+
+        self.xtx += A.T @ A
+        self.xty += A.T @ y
+        self.n_samples += len(A)
+        self._solve()
+
+    def _solve(self):
+        # lstsq copes with a singular XᵀX (e.g. traffic_level constant in the logs)
+        theta = np.linalg.lstsq(self.xtx, self.xty, rcond=None)[0]
+        self.weights = theta[:-1]
+        self.bias = float(theta[-1])
+
     def predict(self, X):
         return np.dot(X, self.weights) + self.bias
 
+    def save(self, path):
+        """Write weights (and the online-fit statistics, if any) as an uncompressed .npz"""
+        meta = {
+            'format': MODEL_FORMAT,
+            'version': MODEL_FORMAT_VERSION,
+            'features': MODEL_FEATURES,
+            'n_samples': int(getattr(self, 'n_samples', 0) or 0),
+            'csv_offset': int(getattr(self, 'csv_offset', 0) or 0),
+            'csv_signature': getattr(self, 'csv_signature', None),
+            'trained_until': getattr(self, 'trained_until', None)
+        }
+        arrays = {
+            'meta': np.array(json.dumps(meta)),
+            'weights': np.asarray(self.weights, dtype=float),
+            'bias': np.asarray(self.bias, dtype=float)
+        }
+        if getattr(self, 'xtx', None) is not None:
+            arrays['xtx'] = self.xtx
+            arrays['xty'] = self.xty
+        # A file object stops np.savez from appending '.npz' to temp-file names
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Build a model from a file written by save(); raises ValueError on a foreign/newer format"""
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('format') != MODEL_FORMAT or meta.get('version', 0) > MODEL_FORMAT_VERSION:
+                raise ValueError(f"Unsupported model format {meta.get('format')} v{meta.get('version')}")
+
+            model = cls()
+            model.weights = data['weights'].astype(float)
+            model.bias = float(data['bias'])
+            if len(model.weights) != len(meta['features']):
+                raise ValueError(f"Model has {len(model.weights)} weights for {len(meta['features'])} features")
+            if 'xtx' in data:
+                model.xtx = data['xtx'].astype(float)
+                model.xty = data['xty'].astype(float)
+        model.n_samples = meta.get('n_samples', 0)
+        model.csv_offset = meta.get('csv_offset', 0)
+        model.csv_signature = meta.get('csv_signature')
+        model.trained_until = meta.get('trained_until')
+        return model
+
     def score(self, X, y):
         y_pred = self.predict(X)
         ss_tot = np.sum((y - np.mean(y)) ** 2)
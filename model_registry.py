@@ -0,0 +1,242 @@
+"""
+Model Registry
+Versioned, hot-reloadable ETA models: train.py publishes each new model into
+models/, the server notices it in the background, validates it on a held-out
+sample and swaps it in without a restart
+
+- A candidate is rejected if it fails to load, predicts non-finite values or
+  its MAE on the validation sample is clearly worse than the active model's
+- The swap is a single reference assignment, so an in-flight prediction always
+  sees one complete model
+- The previous version is kept for rollback()
+"""
+from collections import deque
+import logging
+import os
+import re
+import time
+from datetime import datetime
+
+import numpy as np
+
+from model_class import LinearRegressionNumpy
+from structured_log import get_logger, log_event
+
+log = get_logger('model_registry')
+
+MODELS_DIR = 'models'
+MODEL_FILE_PATTERN = re.compile(r'^model-(\d{8}-\d{6}(?:-\d+)?)\.npz$')
+MAX_MAE_REGRESSION = 1.25 # A candidate may be at most 25% worse than the active model...
+MAE_SLACK_MINUTES = 0.5 # ...or this many minutes, whichever allows more
+
+
+def model_version_name(when=None):
+    return (when or datetime.now()).strftime('%Y%m%d-%H%M%S')
+
+
+def publish_model(model, models_dir=MODELS_DIR, version=None):
+    """
+    Write model to models_dir/model-<version>.npz atomically (temp file + rename)
+    so the registry never sees a half-written file. Returns the path.
+    """
+    os.makedirs(models_dir, exist_ok=True)
+    version = version or model_version_name()
+    path = os.path.join(models_dir, f"model-{version}.npz")
+    n = 1
+    while os.path.exists(path):
+        path = os.path.join(models_dir, f"model-{version}-{n}.npz")
+        n += 1
+
+    tmp_path = path + '.tmp'
+    model.save(tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _load_model_file(path):
+    return LinearRegressionNumpy.load(path)
+
+
+class ModelVersion:
+    def __init__(self, version, path, model, validation_mae=None):
+        self.version = version
+        self.path = path
+        self.model = model
+        self.validation_mae = validation_mae
+        self.loaded_at = datetime.now().isoformat()
+
+    def to_dict(self):
+        return {
+            'version': self.version,
+            'path': self.path,
+            'loaded_at': self.loaded_at,
+            'validation_mae': None if self.validation_mae is None else round(self.validation_mae, 4),
+            'trained_until': getattr(self.model, 'trained_until', None)
+        }
+
+
+class ModelRegistry:
+    """Active + previous ETA model, reloaded from models_dir when a newer version appears
+
+    validation_sample: callable(*models) returning (X, y) that none of the given
+    models was fit on (None if there is none), or None to skip the accuracy
+    comparison (finite-prediction check still runs).
+    run_blocking: how to run file loading / validation off the event loop.
+    """
+    def __init__(self, models_dir=MODELS_DIR, fallback_path='model.npz', validation_sample=None,
+                 run_blocking=None, latency_window=1000):
+        self.models_dir = models_dir
+        self.fallback_path = fallback_path
+        self._validation_sample = validation_sample
+        self._run_blocking = run_blocking or (lambda fn, *args: fn(*args))
+        self.active = None
+        self.previous = None
+        self.rejected = {}
+        self.reloads = 0
+        self.last_checked = None
+        self._latency_ms = deque(maxlen=latency_window)
+        self._predictions = 0
+
+    # Loading ---------------------------------------------------------------
+
+    def _versions_on_disk(self):
+        if not os.path.isdir(self.models_dir):
+            return []
+        versions = []
+        for name in os.listdir(self.models_dir):
+            match = MODEL_FILE_PATTERN.match(name)
+            if match:
+                versions.append((match.group(1), os.path.join(self.models_dir, name)))
+        return sorted(versions)
+
+    def load_initial(self):
+        """Newest model in models_dir, else fallback_path; returns the active ModelVersion or None"""
+        versions = self._versions_on_disk()
+        if versions:
+            version, path = versions[-1]
+        elif self.fallback_path and os.path.isfile(self.fallback_path):
+            version, path = 'legacy', self.fallback_path
+        else:
+            return None
+
+        # Validation MAE is filled in by the first check_for_update(), keeping startup off the CSV
+        self.active = ModelVersion(version, path, _load_model_file(path))
+        return self.active
+
+    def check_for_update(self):
+        """Load, validate and activate the newest version if it is new. Returns True if swapped."""
+        self.last_checked = datetime.now().isoformat()
+        versions = self._versions_on_disk()
+        if not versions:
+            return False
+
+        version, path = versions[-1]
+        known = {v.version for v in (self.active, self.previous) if v is not None}
+        if version in known or version in self.rejected:
+            return False
+        if self.active is not None and self.active.version != 'legacy' and version < self.active.version:
+            return False
+
+        try:
+            model = self._run_blocking(_load_model_file, path)
+            mae = self._run_blocking(self._validate, model)
+        except Exception as e:
+            self.rejected[version] = str(e)
+            log_event(log, logging.WARNING, 'model_rejected', version=version, reason=str(e))
+            return False
+
+        self.previous, self.active = self.active, ModelVersion(version, path, model, mae)
+        self.reloads += 1
+        log_event(log, logging.INFO, 'model_activated', version=version,
+                  validation_mae=round(mae, 2) if mae is not None else None)
+        return True
+
+    def watch(self, sleep, interval=30):
+        """Background loop: poll models_dir every `interval` seconds"""
+        while True:
+            sleep(interval)
+            try:
+                self.check_for_update()
+            except Exception:
+                log.exception('model_watch_failed')
+
+    def rollback(self):
+        """Swap back to the previous version; the version rolled back from will not be reloaded"""
+        if self.previous is None:
+            return False
+        self.rejected[self.active.version] = 'rolled back'
+        self.active, self.previous = self.previous, self.active
+        log_event(log, logging.INFO, 'model_rolled_back', version=self.active.version, from_version=self.previous.version)
+        return True
+
+    # Validation ------------------------------------------------------------
+
+    def _sample(self, *models):
+        if self._validation_sample is None:
+            return None
+        sample = self._validation_sample(*models)
+        if sample is None or len(sample[0]) == 0:
+            return None
+        return sample
+
+    @staticmethod
+    def _mae(model, sample):
+        X, y = sample
+        return float(np.mean(np.abs(np.maximum(0.5, model.predict(X)) - y)))
+
+    def _validate(self, model):
+        """Raises ValueError if the candidate must not go live; returns its validation MAE"""
+        probe = np.array([[0.5, 1.0], [5.0, 1.5], [15.0, 2.5]])
+        if not np.all(np.isfinite(model.predict(probe))):
+            raise ValueError("non-finite predictions")
+
+        # Rows neither the candidate nor the active model was fit on
+        sample = self._sample(model, *([self.active.model] if self.active is not None else []))
+        if sample is None:
+            return None
+        mae = self._mae(model, sample)
+        if not np.isfinite(mae):
+            raise ValueError("non-finite validation error")
+        if self.active is None:
+            return mae
+
+        # Score the active model on the same (unseen) sample so the comparison is fair
+        active_mae = self._mae(self.active.model, sample)
+        self.active.validation_mae = active_mae
+        limit = max(active_mae * MAX_MAE_REGRESSION, active_mae + MAE_SLACK_MINUTES)
+        if mae > limit:
+            raise ValueError(f"validation MAE {mae:.2f} min vs {active_mae:.2f} min for {self.active.version}")
+        return mae
+
+    # Serving ---------------------------------------------------------------
+
+    @property
+    def model(self):
+        active = self.active
+        return active.model if active is not None else None
+
+    def predict(self, features):
+        """model.predict on the active version, recording per-call latency"""
+        model = self.model
+        start = time.perf_counter()
+        result = model.predict(features)
+        self._latency_ms.append((time.perf_counter() - start) * 1000)
+        self._predictions += len(features)
+        return result
+
+    def stats(self):
+        samples = sorted(self._latency_ms)
+
+        def pct(p):
+            return round(samples[min(len(samples) - 1, int(p / 100 * len(samples)))], 4) if samples else None
+
+        return {
+            'active': self.active.to_dict() if self.active else None,
+            'previous': self.previous.to_dict() if self.previous else None,
+            'available': [version for version, _ in self._versions_on_disk()],
+            'rejected': dict(self.rejected),
+            'reloads': self.reloads,
+            'last_checked': self.last_checked,
+            'predictions': self._predictions,
+            'latency_ms': {'calls': len(samples), 'p50': pct(50), 'p95': pct(95), 'p99': pct(99)}
+        }
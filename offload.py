@@ -0,0 +1,136 @@
+"""
+Offload Execution Layer
+Keeps heavy NumPy / model / file work off the eventlet hub so socket traffic
+stays responsive
+
+- run_blocking(fn, ...)  runs fn in eventlet's native thread pool (tpool)
+- BatchExecutor          coalesces calls from many greenlets into one batched call
+- HubLatencyProbe        measures how late the hub wakes a sleeping greenlet
+
+When offloading is disabled (threading mode, scripts, tests) everything runs inline.
+"""
+from collections import deque
+import time
+
+try:
+    import eventlet
+    from eventlet import tpool
+    from eventlet.event import Event
+    EVENTLET_AVAILABLE = True
+except ImportError:
+    eventlet = None
+    tpool = None
+    Event = None
+    EVENTLET_AVAILABLE = False
+
+_enabled = False
+offload_stats = {'pool_calls': 0, 'batches': 0, 'batched_items': 0}
+
+
+def configure(enabled):
+    """
+    Turn offloading on (only possible when eventlet is installed and has monkey-patched threading)
+
+    Callers hold lock_manager locks across run_blocking. That only yields safely when those locks
+    are green: with real OS locks, a second greenlet blocks the whole hub in acquire() and the
+    thread-pool result is never delivered.
+    """
+    global _enabled
+    _enabled = bool(enabled) and EVENTLET_AVAILABLE and eventlet.patcher.is_monkey_patched('thread')
+    return _enabled
+
+
+def is_enabled():
+    return _enabled
+
+
+def run_blocking(fn, *args, **kwargs):
+    """Run fn in the native thread pool; the calling greenlet yields until it finishes"""
+    if not _enabled:
+        return fn(*args, **kwargs)
+    offload_stats['pool_calls'] += 1
+    return tpool.execute(fn, *args, **kwargs)
+
+
+class BatchExecutor:
+    """Collects single items from many greenlets and runs one batch_fn(items) -> results
+
+    A batch is flushed after `window` seconds or as soon as `max_batch` items are waiting,
+    then executed in the thread pool. Each caller gets back its own result.
+    """
+    def __init__(self, batch_fn, max_batch=64, window=0.002):
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.window = window
+        self._pending = []
+        self._scheduled = False
+
+    def submit(self, item):
+        if not _enabled:
+            return self.batch_fn([item])[0]
+
+        done = Event()
+        self._pending.append((item, done))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif not self._scheduled:
+            self._scheduled = True
+            eventlet.spawn_after(self.window, self._flush)
+        return done.wait()
+
+    def pending(self):
+        """Items waiting for the next flush"""
+        return len(self._pending)
+
+    def _flush(self):
+        self._scheduled = False
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        offload_stats['batches'] += 1
+        offload_stats['batched_items'] += len(batch)
+        try:
+            results = run_blocking(self.batch_fn, [item for item, _ in batch])
+        except Exception as e:
+            for _, done in batch:
+                done.send_exception(e)
+            return
+        for (_, done), result in zip(batch, results):
+            done.send(result)
+
+
+class HubLatencyProbe:
+    """Sleeps `interval` in a loop and records how late each wake-up was (hub lag)"""
+    def __init__(self, interval=0.05, window=1200):
+        self.interval = interval
+        self.samples_ms = deque(maxlen=window)
+        self.running = False
+
+    def run(self, sleep):
+        self.running = True
+        while self.running:
+            start = time.perf_counter()
+            sleep(self.interval)
+            lag_ms = (time.perf_counter() - start - self.interval) * 1000
+            self.samples_ms.append(max(0.0, lag_ms))
+
+    def stop(self):
+        self.running = False
+
+    def stats(self):
+        samples = sorted(self.samples_ms)
+        if not samples:
+            return {'samples': 0}
+
+        def pct(p):
+            return round(samples[min(len(samples) - 1, int(p / 100 * len(samples)))], 3)
+
+        return {
+            'samples': len(samples),
+            'interval_ms': self.interval * 1000,
+            'p50_ms': pct(50),
+            'p95_ms': pct(95),
+            'p99_ms': pct(99),
+            'max_ms': round(samples[-1], 3)
+        }
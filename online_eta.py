@@ -0,0 +1,143 @@
+"""
+Online ETA Correction
+Learns from every logged arrival (predicted vs actual minutes) without batch
+training: one recursive-least-squares fit per route of
+
+    actual ≈ a + b * model_prediction
+
+so each route's systematic bias/scale error (traffic patterns, driver habits,
+stop dwell) is corrected during the day. An update is a 2×2 matrix operation.
+
+- Exponential forgetting keeps the fit tracking the current part of the day
+- Corrections only apply once a route has MIN_UPDATES arrivals
+- Rolling MAE of raw vs corrected predictions shows whether it helps
+- State is a small JSON file written atomically by a background task
+"""
+from collections import deque
+import json
+import os
+
+import numpy as np
+
+from structured_log import get_logger
+
+log = get_logger('online_eta')
+
+ONLINE_ETA_FILE = 'online_eta_state.json'
+STATE_VERSION = 1
+FORGETTING = 0.995 # Weight of an arrival halves after ~140 newer ones
+MIN_UPDATES = 20
+MAX_ACTUAL_MINUTES = 120 # Longer "arrivals" are stale pairs, not feedback
+ERROR_WINDOW = 500
+
+
+class RouteCorrector:
+    """RLS state for one route: theta = [a, b], P = inverse information matrix"""
+    def __init__(self, theta=None, P=None, updates=0):
+        self.theta = np.array(theta if theta is not None else [0.0, 1.0])
+        self.P = np.array(P if P is not None else np.eye(2) * 100.0)
+        self.updates = updates
+        self.raw_errors = deque(maxlen=ERROR_WINDOW)
+        self.corrected_errors = deque(maxlen=ERROR_WINDOW)
+
+    def apply(self, predictions):
+        if self.updates < MIN_UPDATES:
+            return predictions
+        return np.maximum(0.5, self.theta[0] + self.theta[1] * predictions)
+
+    def update(self, predicted, actual):
+        x = np.array([1.0, predicted])
+        Px = self.P @ x
+        gain = Px / (FORGETTING + x @ Px)
+        self.theta = self.theta + gain * (actual - x @ self.theta)
+        self.P = (self.P - np.outer(gain, Px)) / FORGETTING
+        self.updates += 1
+
+
+class OnlineETACorrector:
+    """Per-route online correction of model ETAs, fed by arrival events"""
+    def __init__(self, path=ONLINE_ETA_FILE):
+        self.path = path
+        self._routes = {}
+        self.skipped = 0
+        self.dirty = False
+
+    def _route(self, route_id):
+        corrector = self._routes.get(route_id)
+        if corrector is None:
+            corrector = self._routes[route_id] = RouteCorrector()
+        return corrector
+
+    def correct(self, route_id, predictions):
+        """Corrected ETAs (minutes) for an array of raw model predictions on route_id"""
+        corrector = self._routes.get(route_id)
+        predictions = np.asarray(predictions, dtype=float)
+        return corrector.apply(predictions) if corrector else predictions
+
+    def observe(self, route_id, predicted, actual):
+        """Feed one arrival: the raw model prediction and the minutes it actually took"""
+        if not (0 < actual <= MAX_ACTUAL_MINUTES) or not np.isfinite(predicted):
+            self.skipped += 1
+            return
+
+        corrector = self._route(route_id)
+        corrected = float(corrector.apply(np.array([predicted]))[0])
+        corrector.raw_errors.append(abs(predicted - actual))
+        corrector.corrected_errors.append(abs(corrected - actual))
+        corrector.update(predicted, actual)
+        self.dirty = True
+
+    # Persistence -----------------------------------------------------------
+
+    def load(self):
+        """Restore saved state; returns the number of routes loaded (0 if there is no file)"""
+        if not os.path.isfile(self.path):
+            return 0
+        with open(self.path, 'r') as f:
+            state = json.load(f)
+        if state.get('version') != STATE_VERSION:
+            raise ValueError(f"Unsupported online ETA state version {state.get('version')}")
+        self._routes = {
+            route_id: RouteCorrector(entry['theta'], entry['P'], entry['updates'])
+            for route_id, entry in state['routes'].items()
+        }
+        return len(self._routes)
+
+    def save(self):
+        state = {
+            'version': STATE_VERSION,
+            'routes': {
+                route_id: {'theta': c.theta.tolist(), 'P': c.P.tolist(), 'updates': c.updates}
+                for route_id, c in list(self._routes.items())
+            }
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def autosave(self, sleep, interval=60):
+        """Background loop: write the state every `interval` seconds when it changed"""
+        while True:
+            sleep(interval)
+            if not self.dirty:
+                continue
+            try:
+                self.save()
+            except Exception:
+                log.exception('online_eta_save_failed')
+
+    def stats(self):
+        routes = {}
+        for route_id, c in list(self._routes.items()):
+            routes[route_id] = {
+                'updates': c.updates,
+                'active': c.updates >= MIN_UPDATES,
+                'intercept': round(float(c.theta[0]), 3),
+                'scale': round(float(c.theta[1]), 3),
+                'rolling_mae_raw': round(float(np.mean(c.raw_errors)), 3) if c.raw_errors else None,
+                'rolling_mae_corrected': round(float(np.mean(c.corrected_errors)), 3) if c.corrected_errors else None,
+                'window': len(c.raw_errors)
+            }
+        return {'routes': routes, 'skipped': self.skipped}
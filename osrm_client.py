@@ -0,0 +1,199 @@
+"""
+OSRM Client
+Concurrent, cached access to the OSRM route service for route_compiler.py
+(build time only - the web process never imports requests through this)
+
+- Pooled keep-alive HTTP connections, one session shared by the workers
+- At most `max_workers` requests in flight, spaced by a shared rate limit
+  (the public demo server asks for no more than ~1 request per second)
+- Every successful response is stored on disk under the SHA-256 of the
+  request (server + profile + coordinate pair + options), so regenerating a
+  route only fetches the segments whose coordinates changed
+- Failed requests are retried with backoff and never written to disk;
+  within one run every segment is requested at most once, even when several
+  threads ask for it at the same time (they wait on the first one's future)
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+import hashlib
+import json
+import os
+import threading
+import time
+
+OSRM_SERVER = "http://router.project-osrm.org"
+OSRM_TIMEOUT = 10
+OSRM_CACHE_DIR = 'osrm_cache'
+OSRM_MAX_WORKERS = 4
+OSRM_RATE_LIMIT = 1.0 # Requests per second; 0 disables (self-hosted or fake server)
+OSRM_RETRIES = 3
+ROUTE_OPTIONS = {
+    'overview': 'full',
+    'geometries': 'polyline',
+    'steps': 'true',
+    'continue_straight': 'false',
+    'annotations': 'true'
+}
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across threads"""
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class OSRMClient:
+    """Fetches OSRM /route responses for (lat1, lng1, lat2, lng2) segments, through the disk cache"""
+    def __init__(self, server=OSRM_SERVER, cache_dir=OSRM_CACHE_DIR, max_workers=OSRM_MAX_WORKERS,
+                 rate_limit=OSRM_RATE_LIMIT, timeout=OSRM_TIMEOUT, retries=OSRM_RETRIES, profile='driving'):
+        self.server = server.rstrip('/')
+        self.cache_dir = cache_dir
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+        self.retries = retries
+        self.profile = profile
+        self._limiter = RateLimiter(rate_limit)
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._memory = {} # cache key -> Future of the route dict or None, for this run
+        self._memory_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.fetched = 0
+        self.failed = 0
+
+    # Cache -----------------------------------------------------------------
+
+    def cache_key(self, lat1, lng1, lat2, lng2):
+        """Content address of one request; coordinates rounded to OSRM's own precision (1e-6°)"""
+        request = {
+            'server': self.server,
+            'profile': self.profile,
+            'coordinates': [[round(lng1, 6), round(lat1, 6)], [round(lng2, 6), round(lat2, 6)]],
+            'options': ROUTE_OPTIONS
+        }
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _read_cache(self, key):
+        path = self._cache_path(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None # Unreadable entries are simply fetched again
+
+    def _write_cache(self, key, data):
+        path = self._cache_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    # HTTP ------------------------------------------------------------------
+
+    def _get_session(self):
+        with self._session_lock:
+            if self._session is None:
+                import requests # Only needed when (re)generating routes
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                retry = Retry(total=self.retries, backoff_factor=0.5,
+                              status_forcelist=(429, 500, 502, 503, 504), allowed_methods=('GET',),
+                              respect_retry_after_header=True)
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers, max_retries=retry)
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+            return self._session
+
+    def _fetch(self, lat1, lng1, lat2, lng2):
+        url = f"{self.server}/route/v1/{self.profile}/{lng1},{lat1};{lng2},{lat2}"
+        self._limiter.wait()
+        try:
+            response = self._get_session().get(url, params=ROUTE_OPTIONS, timeout=self.timeout)
+            if response.status_code != 200:
+                return None
+            data = response.json()
+        except Exception:
+            return None
+        if data.get('code') != 'Ok' or not data.get('routes'):
+            return None
+        return data
+
+    def route(self, lat1, lng1, lat2, lng2):
+        """First OSRM route dict (geometry, distance, duration...) for the segment, or None"""
+        key = self.cache_key(lat1, lng1, lat2, lng2)
+        with self._memory_lock:
+            future = self._memory.get(key)
+            first = future is None
+            if first:
+                future = self._memory[key] = Future()
+        if not first:
+            return future.result()
+
+        try:
+            route = self._load(key, lat1, lng1, lat2, lng2)
+        except BaseException as e:
+            with self._memory_lock:
+                del self._memory[key] # Not a result: the next call tries again
+            future.set_exception(e)
+            raise
+        future.set_result(route)
+        return route
+
+    def _load(self, key, lat1, lng1, lat2, lng2):
+        """Disk cache, else the server (successful responses are written to the cache)"""
+        data = self._read_cache(key)
+        if data is not None:
+            with self._stats_lock:
+                self.hits += 1
+        else:
+            data = self._fetch(lat1, lng1, lat2, lng2)
+            with self._stats_lock:
+                if data is None:
+                    self.failed += 1
+                else:
+                    self.fetched += 1
+            if data is not None:
+                self._write_cache(key, data)
+
+        return data['routes'][0] if data is not None else None
+
+    def route_many(self, segments):
+        """route() for a list of (lat1, lng1, lat2, lng2), in order; cache misses fetched concurrently"""
+        segments = list(segments)
+        keys = [self.cache_key(*segment) for segment in segments]
+        unique = dict(zip(keys, segments)) # Repeated segments would only tie up a worker waiting
+        if len(unique) <= 1 or self.max_workers == 1:
+            routes = {key: self.route(*segment) for key, segment in unique.items()}
+        else:
+            with ThreadPoolExecutor(min(self.max_workers, len(unique)), thread_name_prefix='osrm') as pool:
+                routes = dict(zip(unique, pool.map(lambda segment: self.route(*segment), unique.values())))
+        return [routes[key] for key in keys]
+
+    def stats(self):
+        return {'cache_hits': self.hits, 'fetched': self.fetched, 'failed': self.failed}
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
@@ -0,0 +1,125 @@
+"""
+Sampling Profiler
+Periodically snapshots every native thread's Python stack from a background OS
+thread and aggregates them as collapsed stacks (flamegraph.pl / speedscope)
+
+Under eventlet all greenlets share the main thread, so a sample of it is the
+greenlet that holds the CPU at that moment (or the hub waiting for I/O); the
+eventlet thread pool workers show up as their own threads. Nothing is
+installed while it is off: no trace hooks, no thread, no per-call cost.
+"""
+from collections import Counter
+import os
+import sys
+import threading
+import time
+
+try:
+    from eventlet import patcher
+    _threading = patcher.original('threading')
+    _time = patcher.original('time')
+except ImportError:
+    _threading = threading
+    _time = time
+
+PROFILE_MAX_SECONDS = 60
+PROFILE_MIN_INTERVAL = 0.001
+MAX_STACK_DEPTH = 128
+
+_HUB_FILES = ('hub.py', 'poll.py', 'epolls.py', 'selects.py', 'kqueue.py')
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _is_idle(frame):
+    """Hub waiting for I/O, or a pool thread waiting for work"""
+    code = frame.f_code
+    filename = code.co_filename
+    if code.co_name in ('wait', 'do_poll') and os.sep + 'hubs' + os.sep in filename and filename.endswith(_HUB_FILES):
+        return True
+    if code.co_name == 'tworker' and filename.endswith('tpool.py'):
+        return True
+    return code.co_name in ('wait', 'get') and filename.endswith(('threading.py', 'queue.py'))
+
+
+class StackSampler:
+    """One profile at a time; start() returns False while another one is running"""
+    def __init__(self):
+        self.interval = 0.005
+        self.stacks = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self.started_at = None
+        self.duration = 0.0
+        self._stop = False
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=0.005):
+        if self.running:
+            return False
+        self.interval = max(PROFILE_MIN_INTERVAL, interval)
+        self.stacks = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self.started_at = time.time()
+        self._stop = False
+        self._thread = _threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop = True
+
+    def profile(self, seconds, sleep, interval=0.005):
+        """Sample for `seconds` while the caller yields through sleep (socketio.sleep); False if busy"""
+        if not self.start(interval):
+            return False
+        try:
+            sleep(min(seconds, PROFILE_MAX_SECONDS))
+        finally:
+            self.stop()
+        while self.running:
+            sleep(self.interval)
+        return True
+
+    def _run(self):
+        own_id = _threading.get_ident()
+        started = _time.perf_counter()
+        while not self._stop:
+            names = {thread.ident: thread.name for thread in _threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                self.samples += 1
+                if _is_idle(frame):
+                    self.idle_samples += 1
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, f'thread-{thread_id}'))
+                self.stacks[';'.join(reversed(stack))] += 1
+            _time.sleep(self.interval)
+        self.duration = _time.perf_counter() - started
+
+    def collapsed(self):
+        """'frame;frame;frame count' lines, hottest first"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'started_at': self.started_at,
+            'duration_s': round(self.duration, 3),
+            'interval_ms': self.interval * 1000,
+            'samples': self.samples,
+            'idle_samples': self.idle_samples,
+            'unique_stacks': len(self.stacks)
+        }
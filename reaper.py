@@ -0,0 +1,64 @@
+"""
+State Reaper
+Runs a sweep on a timer that expires stale buses and evicts per-bus / per-key
+entries nobody will read again, so memory on long-running workers stays flat
+
+The sweep itself lives next to the state it cleans (app.reap_stale_state) and
+returns {kind: entries reclaimed}; this module schedules it and keeps the
+totals for GET /api/reaper and /metrics.
+"""
+from collections import Counter
+import time
+
+from structured_log import get_logger
+
+log = get_logger('reaper')
+
+
+class Reaper:
+    def __init__(self, sweep, interval=60):
+        self.sweep = sweep
+        self.interval = interval
+        self.running = False
+        self.sweeps = 0
+        self.errors = 0
+        self.reclaimed = Counter()
+        self.last_reclaimed = {}
+        self.last_sweep_at = None
+        self.last_sweep_ms = 0.0
+
+    def run(self, sleep):
+        self.running = True
+        while self.running:
+            sleep(self.interval)
+            try:
+                self.sweep_once()
+            except Exception:
+                self.errors += 1
+                log.exception('reaper_sweep_failed')
+
+    def stop(self):
+        self.running = False
+
+    def sweep_once(self):
+        start = time.perf_counter()
+        counts = {kind: count for kind, count in self.sweep().items() if count}
+        self.last_sweep_ms = (time.perf_counter() - start) * 1000
+        self.last_sweep_at = time.time()
+        self.sweeps += 1
+        self.reclaimed.update(counts)
+        self.last_reclaimed = counts
+        if counts:
+            log.info('reaped', extra={'fields': {**counts, 'sweep_ms': round(self.last_sweep_ms, 2)}})
+        return counts
+
+    def stats(self):
+        return {
+            'interval_s': self.interval,
+            'sweeps': self.sweeps,
+            'errors': self.errors,
+            'last_sweep_at': self.last_sweep_at,
+            'last_sweep_ms': round(self.last_sweep_ms, 3),
+            'last_reclaimed': self.last_reclaimed,
+            'reclaimed_total': dict(self.reclaimed)
+        }
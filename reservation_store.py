@@ -0,0 +1,94 @@
+"""
+Seat Reservation Store
+Per-route hash indexes so duplicate checks, cancellations and seat counts
+never scan the reservation lists
+"""
+from collections import defaultdict
+from datetime import datetime
+
+
+class ReservationStore:
+    """Seat reservations indexed by route, bus, passenger name and session
+
+    Layout (all dicts, so every lookup is O(1)):
+      _by_bus[route_id][bus_id]       -> {session_id: reservation}  (insertion ordered)
+      _by_session[route_id][session]  -> bus_id
+      _by_name[route_id][name.lower()] -> session_id
+
+    Not thread-safe on its own; each route's reservations are owned by its route actor.
+    """
+    def __init__(self, total_seats):
+        self.total_seats = total_seats
+        self._by_bus = defaultdict(lambda: defaultdict(dict))
+        self._by_session = defaultdict(dict)
+        self._by_name = defaultdict(dict)
+
+    def has_passenger(self, route_id, passenger_name):
+        return passenger_name.lower() in self._by_name.get(route_id, ())
+
+    def has_session(self, route_id, session_id):
+        return session_id in self._by_session.get(route_id, ())
+
+    def bus_for_session(self, route_id, session_id):
+        return self._by_session.get(route_id, {}).get(session_id)
+
+    def reserved_count(self, route_id, bus_id):
+        buses = self._by_bus.get(route_id)
+        if not buses or bus_id not in buses:
+            return 0
+        return len(buses[bus_id])
+
+    def available_seats(self, route_id, bus_id):
+        return max(0, self.total_seats - self.reserved_count(route_id, bus_id))
+
+    def reservations_for_bus(self, route_id, bus_id):
+        """Reservations on a bus in booking order"""
+        buses = self._by_bus.get(route_id)
+        if not buses or bus_id not in buses:
+            return []
+        return list(buses[bus_id].values())
+
+    def add(self, route_id, bus_id, passenger_name, session_id):
+        """Record a reservation (caller has already checked for duplicates and free seats)"""
+        reservation = {
+            'passenger_name': passenger_name,
+            'session_id': session_id,
+            'reserved_at': datetime.now().isoformat()
+        }
+        self._by_bus[route_id][bus_id][session_id] = reservation
+        self._by_session[route_id][session_id] = bus_id
+        self._by_name[route_id][passenger_name.lower()] = session_id
+        return reservation
+
+    def cancel_session(self, route_id, session_id):
+        """Drop a session's reservation on a route; returns the freed bus_id or None"""
+        bus_id = self._by_session.get(route_id, {}).pop(session_id, None)
+        if bus_id is None:
+            return None
+
+        reservation = self._by_bus[route_id][bus_id].pop(session_id)
+        name_key = reservation['passenger_name'].lower()
+        if self._by_name[route_id].get(name_key) == session_id:
+            del self._by_name[route_id][name_key]
+
+        if not self._by_bus[route_id][bus_id]:
+            del self._by_bus[route_id][bus_id]
+        return bus_id
+
+    def cancel_bus(self, route_id, bus_id):
+        """Drop every reservation on a bus; returns the freed session_ids"""
+        buses = self._by_bus.get(route_id)
+        reservations = buses.pop(bus_id, {}) if buses else {}
+        for session_id, reservation in reservations.items():
+            del self._by_session[route_id][session_id]
+            name_key = reservation['passenger_name'].lower()
+            if self._by_name[route_id].get(name_key) == session_id:
+                del self._by_name[route_id][name_key]
+        return list(reservations)
+
+    def routes(self):
+        return list(self._by_session.keys())
+
+    def buses(self, route_id):
+        """Bus ids holding at least one reservation on a route"""
+        return list(self._by_bus.get(route_id, ()))
@@ -0,0 +1,115 @@
+"""
+Route Actors
+One single-writer task per route that owns the route's state (active buses,
+reservations, waiting list, waiting counts) and applies commands from a mailbox
+in arrival order
+
+Socket handlers validate input and enqueue; they never touch route state
+themselves, so per-route updates need no locks and are processed in a
+deterministic order.
+"""
+import time
+
+from structured_log import get_logger
+
+log = get_logger('route_actors')
+
+
+class RouteActor:
+    """Mailbox + background task applying commands for one route, one at a time
+
+    on_command: optional callback(route_id, command_name, waited_s, ran_s) after each command
+    """
+    def __init__(self, route_id, socketio, on_command=None):
+        self.route_id = route_id
+        self._on_command = on_command
+        self._socketio = socketio
+        self._eio = socketio.server.eio
+        self.mailbox = self._eio.create_queue()
+        self.processed = 0
+        self.errors = 0
+        self.max_queue_wait_ms = 0.0
+        socketio.start_background_task(self._run)
+
+    def send(self, fn, *args, **kwargs):
+        """Enqueue fn(*args, **kwargs) to run on this route's task (fire and forget)"""
+        self.mailbox.put((fn, args, kwargs, None, time.perf_counter()))
+
+    def call(self, fn, *args, **kwargs):
+        """Enqueue fn and wait for its return value (for HTTP handlers that must answer)"""
+        reply = {'event': self._eio.create_event()}
+        self.mailbox.put((fn, args, kwargs, reply, time.perf_counter()))
+        reply['event'].wait()
+        if 'error' in reply:
+            raise reply['error']
+        return reply['result']
+
+    def _run(self):
+        while True:
+            fn, args, kwargs, reply, queued_at = self.mailbox.get()
+            started = time.perf_counter()
+            waited_ms = (started - queued_at) * 1000
+            self.max_queue_wait_ms = max(self.max_queue_wait_ms, waited_ms)
+            try:
+                result = fn(*args, **kwargs)
+                if reply is not None:
+                    reply['result'] = result
+            except Exception as e:
+                self.errors += 1
+                log.error('route_command_failed', exc_info=True,
+                          extra={'fields': {'route_id': self.route_id, 'command': getattr(fn, '__name__', fn)}})
+                if reply is not None:
+                    reply['error'] = e
+            finally:
+                self.processed += 1
+                if self._on_command is not None:
+                    self._on_command(self.route_id, getattr(fn, '__name__', 'unknown'),
+                                     waited_ms / 1000, time.perf_counter() - started)
+                if reply is not None:
+                    reply['event'].set()
+
+    def stats(self):
+        return {
+            'queued': self.mailbox.qsize(),
+            'processed': self.processed,
+            'errors': self.errors,
+            'max_queue_wait_ms': round(self.max_queue_wait_ms, 3)
+        }
+
+
+class RouteActorRegistry:
+    """Creates route actors on first use
+
+    known_routes: optional callable returning the valid route_ids, so client-supplied
+    junk never spawns an actor (get() raises KeyError, send() drops the command).
+    on_command: passed to every RouteActor (e.g. MetricsRegistry.observe_route_command)
+    """
+    def __init__(self, socketio, known_routes=None, on_command=None):
+        self._socketio = socketio
+        self._known_routes = known_routes
+        self._on_command = on_command
+        self._actors = {}
+
+    def get(self, route_id):
+        actor = self._actors.get(route_id)
+        if actor is None:
+            if self._known_routes is not None and route_id not in self._known_routes():
+                raise KeyError(route_id)
+            actor = RouteActor(route_id, self._socketio, self._on_command)
+            self._actors[route_id] = actor
+        return actor
+
+    def send(self, route_id, fn, *args, **kwargs):
+        """Returns False if route_id is unknown and the command was dropped"""
+        try:
+            actor = self.get(route_id)
+        except KeyError:
+            return False
+        actor.send(fn, *args, **kwargs)
+        return True
+
+    def call(self, route_id, fn, *args, **kwargs):
+        return self.get(route_id).call(fn, *args, **kwargs)
+
+    def stats(self):
+        return {route_id: actor.stats() for route_id, actor in list(self._actors.items())}
@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""
+Route Compiler
+Builds every route artifact ahead of deploy, so the web process only loads a
+file and never calls OSRM or sleeps at startup:
+
+- geometry: stops + road waypoints, in travel order
+- chainage: cumulative km along the geometry
+- stop-distance tables: forward/backward km from start per stop (manual_distances.py)
+- spatial index: a lat/lng grid of point indices for nearest-point lookups
+
+python route_compiler.py            # reuse known geometry, stops-only for new/changed routes
+python route_compiler.py --osrm     # fetch road geometry from OSRM for new/changed routes
+python route_compiler.py --osrm --osrm-server http://127.0.0.1:5005 --osrm-rate 0   # local/fake OSRM
+python route_compiler.py --check    # exit 1 if route_artifacts.json is missing or stale
+
+Inputs: route_stops.ORIGINAL_STOPS, manual_distances.ROUTE_SEGMENT_DISTANCES
+Output: route_artifacts.json (versioned, with a fingerprint of the inputs)
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+from manual_distances import ROUTE_SEGMENT_DISTANCES
+from osrm_client import OSRM_CACHE_DIR, OSRM_MAX_WORKERS, OSRM_RATE_LIMIT, OSRM_SERVER, OSRMClient
+from route_stops import ORIGINAL_STOPS
+
+ROUTE_ARTIFACTS_FILE = 'route_artifacts.json'
+ARTIFACT_VERSION = 1
+LEGACY_WAYPOINTS_FILE = 'route_waypoints.json' # Geometry cache written by older servers
+WAYPOINTS_PER_KM = 10
+GRID_CELL_DEG = 0.005 # ~550 m cells
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """
+    Calculate haversine distance between two points
+    Returns distance in kilometers
+    """
+    R = 6371
+    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return R * c
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+def route_fingerprint(route_id):
+    """Changes whenever a route's stops or segment distances change"""
+    return _digest([ORIGINAL_STOPS.get(route_id), ROUTE_SEGMENT_DISTANCES.get(route_id)])
+
+
+def source_fingerprint():
+    return _digest({route_id: route_fingerprint(route_id) for route_id in ORIGINAL_STOPS})
+
+
+# OSRM geometry (build time only) ---------------------------------------------
+
+def decode_polyline_array(polyline_str, precision=5):
+    """
+    Decode an encoded polyline into (lats, lngs) float arrays without a per-character loop
+    Raises ValueError on a truncated/malformed string
+    """
+    if not polyline_str:
+        return np.empty(0), np.empty(0)
+    chunks = np.frombuffer(polyline_str.encode('ascii'), dtype=np.uint8).astype(np.int64) - 63
+    if chunks.min() < 0 or chunks[-1] >= 0x20:
+        raise ValueError("Malformed polyline")
+    
+    # Each value is a run of 5-bit chunks, little end first; the last chunk has bit 0x20 clear
+    ends = chunks < 0x20
+    starts = np.flatnonzero(np.concatenate(([True], ends[:-1])))
+    value_index = np.cumsum(np.concatenate(([0], ends[:-1])))
+    shift = 5 * (np.arange(len(chunks)) - starts[value_index])
+    values = np.add.reduceat((chunks & 0x1f) << shift, starts)
+    if len(values) % 2:
+        raise ValueError("Malformed polyline")
+    
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+    coordinates = np.cumsum(deltas.reshape(-1, 2), axis=0) / 10 ** precision
+    return coordinates[:, 0], coordinates[:, 1]
+
+
+def decode_polyline(polyline_str):
+    """
+    Decode OSRM polyline to list of coordinates
+    Returns list of (lat, lng) tuples
+    """
+    lats, lngs = decode_polyline_array(polyline_str)
+    return list(zip(lats.tolist(), lngs.tolist()))
+
+
+def get_osrm_route_geometry(route, lat1, lon1, lat2, lon2):
+    """
+    Road geometry from an OSRM route (OSRMClient.route) with sanity checks
+    Returns ((lats, lngs) arrays, km), or (None, ...) when unusable
+    """
+    if not route:
+        return None, None
+    try:
+        geometry = route.get('geometry', '')
+        distance_m = route.get('distance', 0)
+        
+        coordinates = decode_polyline_array(geometry)
+        if len(coordinates[0]) < 2:
+            return None, None
+        
+        haversine_dist = haversine_distance(lat1, lon1, lat2, lon2)
+        
+        if distance_m / 1000 < haversine_dist * 0.5 and haversine_dist > 0.1:
+            return None, haversine_dist
+        
+        return coordinates, distance_m / 1000.0
+    except Exception as e:
+        return None, None
+
+
+def resample_polyline(lats, lngs, spacing_km, offset_km=None):
+    """
+    Points at exact arc-length intervals along a polyline, at offset_km, offset_km + spacing_km, ...
+    (strictly inside the polyline; offset_km defaults to spacing_km)
+    Returns (lats, lngs, polyline length km)
+    """
+    steps = haversine_distance(lats[:-1], lngs[:-1], lats[1:], lngs[1:])
+    chainage = np.concatenate(([0.0], np.cumsum(steps)))
+    length = float(chainage[-1])
+    start = spacing_km if offset_km is None else max(offset_km, 1e-9) # Never on the first point itself
+    targets = np.arange(start, length, spacing_km)
+    return np.interp(targets, chainage, lats), np.interp(targets, chainage, lngs), length
+
+
+def route_segments(route_stops):
+    """(lat1, lng1, lat2, lng2) of every stop-to-stop segment long enough to ask OSRM about"""
+    segments = []
+    for current_stop, next_stop in zip(route_stops, route_stops[1:]):
+        if haversine_distance(current_stop['lat'], current_stop['lng'], next_stop['lat'], next_stop['lng']) >= 0.05:
+            segments.append((current_stop['lat'], current_stop['lng'], next_stop['lat'], next_stop['lng']))
+    return segments
+
+
+def generate_waypoints_from_osrm(route_stops, waypoints_per_km=10, client=None):
+    """
+    Generate waypoints using OSRM geometry (ONE-TIME OPERATION)
+    Validates each segment to prevent double-counting
+    All segments are fetched up front through the client (concurrent, disk-cached)
+    """
+    client = client or OSRMClient()
+    segments = route_segments(route_stops)
+    routes = dict(zip(segments, client.route_many(segments)))
+    
+    enhanced_route = []
+    total_distance = 0
+    total_waypoints_added = 0
+    spacing_km = 1.0 / waypoints_per_km
+    next_waypoint_km = spacing_km # Road distance into the next segment where the next waypoint falls
+    osrm_segments = 0
+    haversine_segments = 0
+    
+    # Calculate expected haversine distance for validation
+    expected_haversine = 0
+    for i in range(len(route_stops) - 1):
+        dist = haversine_distance(
+            route_stops[i]['lat'], route_stops[i]['lng'],
+            route_stops[i+1]['lat'], route_stops[i+1]['lng']
+        )
+        expected_haversine += dist
+    
+    print(f" Expected haversine distance: {expected_haversine:.2f} km")
+    
+    for i in range(len(route_stops)):
+        stop = route_stops[i].copy()
+        stop['is_stop'] = True
+        enhanced_route.append(stop)
+        
+        if i < len(route_stops) - 1:
+            current_stop = route_stops[i]
+            next_stop = route_stops[i + 1]
+            
+            haversine_dist = haversine_distance(
+                current_stop['lat'], current_stop['lng'],
+                next_stop['lat'], next_stop['lng']
+            )
+            
+            print(f" Segment {i+1}: {current_stop['name'][:20]:20} → {next_stop['name'][:20]:20} (haversine: {haversine_dist:.3f} km) ... ", end='', flush=True)
+            
+            if haversine_dist < 0.05:
+                total_distance += haversine_dist
+                haversine_segments += 1
+                next_waypoint_km = spacing_km
+                print(f"skip (too short)")
+                continue
+            
+            segment = (current_stop['lat'], current_stop['lng'], next_stop['lat'], next_stop['lng'])
+            geometry, distance = get_osrm_route_geometry(routes.get(segment), *segment)
+            
+            # ✅ VALIDATION: OSRM distance should be within reasonable range of haversine
+            if geometry is not None and distance and distance > 0:
+                # If OSRM distance is more than 2x haversine, reject it
+                if distance > haversine_dist * 2.5:
+                    print(f"REJECTED (OSRM: {distance:.3f} km is {distance/haversine_dist:.1f}x haversine), using haversine")
+                    total_distance += haversine_dist
+                    haversine_segments += 1
+                    next_waypoint_km = spacing_km
+                else:
+                    total_distance += distance
+                    osrm_segments += 1
+                    print(f"OK (OSRM: {distance:.3f} km)")
+                    
+                    # Exact road spacing, continued across stops, so consecutive waypoints of a
+                    # stretch of OSRM segments are all spacing_km apart along the road
+                    wp_lats, wp_lngs, length = resample_polyline(*geometry, spacing_km, next_waypoint_km)
+                    next_waypoint_km += len(wp_lats) * spacing_km - length
+                    for idx, (lat, lng) in enumerate(zip(wp_lats.tolist(), wp_lngs.tolist())):
+                        waypoint = {
+                            'id': None,
+                            'name': f'WP_{i+1}_{idx+1}',
+                            'lat': lat,
+                            'lng': lng,
+                            'is_stop': False
+                        }
+                        enhanced_route.append(waypoint)
+                        total_waypoints_added += 1
+            else:
+                print(f"OSRM failed, using haversine")
+                total_distance += haversine_dist
+                haversine_segments += 1
+                next_waypoint_km = spacing_km
+    
+    print(f"\n Validation:")
+    print(f" Expected (haversine): {expected_haversine:.2f} km")
+    print(f" Calculated (mixed): {total_distance:.2f} km")
+    print(f" Ratio: {total_distance/expected_haversine:.2f}x")
+    
+    # ✅ If total distance is more than 1.5x expected, something is wrong
+    if total_distance > expected_haversine * 1.8:
+        print(f" ⚠️ WARNING: Distance seems doubled! Using haversine fallback.")
+        # Rebuild with haversine only
+        enhanced_route = []
+        total_distance = 0
+        for i in range(len(route_stops)):
+            stop = route_stops[i].copy()
+            stop['is_stop'] = True
+            enhanced_route.append(stop)
+            
+            if i < len(route_stops) - 1:
+                dist = haversine_distance(
+                    route_stops[i]['lat'], route_stops[i]['lng'],
+                    route_stops[i+1]['lat'], route_stops[i+1]['lng']
+                )
+                total_distance += dist
+    
+    return enhanced_route, total_distance
+
+
+# Compilation ------------------------------------------------------------------
+
+def stops_only_geometry(route_id):
+    points = [stop.copy() for stop in ORIGINAL_STOPS[route_id]]
+    for point in points:
+        point['is_stop'] = True
+    return points
+
+
+def stop_distance_tables(route_id):
+    """
+    Forward/backward km from start per stop id, from the manually measured segments
+    Returns (tables, total km), or (None, None) when the segments are missing or don't match the stops
+    """
+    stops = ORIGINAL_STOPS[route_id]
+    segments = ROUTE_SEGMENT_DISTANCES.get(route_id)
+    if not segments or segments[0] == 0 or len(segments) != len(stops) - 1:
+        return None, None
+
+    forward = np.concatenate(([0.0], np.cumsum(segments)))
+    total = float(forward[-1])
+    tables = {
+        'forward': {stop['id']: float(d) for stop, d in zip(stops, forward)},
+        'backward': {stop['id']: total - float(d) for stop, d in zip(stops, forward)}
+    }
+    return tables, total
+
+
+def build_grid_index(points, cell_deg=GRID_CELL_DEG):
+    """
+    Grid cell "i:j" -> indices of the points inside it. A nearest point found in the
+    3×3 cells around a query is the true nearest when it is closer than reach_km.
+    """
+    cells = {}
+    for idx, point in enumerate(points):
+        key = f"{int(np.floor(point['lat'] / cell_deg))}:{int(np.floor(point['lng'] / cell_deg))}"
+        cells.setdefault(key, []).append(idx)
+    max_lat = max(abs(point['lat']) for point in points)
+    reach_km = cell_deg * min(110.57, 111.32 * np.cos(np.radians(max_lat)))
+    return {'cell_deg': cell_deg, 'reach_km': float(reach_km), 'cells': cells}
+
+
+def compile_route(route_id, points, geometry_source):
+    lats = np.array([point['lat'] for point in points])
+    lngs = np.array([point['lng'] for point in points])
+    steps = haversine_distance(lats[:-1], lngs[:-1], lats[1:], lngs[1:]) if len(points) > 1 else np.array([])
+    tables, total = stop_distance_tables(route_id)
+    return {
+        'fingerprint': route_fingerprint(route_id),
+        'geometry_source': geometry_source,
+        'points': points,
+        'chainage_km': np.concatenate(([0.0], np.cumsum(steps))).round(5).tolist(),
+        'stop_distances': tables,
+        'total_distance_km': total,
+        'grid': build_grid_index(points)
+    }
+
+
+def _legacy_waypoints():
+    if not os.path.isfile(LEGACY_WAYPOINTS_FILE):
+        return {}
+    with open(LEGACY_WAYPOINTS_FILE, 'r') as f:
+        return json.load(f)
+
+
+def compile_routes(previous=None, use_osrm=False, force=False, verbose=False, osrm_client=None):
+    """
+    Artifacts for every route in ORIGINAL_STOPS. Geometry comes from `previous`
+    artifacts when the route is unchanged, then OSRM (only with use_osrm), then
+    route_waypoints.json, else the stops alone. Never touches the network unless use_osrm.
+    With use_osrm, unchanged routes that only have stop geometry are fetched again.
+    """
+    previous_routes = (previous or {}).get('routes', {})
+
+    def unchanged(route_id):
+        old = previous_routes.get(route_id)
+        if use_osrm and old and old['geometry_source'] == 'stops':
+            return False
+        return old and not force and old['fingerprint'] == route_fingerprint(route_id)
+
+    if use_osrm:
+        # Fetch every needed segment of every route in one concurrent batch
+        osrm_client = osrm_client or OSRMClient()
+        segments = list(dict.fromkeys(segment for route_id, stops in ORIGINAL_STOPS.items() if not unchanged(route_id)
+                                      for segment in route_segments(stops)))
+        if segments:
+            start = time.perf_counter()
+            osrm_client.route_many(segments)
+            if verbose:
+                stats = osrm_client.stats()
+                print(f"🌐 OSRM: {len(segments)} segments in {time.perf_counter() - start:.1f}s "
+                      f"({stats['cache_hits']} cached, {stats['fetched']} fetched, {stats['failed']} failed)")
+
+    legacy = None
+    routes = {}
+    for route_id, stops in ORIGINAL_STOPS.items():
+        if unchanged(route_id):
+            old = previous_routes[route_id]
+            points, source = old['points'], old['geometry_source']
+        elif use_osrm:
+            if verbose:
+                print(f"\n📍 Building OSRM geometry for route {route_id} ({len(stops)} stops)")
+            points, _ = generate_waypoints_from_osrm(stops, WAYPOINTS_PER_KM, osrm_client)
+            source = 'osrm'
+        else:
+            if legacy is None:
+                legacy = _legacy_waypoints()
+            cached = legacy.get(route_id)
+            cached_stops = [p for p in cached or [] if p.get('is_stop', True)]
+            if cached and [(s['id'], s['lat'], s['lng']) for s in cached_stops] == [(s['id'], s['lat'], s['lng']) for s in stops]:
+                points, source = cached, 'waypoints_file'
+            else:
+                points, source = stops_only_geometry(route_id), 'stops'
+        routes[route_id] = compile_route(route_id, points, source)
+
+    return {
+        'version': ARTIFACT_VERSION,
+        'built_at': datetime.now().isoformat(),
+        'fingerprint': source_fingerprint(),
+        'routes': routes
+    }
+
+
+def save_route_artifacts(artifacts, path=ROUTE_ARTIFACTS_FILE):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(artifacts, f)
+    os.replace(tmp_path, path)
+
+
+def load_route_artifacts(path=ROUTE_ARTIFACTS_FILE):
+    """Compiled artifacts with int stop ids restored; None if the file is missing, ValueError on another version"""
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'r') as f:
+        artifacts = json.load(f)
+    if artifacts.get('version') != ARTIFACT_VERSION:
+        raise ValueError(f"Unsupported route artifact version {artifacts.get('version')}")
+    for route in artifacts['routes'].values():
+        if route['stop_distances']:
+            route['stop_distances'] = {
+                direction: {int(stop_id): km for stop_id, km in table.items()}
+                for direction, table in route['stop_distances'].items()
+            }
+    return artifacts
+
+
+def stale_routes(artifacts):
+    """Route ids whose stops/segments changed (or were added/removed) since artifacts were built"""
+    built = artifacts.get('routes', {}) if artifacts else {}
+    changed = {route_id for route_id in ORIGINAL_STOPS
+               if route_id not in built or built[route_id]['fingerprint'] != route_fingerprint(route_id)}
+    return sorted(changed | (set(built) - set(ORIGINAL_STOPS)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile route geometry, distances and spatial indexes')
+    parser.add_argument('--output', default=ROUTE_ARTIFACTS_FILE)
+    parser.add_argument('--osrm', action='store_true', help='Fetch road geometry from OSRM for new/changed routes')
+    parser.add_argument('--force', action='store_true', help='Rebuild geometry for every route, not just changed ones')
+    parser.add_argument('--check', action='store_true', help='Only verify the artifacts are present and up to date')
+    parser.add_argument('--osrm-server', default=OSRM_SERVER)
+    parser.add_argument('--osrm-cache', default=OSRM_CACHE_DIR, help='Directory of cached OSRM responses')
+    parser.add_argument('--osrm-workers', type=int, default=OSRM_MAX_WORKERS, help='Concurrent OSRM requests')
+    parser.add_argument('--osrm-rate', type=float, default=OSRM_RATE_LIMIT,
+                        help='Max OSRM requests per second (0 = unlimited, for self-hosted servers)')
+    args = parser.parse_args()
+
+    try:
+        previous = load_route_artifacts(args.output)
+    except ValueError as e:
+        print(f"⚠ Ignoring {args.output}: {e}")
+        previous = None
+
+    if args.check:
+        if previous is None:
+            print(f"✗ {args.output} is missing, run: python route_compiler.py")
+            raise SystemExit(1)
+        changed = stale_routes(previous)
+        if changed:
+            print(f"✗ {args.output} is stale for routes: {', '.join(changed)}")
+            raise SystemExit(1)
+        print(f"✓ {args.output} is up to date ({len(previous['routes'])} routes, built {previous['built_at']})")
+        raise SystemExit(0)
+
+    start = time.perf_counter()
+    client = OSRMClient(args.osrm_server, args.osrm_cache, args.osrm_workers, args.osrm_rate) if args.osrm else None
+    artifacts = compile_routes(previous, use_osrm=args.osrm, force=args.force, verbose=True, osrm_client=client)
+    if client:
+        client.close()
+    save_route_artifacts(artifacts, args.output)
+
+    print("=" * 70)
+    print(f"✓ Wrote {args.output} in {time.perf_counter() - start:.1f}s ({os.path.getsize(args.output) / 1024:.1f} KB)")
+    for route_id, route in artifacts['routes'].items():
+        stops = sum(1 for point in route['points'] if point.get('is_stop', True))
+        total = f"{route['total_distance_km']:.3f} km" if route['total_distance_km'] else "no segment distances"
+        print(f"  - Route {route_id}: {stops} stops, {len(route['points']) - stops} waypoints "
+              f"(geometry: {route['geometry_source']}), {total}, {len(route['grid']['cells'])} grid cells")
+        if route['geometry_source'] == 'stops':
+            print(f"    ⚠ No road geometry yet, run with --osrm to fetch it")
+    print("=" * 70)
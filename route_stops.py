@@ -0,0 +1,105 @@
+"""
+Bus Route Stops - All Routes
+Stop coordinates in travel order (forward direction); the single source for
+route_compiler.py and the server's fallback when no compiled routes exist
+"""
+
+# Original Bus Stops (Only actual stops)
+ORIGINAL_STOPS = {
+    '48AC': [
+        {'id': 1, 'name': 'Thirupallai', 'lat': 9.9720416, 'lng': 78.1394837},
+        {'id': 2, 'name': 'Towards Iyer Bunglow', 'lat': 9.9718078, 'lng': 78.1392859},
+        {'id': 3, 'name': 'Iyer Bungalow', 'lat': 9.9673249, 'lng': 78.1366866},
+        {'id': 4, 'name': 'Reserve Line', 'lat': 9.9556417, 'lng': 78.1326311},
+        {'id': 5, 'name': 'Race Course', 'lat': 9.9437216, 'lng': 78.1355206},
+        {'id': 6, 'name': 'Pandian Hotel', 'lat': 9.9387971, 'lng': 78.1366364},
+        {'id': 7, 'name': 'Thallakulam', 'lat': 9.9343902, 'lng': 78.1339649},
+        {'id': 8, 'name': 'Tamukam', 'lat': 9.9310613, 'lng': 78.1319157},
+        {'id': 9, 'name': 'Goripalaiyam', 'lat': 9.9291406, 'lng': 78.1292637},
+        {'id': 10, 'name': 'A.V. Bridge Endpoint', 'lat': 9.9245982, 'lng': 78.124677},
+        {'id': 11, 'name': 'Towards Simakkal', 'lat': 9.9239324, 'lng': 78.1240654},
+        {'id': 12, 'name': 'Simakkal', 'lat': 9.9245618, 'lng': 78.1223503},
+        {'id': 13, 'name': 'Towards Setupathi School', 'lat': 9.9247943, 'lng': 78.1176725},
+        {'id': 14, 'name': 'Settupathi School', 'lat': 9.9240122, 'lng': 78.1134239},
+        {'id': 15, 'name': 'Railway Junction', 'lat': 9.9178614, 'lng': 78.1121365},
+        {'id': 16, 'name': 'Reaching Preiyar', 'lat': 9.9161166, 'lng': 78.1127373},
+        {'id': 17, 'name': 'Periyar Bus Stand', 'lat': 9.915244, 'lng': 78.1115843},
+        {'id': 18, 'name': 'Crime Branch', 'lat': 9.9117515, 'lng': 78.1118909},
+        {'id': 19, 'name': 'Tamilnadu Polytechnic', 'lat': 9.9094264, 'lng': 78.1098096},
+        {'id': 20, 'name': 'Vasantha Nagar', 'lat': 9.9060655, 'lng': 78.0991451},
+        {'id': 21, 'name': 'Pallanganatham', 'lat': 9.9015843, 'lng': 78.0948536},
+        {'id': 22, 'name': 'Paikara', 'lat': 9.8953204, 'lng': 78.0858491},
+        {'id': 23, 'name': 'Pasumalai', 'lat': 9.8937178, 'lng': 78.0789968},
+        {'id': 24, 'name': 'Mannar College', 'lat': 9.8929532, 'lng': 78.0770855},
+        {'id': 25, 'name': 'Towards Thiruparakundram', 'lat': 9.886379, 'lng': 78.0741243},
+        {'id': 26, 'name': 'Harveypatti', 'lat': 9.8804812, 'lng': 78.0648546},
+        {'id': 27, 'name': 'Amman Tiffen', 'lat': 9.8809416, 'lng': 78.0562862},
+        {'id': 28, 'name': 'Thirunagar 3Rd Stop', 'lat': 9.8821005, 'lng': 78.053083}
+    ],
+    '23': [
+        {'id': 1, 'name': 'Thirupallai', 'lat': 9.9720416, 'lng': 78.1394837},
+        {'id': 2, 'name': 'Towards Iyer Bunglow', 'lat': 9.9718078, 'lng': 78.1392859},
+        {'id': 3, 'name': 'Iyer Bungalow', 'lat': 9.9673249, 'lng': 78.1366866},
+        {'id': 4, 'name': 'Reserve Line', 'lat': 9.9556417, 'lng': 78.1326311},
+        {'id': 5, 'name': 'Race Course', 'lat': 9.9437216, 'lng': 78.1355206},
+        {'id': 6, 'name': 'Pandian Hotel', 'lat': 9.9387971, 'lng': 78.1366364},
+        {'id': 7, 'name': 'Thallakulam', 'lat': 9.9343902, 'lng': 78.1339649},
+        {'id': 8, 'name': 'Tamukam', 'lat': 9.9310613, 'lng': 78.1319157},
+        {'id': 9, 'name': 'Goripalaiyam', 'lat': 9.9291406, 'lng': 78.1292637},
+        {'id': 10, 'name': 'A.V. Bridge Endpoint', 'lat': 9.9245982, 'lng': 78.124677},
+        {'id': 11, 'name': 'Towards Simakkal', 'lat': 9.9239324, 'lng': 78.1240654},
+        {'id': 12, 'name': 'Simakkal', 'lat': 9.9245618, 'lng': 78.1223503},
+        {'id': 13, 'name': 'Towards Setupathi School', 'lat': 9.9247943, 'lng': 78.1176725},
+        {'id': 14, 'name': 'Settupathi School', 'lat': 9.9240122, 'lng': 78.1134239},
+        {'id': 15, 'name': 'Railway Junction', 'lat': 9.9178614, 'lng': 78.1121365},
+        {'id': 16, 'name': 'Reaching Preiyar', 'lat': 9.9161166, 'lng': 78.1127373},
+        {'id': 17, 'name': 'Periyar Bus Stand', 'lat': 9.915244, 'lng': 78.1115843}
+    ],
+    "madurai-saptur": [
+        {'id': 1, 'name': 'Sappur Bus Stand', 'lat': 9.7723817, 'lng': 77.7374431},
+        {'id': 2, 'name': 'Sappur Forest Office', 'lat': 9.7755529, 'lng': 77.737918},
+        {'id': 3, 'name': 'Siva Crusher', 'lat': 9.7737385, 'lng': 77.7858195},
+        {'id': 4, 'name': 'Sappur Road', 'lat': 9.7432873, 'lng': 77.7904612},
+        {'id': 5, 'name': 'Ponnamal CBSC School', 'lat': 9.7665694, 'lng': 77.7882914},
+        {'id': 6, 'name': 'Peraiyur Court', 'lat': 9.7567696, 'lng': 77.7893734},
+        {'id': 7, 'name': 'Peraiyur Mukkusaalai', 'lat': 9.7430768, 'lng': 77.7910007},
+        {'id': 8, 'name': 'Peraiyur Bustand', 'lat': 9.7389502, 'lng': 77.7906355},
+        {'id': 9, 'name': 'Kilangulam', 'lat': 9.7304061, 'lng': 77.8272974},
+        {'id': 10, 'name': 'Linga Bar', 'lat': 9.7226814, 'lng': 77.8362759},
+        {'id': 11, 'name': 'Thevankurichi', 'lat': 9.7235742, 'lng': 77.8410545},
+        {'id': 12, 'name': 'T.Kallupatti Bus Stand', 'lat': 9.7206795, 'lng': 77.8508348},
+        {'id': 13, 'name': 'Kunnathur Bus Stop', 'lat': 9.7505023, 'lng': 77.8888632},
+        {'id': 14, 'name': 'Glanis', 'lat': 9.7740229, 'lng': 77.9093458},
+        {'id': 15, 'name': 'Aalambatti', 'lat': 9.8018663, 'lng': 77.9596753},
+        {'id': 16, 'name': 'Temple City', 'lat': 9.7885873, 'lng': 77.9421658},
+        {'id': 17, 'name': 'Kumaran Sweets', 'lat': 9.8133634, 'lng': 77.9771267},
+        {'id': 18, 'name': 'Tirumangalam Firestation', 'lat': 9.8122745, 'lng': 77.9844116},
+        {'id': 19, 'name': 'Aanandha Theatre', 'lat': 9.8235956, 'lng': 77.986501},
+        {'id': 20, 'name': 'Thirumangalam Bus Stand', 'lat': 9.8270958, 'lng': 77.9903955},
+        {'id': 21, 'name': 'Kappalur Toll Gate', 'lat': 9.8449551, 'lng': 78.0113708},
+        {'id': 22, 'name': 'Mill Gate', 'lat': 9.8352877, 'lng': 78.0011298},
+        {'id': 23, 'name': 'Indian Oil Old Thirumangalam Road', 'lat': 9.8346501, 'lng': 78.0445027},
+        {'id': 24, 'name': 'Mandela Nagar', 'lat': 9.8414792, 'lng': 78.1051064},
+        {'id': 25, 'name': 'Towards Mattuthavani', 'lat': 9.8358971, 'lng': 78.037723},
+        {'id': 26, 'name': 'Towards Mattuthavani', 'lat': 9.8484554, 'lng': 78.0153539},
+        {'id': 27, 'name': 'Towards Mattuthavani', 'lat': 9.8344319, 'lng': 78.0663435},
+        {'id': 28, 'name': 'Towards Mathuthavani', 'lat': 9.831472, 'lng': 78.0781023},
+        {'id': 29, 'name': 'Towards Mattithavani', 'lat': 9.8269897, 'lng': 78.080763},
+        {'id': 30, 'name': 'Towards Mattuthavani', 'lat': 9.8246217, 'lng': 78.0928845},
+        {'id': 31, 'name': 'Towards Mathuthavani', 'lat': 9.829696, 'lng': 78.0955452},
+        {'id': 32, 'name': 'Valayangulam', 'lat': 9.8328868, 'lng': 78.1032648},
+        {'id': 33, 'name': 'Towards Airport', 'lat': 9.8373478, 'lng': 78.1041231},
+        {'id': 34, 'name': 'Chinthamani Toll Plaza', 'lat': 9.8821239, 'lng': 78.1390886},
+        {'id': 35, 'name': 'Vellamal Hospital', 'lat': 9.8851023, 'lng': 78.1498333},
+        {'id': 36, 'name': 'Meenatchi Hotel', 'lat': 9.8971065, 'lng': 78.1625559},
+        {'id': 37, 'name': 'Vandiyur Toll Plaza', 'lat': 9.9222622, 'lng': 78.1697644},
+        {'id': 38, 'name': 'Towards Vasantham Traders', 'lat': 9.9130317, 'lng': 78.1703246},
+        {'id': 39, 'name': 'Service Road', 'lat': 9.9318083, 'lng': 78.1688223},
+        {'id': 40, 'name': 'Pandi Kovil', 'lat': 9.9343941, 'lng': 78.1680154},
+        {'id': 41, 'name': 'HCL Villaku', 'lat': 9.9389473, 'lng': 78.1666767},
+        {'id': 42, 'name': 'Melur Cut Road', 'lat': 9.9491978, 'lng': 78.1634435},
+        {'id': 43, 'name': 'Saravana Stores', 'lat': 9.9477118, 'lng': 78.1604699},
+        {'id': 44, 'name': 'Omni Bus Stand', 'lat': 9.9460579, 'lng': 78.1575302},
+        {'id': 45, 'name': 'Mattuthavani Bus Stand / M.G.R. Nillaiyam', 'lat': 9.9455227, 'lng': 78.1565945}
+    ]
+}
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Route-Sharded Launcher
+Starts the backplane broker plus one single-worker gunicorn process per shard,
+each owning a subset of routes (see sharding.py)
+
+Usage:
+  python run_shards.py --shards 4 --base-port 5000 --public-url "http://localhost:{port}"
+  python run_shards.py --shards 2 --public-url "https://bus{index}.example.com"
+  python run_shards.py --shards 2 --public-url "https://bus{index}.example.com" --message-queue redis://localhost:6379/0
+
+--public-url is required for more than one shard: clients are redirected to
+these URLs, so they must be reachable from the passenger and driver pages.
+On Render, deploy render.sharded.yaml instead (one web service per shard).
+"""
+import argparse
+import os
+import secrets
+import subprocess
+import sys
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the bus tracker as route-sharded processes')
+    parser.add_argument('--shards', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--base-port', type=int, default=5000)
+    parser.add_argument('--public-url',
+                        help='Public base URL per shard; {index} and {port} are substituted '
+                             '(required for more than one shard)')
+    parser.add_argument('--message-queue', default=None,
+                        help='redis://... / amqp://... (default: start the in-repo backplane)')
+    parser.add_argument('--backplane-port', type=int, default=6380)
+    parser.add_argument('--route-map', default=os.environ.get('SHARD_ROUTE_MAP', ''),
+                        help='Explicit placement, e.g. "48AC=0,23=1,madurai-saptur=1"')
+    args = parser.parse_args()
+    if args.public_url is None:
+        if args.shards > 1:
+            parser.error('--public-url is required with more than one shard, e.g. "https://bus{index}.example.com"')
+        args.public_url = 'http://localhost:{port}'
+
+    processes = []
+    message_queue = args.message_queue
+    if not message_queue:
+        processes.append(subprocess.Popen([sys.executable, 'backplane.py', '--port', str(args.backplane_port)]))
+        message_queue = f"backplane://127.0.0.1:{args.backplane_port}"
+        time.sleep(0.5)
+
+    ports = [args.base_port + i for i in range(args.shards)]
+    urls = [args.public_url.format(index=i, port=port) for i, port in enumerate(ports)]
+
+    env = os.environ.copy()
+    env.update({
+        'SHARD_COUNT': str(args.shards),
+        'SHARD_URLS': ','.join(urls),
+        'SHARD_ROUTE_MAP': args.route_map,
+        'SOCKETIO_MESSAGE_QUEUE': message_queue,
+        # Driver session tokens must verify on every shard
+        'SECRET_KEY': env.get('SECRET_KEY') or secrets.token_hex(32)
+    })
+
+    print("=" * 80)
+    print(f"🧩 Starting {args.shards} route shards (message queue: {message_queue})")
+    for i, (port, url) in enumerate(zip(ports, urls)):
+        shard_env = dict(env, SHARD_INDEX=str(i), PORT=str(port))
+        processes.append(subprocess.Popen([
+            'gunicorn', '--worker-class', 'eventlet', '-w', '1',
+            '--bind', f"{args.host}:{port}", '--timeout', '120', 'app:app'
+        ], env=shard_env))
+        print(f"  - Shard {i + 1}: {url}")
+    print("=" * 80)
+
+    try:
+        while all(p.poll() is None for p in processes):
+            time.sleep(1)
+        print("✗ A shard process exited, shutting down the rest...")
+    except KeyboardInterrupt:
+        print("\n✗ Shutting down shards...")
+    finally:
+        for p in processes:
+            if p.poll() is None:
+                p.terminate()
+        for p in processes:
+            p.wait()
+
+
+if __name__ == '__main__':
+    main()
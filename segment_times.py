@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Segment Travel-Time Tables
+Offline job that learns how long each stop-to-stop segment takes, per
+(route, segment, direction, hour-of-week), from bus_locations.csv and
+bus_history.csv, plus the loader the server uses for O(1) ETA lookups
+
+Build:  python segment_times.py            (writes segment_times.npz)
+        python segment_times.py --min-samples 5 --percentiles 50 90
+
+Stop chainage comes from route_artifacts.json (python route_compiler.py).
+
+The artifact is a plain .npz (no pickle): one float32 array of travel
+seconds per route/direction shaped (segments, 168 hours, percentiles),
+plus a JSON metadata string.
+"""
+import argparse
+import csv
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+from route_compiler import ROUTE_ARTIFACTS_FILE, load_route_artifacts
+
+LOCATIONS_FILE = 'bus_locations.csv'
+HISTORY_FILE = 'bus_history.csv'
+SEGMENT_TIMES_FILE = 'segment_times.npz'
+TABLE_VERSION = 1
+HOURS_PER_WEEK = 168
+TRIP_GAP_SECONDS = 600 # A pause longer than this starts a new trip
+TRIP_RESET_KM = 0.5 # Chainage dropping by more than this starts a new trip
+
+# Row layouts the server writes today. A log keeps the header it was created with, so an
+# older file (e.g. the committed bus_locations.csv) can hold these wider rows under it.
+LOCATION_COLUMNS = ['timestamp', 'route_id', 'bus_id', 'driver_id', 'latitude', 'longitude', 'traffic_level',
+                    'nearest_stop_id', 'nearest_stop_name', 'distance_to_stop_km', 'distance_from_start_km',
+                    'speed_kmh', 'available_seats']
+HISTORY_COLUMNS = ['timestamp', 'route_id', 'bus_id', 'driver_id', 'stop_id', 'stop_name', 'predicted_time_min',
+                   'actual_time_min', 'distance_km', 'distance_from_start_km', 'speed_kmh', 'available_seats']
+
+
+def hour_of_week(when):
+    return when.weekday() * 24 + when.hour
+
+
+def load_stop_chainage(path=ROUTE_ARTIFACTS_FILE):
+    """(route_id, direction) -> (stop ids, chainage km) in travel order, from the compiled route artifacts"""
+    artifacts = load_route_artifacts(path)
+    if artifacts is None:
+        raise FileNotFoundError(f"{path} not found, run: python route_compiler.py")
+
+    chainage = {}
+    for route_id, route in artifacts['routes'].items():
+        for direction, table in (route['stop_distances'] or {}).items():
+            items = sorted((float(distance), stop_id) for stop_id, distance in table.items())
+            chainage[(route_id, direction)] = ([stop_id for _, stop_id in items], np.array([d for d, _ in items]))
+    return chainage
+
+
+def _read_log(path, layout, wanted):
+    """
+    `wanted` columns of a CSV log as a frame of strings, or None when no row has them.
+    Each row is read with the file's own header or `layout`, whichever matches its width.
+    """
+    import pandas as pd
+
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        picks = {}
+        for columns in (layout, header):
+            if all(column in columns for column in wanted):
+                picks[len(columns)] = [columns.index(column) for column in wanted]
+        if not picks:
+            print(f"⚠ Skipping {path}: its rows have no {', '.join(wanted)} columns")
+            return None
+        rows = [[row[i] for i in picks[len(row)]] for row in reader if len(row) in picks]
+    return pd.DataFrame(rows, columns=wanted) if rows else None
+
+
+def _load_fixes():
+    """All logged positions as one frame: timestamp, route_id, bus_id, stop_id, chainage"""
+    import pandas as pd
+
+    frames = []
+    if os.path.isfile(LOCATIONS_FILE):
+        df = _read_log(LOCATIONS_FILE, LOCATION_COLUMNS,
+                       ['timestamp', 'route_id', 'bus_id', 'nearest_stop_id', 'distance_from_start_km'])
+        if df is not None:
+            frames.append(df.rename(columns={'nearest_stop_id': 'stop_id'}))
+    if os.path.isfile(HISTORY_FILE):
+        df = _read_log(HISTORY_FILE, HISTORY_COLUMNS,
+                       ['timestamp', 'route_id', 'bus_id', 'stop_id', 'distance_from_start_km'])
+        if df is not None:
+            frames.append(df)
+    if not frames:
+        return None
+
+    fixes = pd.concat(frames, ignore_index=True)
+    fixes['timestamp'] = pd.to_datetime(fixes['timestamp'], errors='coerce', format='ISO8601')
+    fixes['route_id'] = fixes['route_id'].astype(str)
+    fixes['stop_id'] = pd.to_numeric(fixes['stop_id'], errors='coerce')
+    fixes['distance_from_start_km'] = pd.to_numeric(fixes['distance_from_start_km'], errors='coerce')
+    fixes = fixes.dropna(subset=['timestamp', 'distance_from_start_km', 'stop_id'])
+    return fixes.sort_values(['route_id', 'bus_id', 'timestamp'], kind='stable')
+
+
+def _split_trips(times, chainage):
+    """Indices where a new trip starts (time gap or chainage reset)"""
+    gaps = np.diff(times) > TRIP_GAP_SECONDS
+    resets = np.diff(chainage) < -TRIP_RESET_KM
+    return np.flatnonzero(gaps | resets) + 1
+
+
+def _trip_direction(stop_ids):
+    """Forward trips pass stops in increasing id order, backward trips in decreasing order"""
+    steps = np.sign(np.diff(stop_ids))
+    steps = steps[steps != 0]
+    if len(steps) == 0:
+        return None
+    return 'forward' if steps.sum() >= 0 else 'backward'
+
+
+def build_tables(percentiles=(50, 90), min_samples=3, route_artifacts_file=ROUTE_ARTIFACTS_FILE):
+    """Return {(route_id, direction): table dict} built from the CSV logs"""
+    chainage_by_route = load_stop_chainage(route_artifacts_file)
+    fixes = _load_fixes()
+    if fixes is None:
+        return {}
+
+    # samples[(route, direction)][segment][hour] -> list of seconds
+    samples = {}
+    for (route_id, bus_id), trace in fixes.groupby(['route_id', 'bus_id'], sort=False):
+        times = trace['timestamp'].to_numpy('datetime64[ns]').astype('int64') / 1e9
+        chainage = trace['distance_from_start_km'].to_numpy(dtype=float)
+        stop_ids = trace['stop_id'].to_numpy(dtype=float)
+
+        for trip in np.split(np.arange(len(times)), _split_trips(times, chainage)):
+            if len(trip) < 2:
+                continue
+            direction = _trip_direction(stop_ids[trip])
+            if direction is None or (route_id, direction) not in chainage_by_route:
+                continue
+
+            _, stop_chainage = chainage_by_route[(route_id, direction)]
+            # When did the bus cross each stop's chainage (only inside the observed span)
+            trip_chainage = np.maximum.accumulate(chainage[trip])
+            inside = (stop_chainage >= trip_chainage[0]) & (stop_chainage <= trip_chainage[-1])
+            crossed = np.interp(stop_chainage, trip_chainage, times[trip])
+
+            segments = np.flatnonzero(inside[:-1] & inside[1:])
+            durations = crossed[segments + 1] - crossed[segments]
+            # Naive local timestamps as epoch seconds; 1970-01-01 was a Thursday (hour 72 of the week)
+            hours = (crossed[segments] // 3600 + 72).astype(np.int64) % HOURS_PER_WEEK
+            route_samples = samples.setdefault((route_id, direction), {})
+            for segment, hour, seconds in zip(segments, hours, durations):
+                if seconds <= 0:
+                    continue
+                route_samples.setdefault(int(segment), {}).setdefault(int(hour), []).append(seconds)
+
+    tables = {}
+    for key, (stop_ids, stop_chainage) in chainage_by_route.items():
+        n_segments = len(stop_ids) - 1
+        if n_segments < 1 or key not in samples:
+            continue
+        seconds = np.full((n_segments, HOURS_PER_WEEK, len(percentiles)), np.nan, dtype=np.float32)
+        counts = np.zeros((n_segments, HOURS_PER_WEEK), dtype=np.int32)
+        for segment, by_hour in samples[key].items():
+            all_hours = [s for values in by_hour.values() for s in values]
+            overall = np.percentile(all_hours, percentiles) if len(all_hours) >= min_samples else None
+            for hour in range(HOURS_PER_WEEK):
+                values = by_hour.get(hour, [])
+                counts[segment, hour] = len(values)
+                if len(values) >= min_samples:
+                    seconds[segment, hour] = np.percentile(values, percentiles)
+                elif overall is not None:
+                    seconds[segment, hour] = overall # Sparse hour: fall back to the segment's all-week profile
+        tables[key] = {
+            'stop_ids': stop_ids,
+            'chainage': stop_chainage,
+            'seconds': seconds,
+            'counts': counts
+        }
+    return tables
+
+
+def save_tables(tables, percentiles, path=SEGMENT_TIMES_FILE):
+    arrays = {}
+    index = []
+    for n, ((route_id, direction), table) in enumerate(sorted(tables.items())):
+        index.append({'route_id': route_id, 'direction': direction, 'stop_ids': table['stop_ids']})
+        arrays[f"chainage_{n}"] = table['chainage']
+        arrays[f"seconds_{n}"] = table['seconds']
+        arrays[f"counts_{n}"] = table['counts']
+    meta = {
+        'version': TABLE_VERSION,
+        'built_at': datetime.now().isoformat(),
+        'percentiles': list(percentiles),
+        'tables': index
+    }
+    arrays['meta'] = np.array(json.dumps(meta))
+    np.savez_compressed(path, **arrays)
+
+
+class SegmentTimeTable:
+    """Loaded travel-time tables with per-hour cumulative seconds for prefix-sum lookups"""
+    def __init__(self, meta, tables):
+        self.meta = meta
+        self.percentiles = meta['percentiles']
+        self._tables = tables
+
+    @classmethod
+    def load(cls, path=SEGMENT_TIMES_FILE):
+        """Returns None if the file is missing; raises ValueError on an unknown version"""
+        if not os.path.isfile(path):
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('version') != TABLE_VERSION:
+                raise ValueError(f"Unsupported segment table version {meta.get('version')}")
+
+            tables = {}
+            for n, entry in enumerate(meta['tables']):
+                seconds = data[f"seconds_{n}"]
+                # cumulative[h, p, k] = seconds from the first stop to stop k at hour h
+                zeros = np.zeros((HOURS_PER_WEEK, seconds.shape[2], 1))
+                cumulative = np.concatenate((zeros, np.cumsum(seconds.transpose(1, 2, 0), axis=2)), axis=2)
+                tables[(entry['route_id'], entry['direction'])] = {
+                    'stop_ids': entry['stop_ids'],
+                    'chainage': data[f"chainage_{n}"],
+                    'cumulative': cumulative,
+                    'complete': ~np.isnan(seconds).any(axis=(0, 2)) # per hour: every segment known
+                }
+        return cls(meta, tables)
+
+    def eta_minutes(self, route_id, direction, distance_from_start, when, percentile=50):
+        """
+        (stop ids, minutes) for every stop ahead of a bus at distance_from_start,
+        or None when this route/direction/hour has no complete profile
+        """
+        table = self._tables.get((route_id, direction))
+        if table is None or percentile not in self.percentiles:
+            return None
+        hour = hour_of_week(when)
+        if not table['complete'][hour]:
+            return None
+
+        chainage = table['chainage']
+        cumulative = table['cumulative'][hour, self.percentiles.index(percentile)]
+        here = np.interp(distance_from_start, chainage, cumulative)
+        ahead = np.flatnonzero(chainage > distance_from_start)
+        return [table['stop_ids'][i] for i in ahead], (cumulative[ahead] - here) / 60
+
+    def routes(self):
+        return sorted(self._tables)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build per-segment travel-time tables from the CSV logs')
+    parser.add_argument('--output', default=SEGMENT_TIMES_FILE)
+    parser.add_argument('--route-artifacts', default=ROUTE_ARTIFACTS_FILE)
+    parser.add_argument('--percentiles', type=float, nargs='+', default=[50, 90])
+    parser.add_argument('--min-samples', type=int, default=3,
+                        help='Samples needed before an hour gets its own percentile')
+    args = parser.parse_args()
+
+    percentiles = [int(p) if float(p).is_integer() else p for p in args.percentiles]
+    tables = build_tables(percentiles, args.min_samples, args.route_artifacts)
+    if not tables:
+        print("⚠ No usable trips found in bus_locations.csv / bus_history.csv")
+        raise SystemExit(1)
+
+    save_tables(tables, percentiles, args.output)
+    print(f"✓ Wrote {args.output} ({os.path.getsize(args.output) / 1024:.1f} KB)")
+    for (route_id, direction), table in sorted(tables.items()):
+        known_hours = int((~np.isnan(table['seconds'][:, :, 0])).all(axis=0).sum())
+        print(f"  - Route {route_id} {direction}: {len(table['stop_ids']) - 1} segments, "
+              f"{int(table['counts'].sum())} traversals, {known_hours}/{HOURS_PER_WEEK} hours complete")
@@ -0,0 +1,112 @@
+"""
+Session Resource Index
+Reverse index from a socket session to everything it owns, so disconnect
+cleanup only touches that session's buses, reservations and waiting entries
+"""
+from collections import Counter
+
+
+class SessionIndex:
+    """sid -> {'buses', 'reservations', 'waitlist', 'waiting_stops'}
+
+    buses:         set of (route_id, bus_id) the session is driving
+    reservations:  set of route_ids the session holds a seat on
+    waitlist:      set of route_ids the session is waitlisted on
+    waiting_stops: Counter of (route_id, stop_id) -> times marked waiting
+    """
+    def __init__(self):
+        self._owned = {}
+
+    def _entry(self, sid):
+        entry = self._owned.get(sid)
+        if entry is None:
+            entry = {
+                'buses': set(),
+                'reservations': set(),
+                'waitlist': set(),
+                'waiting_stops': Counter()
+            }
+            self._owned[sid] = entry
+        return entry
+
+    def add_bus(self, sid, route_id, bus_id):
+        self._entry(sid)['buses'].add((route_id, bus_id))
+
+    def remove_bus(self, sid, route_id, bus_id):
+        entry = self._owned.get(sid)
+        if entry:
+            entry['buses'].discard((route_id, bus_id))
+
+    def add_reservation(self, sid, route_id):
+        self._entry(sid)['reservations'].add(route_id)
+
+    def remove_reservation(self, sid, route_id):
+        entry = self._owned.get(sid)
+        if entry:
+            entry['reservations'].discard(route_id)
+
+    def add_waitlist(self, sid, route_id):
+        self._entry(sid)['waitlist'].add(route_id)
+
+    def remove_waitlist(self, sid, route_id):
+        entry = self._owned.get(sid)
+        if entry:
+            entry['waitlist'].discard(route_id)
+
+    def add_waiting_stop(self, sid, route_id, stop_id):
+        self._entry(sid)['waiting_stops'][(route_id, stop_id)] += 1
+
+    def remove_waiting_stop(self, sid, route_id, stop_id):
+        """Returns True if the session had marked itself waiting at this stop"""
+        entry = self._owned.get(sid)
+        if not entry or entry['waiting_stops'][(route_id, stop_id)] <= 0:
+            return False
+        entry['waiting_stops'][(route_id, stop_id)] -= 1
+        if entry['waiting_stops'][(route_id, stop_id)] == 0:
+            del entry['waiting_stops'][(route_id, stop_id)]
+        return True
+
+    def routes(self, sid):
+        """Every route_id the session owns something on"""
+        entry = self._owned.get(sid)
+        if not entry:
+            return set()
+        return ({route_id for route_id, _ in entry['buses']} | entry['reservations'] | entry['waitlist']
+                | {route_id for route_id, _ in entry['waiting_stops']})
+
+    def pop_route(self, sid, route_id):
+        """Remove and return what the session owned on one route (drops the sid once nothing is left)"""
+        owned = {
+            'buses': set(),
+            'reservations': set(),
+            'waitlist': set(),
+            'waiting_stops': Counter()
+        }
+        entry = self._owned.get(sid)
+        if not entry:
+            return owned
+
+        owned['buses'] = {b for b in entry['buses'] if b[0] == route_id}
+        entry['buses'] -= owned['buses']
+        for key in ('reservations', 'waitlist'):
+            if route_id in entry[key]:
+                entry[key].discard(route_id)
+                owned[key].add(route_id)
+        for key in [k for k in entry['waiting_stops'] if k[0] == route_id]:
+            owned['waiting_stops'][key] = entry['waiting_stops'].pop(key)
+
+        if not any(entry.values()):
+            del self._owned[sid]
+        return owned
+
+    def pop(self, sid):
+        """Remove and return everything the session owned (empty entry if nothing)"""
+        return self._owned.pop(sid, None) or {
+            'buses': set(),
+            'reservations': set(),
+            'waitlist': set(),
+            'waiting_stops': Counter()
+        }
+
+    def __len__(self):
+        return len(self._owned)
@@ -0,0 +1,56 @@
+"""
+Route Sharding
+Decides which server process owns each route when running more than one shard
+
+Environment:
+  SHARD_COUNT      number of shard processes (default 1 = everything local)
+  SHARD_INDEX      this process's shard number, 0-based
+  SHARD_URLS       comma-separated public base URL of each shard, in index order
+  SHARD_ROUTE_MAP  optional explicit placement, e.g. "48AC=0,23=1,madurai-saptur=1"
+                   (routes not listed fall back to a stable hash)
+"""
+import os
+import zlib
+
+SHARD_COUNT = max(1, int(os.environ.get('SHARD_COUNT', 1)))
+SHARD_INDEX = int(os.environ.get('SHARD_INDEX', 0))
+SHARD_URLS = [u.strip().rstrip('/') for u in os.environ.get('SHARD_URLS', '').split(',') if u.strip()]
+
+
+def _parse_route_map(raw):
+    placement = {}
+    for item in raw.split(','):
+        if '=' in item:
+            route_id, shard = item.split('=', 1)
+            placement[route_id.strip()] = int(shard) % SHARD_COUNT
+    return placement
+
+
+SHARD_ROUTE_MAP = _parse_route_map(os.environ.get('SHARD_ROUTE_MAP', ''))
+
+
+def is_sharded():
+    return SHARD_COUNT > 1
+
+
+def route_shard(route_id):
+    """Shard index that owns a route (stable across processes and restarts)"""
+    if route_id in SHARD_ROUTE_MAP:
+        return SHARD_ROUTE_MAP[route_id]
+    return zlib.crc32(str(route_id).encode()) % SHARD_COUNT
+
+
+def owns_route(route_id):
+    return not is_sharded() or route_id is None or route_shard(route_id) == SHARD_INDEX
+
+
+def shard_url(route_id):
+    """Public base URL of the shard that owns a route, or None if not configured"""
+    index = route_shard(route_id)
+    if index < len(SHARD_URLS):
+        return SHARD_URLS[index]
+    return None
+
+
+def owned_routes(route_ids):
+    return [r for r in route_ids if owns_route(r)]
@@ -5,6 +5,7 @@
 let socket;
 let map;
 let busMarkers = {};
+let latestBusUpdates = {};  // bus_id -> last bus_update payload (includes its stop_etas table)
 let userMarker;
 let stopMarkers = [];
 let currentMode = null;
@@ -21,6 +22,8 @@ let isTracking = false;
 let wakeLock = null;
 let isBusFull = false;
 let gpsManager = null;
+let waitlistedSessions = {};  // REST session_id -> passenger name, for bookings sitting on the waiting list
+let apiBase = '';  // Base URL of the shard serving the current route ('' = this server)
 
 // Store previous values for animation detection
 let previousValues = {
@@ -298,7 +301,7 @@ function animateInfoValue(elementId, newValue) {
 
 // Initialize Socket.IO
 function initSocket() {
-    socket = io({
+    socket = io(apiBase || undefined, {
         transports: ['websocket', 'polling'],
         upgrade: true,
         rememberUpgrade: true,
@@ -313,6 +316,11 @@ function initSocket() {
         statusDot.classList.add('connected');
         
         if (driverInfo && currentMode === 'bus') {
+            if (driverInfo.token) {
+                // Resume with the signed session token: no password check, same bus_id
+                socket.emit('driver_resume', { token: driverInfo.token });
+                return;
+            }
             socket.emit('driver_authenticate', {
                 driver_id: driverInfo.driver_id,
                 password: driverInfo.password
@@ -338,10 +346,26 @@ function initSocket() {
         console.log('Socket connected:', data);
     });
     
+    // Route lives on another shard: reconnect there (join/resume is replayed on connect)
+    socket.on('route_shard_redirect', (data) => {
+        if (!data.url || data.url === apiBase) {
+            console.error('Route is served by another shard with no public URL:', data);
+            return;
+        }
+        console.log(`↪ Route ${data.route_id} is served by ${data.url}, reconnecting`);
+        apiBase = data.url;
+        socket.disconnect();
+        initSocket();
+    });
+    
     socket.on('driver_authenticated', handleDriverAuthentication);
+    socket.on('driver_resumed', handleDriverResumed);
     socket.on('authentication_required', handleAuthenticationRequired);
     socket.on('bus_id_assigned', (data) => {
         myBusId = data.bus_id;
+        if (data.token && driverInfo) {
+            driverInfo.token = data.token;
+        }
         console.log('✓ Assigned bus ID:', myBusId);
         document.getElementById('busId').textContent = myBusId;
         if (data.driver_name) {
@@ -359,6 +383,10 @@ function initSocket() {
     
     // Listen for capacity update confirmation
     socket.on('capacity_updated', (data) => {
+        if (data.success === false) {
+            console.warn('⚠ Capacity update rejected:', data.message);
+            return;
+        }
         console.log('✓ Capacity updated:', data.message);
     });
     
@@ -366,8 +394,14 @@ function initSocket() {
     socket.on('reservation_update', (data) => {
         console.log('✓ Reservation update:', data);
         // Update available seats display
-        animateValueChange('passengerAvailableSeats', data.available_seats, 'passengerSeatsCard');
-        animateValueChange('driverAvailableSeats', data.available_seats, 'driverSeatsCard');
+        let seats = data.available_seats;
+        if (data.available_seats_by_bus) {
+            // Batched waiting-list assignment: only our own bus matters to the driver view
+            seats = myBusId ? data.available_seats_by_bus[myBusId] : undefined;
+        }
+        if (seats === undefined) return;
+        animateValueChange('passengerAvailableSeats', seats, 'passengerSeatsCard');
+        animateValueChange('driverAvailableSeats', seats, 'driverSeatsCard');
     });
     
     // Listen for reservation result
@@ -397,6 +431,12 @@ function initSocket() {
     
     // Listen for reservation assigned from waiting list
     socket.on('reservation_assigned', (data) => {
+        // REST bookings are announced to the whole route room; only react to our own
+        const passengerName = waitlistedSessions[data.session_id];
+        if (passengerName === undefined && data.session_id !== socket.id) {
+            return;
+        }
+        delete waitlistedSessions[data.session_id];
         console.log('✓ Reservation assigned from waiting list:', data);
         const statusDiv = document.getElementById('reservationStatus');
         statusDiv.classList.remove('error');
@@ -408,6 +448,10 @@ function initSocket() {
             statusDiv.classList.remove('success');
             statusDiv.textContent = '';
         }, 5000);
+        
+        if (passengerName !== undefined) {
+            showTicket(data.bus_id, passengerName, data.route_id);
+        }
     });
 }
 
@@ -416,6 +460,7 @@ function handleDriverAuthentication(data) {
         isAuthenticated = true;
         driverInfo.driver_id = data.driver.driver_id;
         driverInfo.name = data.driver.name;
+        driverInfo.token = data.token;
         driverAuthModal.style.display = 'none';
         console.log('✓ Driver authenticated successfully');
         
@@ -428,6 +473,32 @@ function handleDriverAuthentication(data) {
     }
 }
 
+function handleDriverResumed(data) {
+    if (data.success) {
+        isAuthenticated = true;
+        driverInfo.token = data.token;
+        
+        if (data.bus_id) {
+            myBusId = data.bus_id;
+            document.getElementById('busId').textContent = myBusId;
+        } else if (currentRoute) {
+            socket.emit('join_route', { route_id: currentRoute, mode: 'bus', bus_id: myBusId });
+        }
+        console.log(`✓ Driver session resumed (state restored: ${data.state_restored})`);
+    } else {
+        // Token expired or rejected: fall back to a full login with the stored password
+        console.log('⚠ Session resume failed, re-authenticating');
+        driverInfo.token = null;
+        socket.emit('driver_authenticate', {
+            driver_id: driverInfo.driver_id,
+            password: driverInfo.password
+        });
+        if (currentRoute && isAuthenticated) {
+            socket.emit('join_route', { route_id: currentRoute, mode: 'bus', bus_id: myBusId });
+        }
+    }
+}
+
 function handleAuthenticationRequired(data) {
     alert(data.message);
     showDriverAuthModal();
@@ -970,6 +1041,10 @@ document.getElementById('stopSharing').addEventListener('click', () => {
         mode: 'bus',
         bus_id: myBusId 
     });
+    // Leaving revokes the session token; a reconnect now logs in with the password
+    if (driverInfo) {
+        driverInfo.token = null;
+    }
     
     document.getElementById('stopSharing').classList.add('hidden');
     document.getElementById('startSharing').classList.remove('hidden');
@@ -1166,7 +1241,7 @@ document.getElementById('recenterMap').addEventListener('click', () => {
 
 async function loadActiveBuses() {
     try {
-        const url = `/api/active_buses/${currentRoute}`;
+        const url = `${apiBase}/api/active_buses/${currentRoute}`;
         console.log(`📡 Fetching active buses from: ${url}`);
         const response = await fetch(url);
         const data = await response.json();
@@ -1255,6 +1330,7 @@ function handleBusUpdate(data) {
     console.log('🚌 Bus update:', data);
     const direction = data.direction || 'forward';
     updateBusMarker(data.bus_id, data.lat, data.lng, false, data.driver_name, direction);
+    latestBusUpdates[data.bus_id] = data;
     
     if (isTracking) {
         updateClosestBusETA();
@@ -1278,6 +1354,7 @@ function handleAllBusesUpdate(data) {
 function handleBusRemoved(data) {
     console.log('🗑 Bus removed:', data);
     removeBusMarker(data.bus_id);
+    delete latestBusUpdates[data.bus_id];
     
     if (data.reason === 'full' && currentMode === 'passenger') {
         console.log('ℹ️ Bus marked as full and hidden from view');
@@ -1345,8 +1422,31 @@ function updateClosestBusETA() {
     if (closestBus && minDistance !== Infinity) {
         console.log(`✓ Closest bus: ${closestBus}`);
         
+        // ✅ The last bus_update already carries this bus's ETA to every stop ahead - no HTTP round trip
+        const cachedBus = latestBusUpdates[closestBus];
+        const cachedEta = selectedStopId && cachedBus && (cachedBus.stop_etas || []).find(e => e.stop_id === selectedStopId);
+        if (cachedEta) {
+            const nextStop = cachedBus.nearest_stop && cachedBus.nearest_stop.name ? cachedBus.nearest_stop.name : cachedBus.nearest_stop;
+            
+            animateValueChange('etaMinutes', Math.round(cachedEta.eta_minutes), 'passengerEtaCard');
+            animateValueChange('distance', formatDistance(cachedEta.distance_km), 'passengerDistanceCard');
+            animateValueChange('busSpeedPassenger', `${cachedBus.speed} km/h`, 'passengerSpeedCard');
+            animateValueChange('busLocationStop', nextStop || 'En route', 'passengerStopCard');
+            
+            const passengerCurrentStopDisplay = document.getElementById('passengerCurrentStopDisplay');
+            if (cachedBus.current_stop) {
+                passengerCurrentStopDisplay.classList.remove('hidden');
+                document.getElementById('passengerCurrentStopName').textContent = cachedBus.current_stop;
+            } else {
+                passengerCurrentStopDisplay.classList.add('hidden');
+            }
+            
+            updatePassengerProgressBar(cachedBus);
+            return;
+        }
+        
         // ✅ Fetch bus data first
-        fetch(`/api/active_buses/${currentRoute}`)
+        fetch(`${apiBase}/api/active_buses/${currentRoute}`)
             .then(res => res.json())
             .then(data => {
                 const busData = data.buses.find(b => b.bus_id === closestBus);
@@ -1355,14 +1455,14 @@ function updateClosestBusETA() {
                     
                     // ✅ If user has selected a stop, get accurate waypoint-based distance
                     if (selectedStopId) {
-                        fetch(`/api/passenger_distance/${currentRoute}/${closestBus}/${selectedStopId}`)
+                        fetch(`${apiBase}/api/passenger_distance/${currentRoute}/${closestBus}/${selectedStopId}`)
                             .then(res => res.json())
                             .then(distanceData => {
                                 console.log('✅ Waypoint-based distance data:', distanceData);
                                 
                                 const accurateDistance = distanceData.distance_to_stop_km;
                                 const trafficLevel = 1.5;
-                                const etaMinutes = predictETA(accurateDistance, trafficLevel);
+                                const etaMinutes = distanceData.eta_minutes != null ? distanceData.eta_minutes : predictETA(accurateDistance, trafficLevel);
                                 
                                 console.log(`📏 Accurate distance to stop: ${accurateDistance.toFixed(2)} km (waypoint-based)`);
                                 
@@ -1596,7 +1696,7 @@ document.getElementById('reserveBtn').addEventListener('click', () => {
     reserveBtn.disabled = true;
     
     // Send reservation request to server
-    fetch('/api/reserve_seat', {
+    fetch(`${apiBase}/api/reserve_seat`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -1612,6 +1712,9 @@ document.getElementById('reserveBtn').addEventListener('click', () => {
             console.log('✅ Reservation successful:', data);
             showTicket(data.bus_id, passengerName, currentRoute);
         } else {
+            if (data.waiting) {
+                waitlistedSessions[sessionId] = passengerName;
+            }
             console.log('❌ Reservation failed:', data.message);
         }
     })
@@ -0,0 +1,156 @@
+"""
+Structured Logging
+Leveled per-module loggers under the `bustracker` namespace, a non-blocking
+queue handler drained by a native thread, and sampled debug output for hot paths
+
+    LOG_LEVEL=INFO                              default level
+    LOG_LEVELS=app.fix=DEBUG,app.session=WARNING per-logger overrides
+    LOG_FORMAT=text|json                        one line per record; structured fields as key=value or JSON
+    LOG_SAMPLE_EVERY=100  LOG_SAMPLE_PER_SECOND=5   SampledLogger limits
+
+Hot paths guard with SampledLogger.enabled() (or logger.isEnabledFor) so that
+a disabled or sampled-out event costs a level check and a counter, and its
+fields are never built.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import sys
+import time
+
+try:
+    from eventlet import patcher
+    _queue = patcher.original('queue')
+    _threading = patcher.original('threading')
+except ImportError:
+    import queue as _queue
+    import threading as _threading
+
+ROOT_LOGGER = 'bustracker'
+LOG_QUEUE_SIZE = 10000 # Records beyond this are dropped (and counted) instead of blocking the caller
+LOG_SAMPLE_EVERY = int(os.environ.get('LOG_SAMPLE_EVERY', 100))
+LOG_SAMPLE_PER_SECOND = float(os.environ.get('LOG_SAMPLE_PER_SECOND', 5))
+
+_listener = None
+_queue_handler = None
+
+
+def get_logger(name):
+    """bustracker.<name>; levels come from LOG_LEVEL / LOG_LEVELS"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+class TextFormatter(logging.Formatter):
+    """2025-01-06 08:00:00,123 DEBUG bustracker.app.fix bus_fix bus_id=BUS1 direction=forward"""
+    def format(self, record):
+        line = f"{self.formatTime(record)} {record.levelname} {record.name} {record.getMessage()}"
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + ' '.join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'event': record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: a full queue drops the record and counts it"""
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except _queue.Full:
+            self.dropped += 1
+
+
+class NativeQueueListener(logging.handlers.QueueListener):
+    """QueueListener whose writer is a native thread, so stream writes never block the eventlet hub"""
+    def start(self):
+        self._thread = _threading.Thread(target=self._monitor, name='log-writer', daemon=True)
+        self._thread.start()
+
+
+class SampledLogger:
+    """
+    Debug events from a hot path: at most one in `every` calls and `per_second`
+    records per second reach the logger, each tagged with how many calls it stands for
+
+        if fix_log.enabled():
+            fix_log.debug('bus_fix', bus_id=bus_id, direction=direction)
+    """
+    def __init__(self, logger, every=LOG_SAMPLE_EVERY, per_second=LOG_SAMPLE_PER_SECOND):
+        self.logger = logger
+        self.every = max(1, every)
+        self.per_second = per_second
+        self.calls = 0
+        self.skipped = 0
+        self._tokens = per_second
+        self._refilled = time.monotonic()
+
+    def enabled(self):
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return False
+        self.calls += 1
+        if self.calls % self.every:
+            self.skipped += 1
+            return False
+        now = time.monotonic()
+        self._tokens = min(self.per_second, self._tokens + (now - self._refilled) * self.per_second)
+        self._refilled = now
+        if self._tokens < 1:
+            self.skipped += 1
+            return False
+        self._tokens -= 1
+        return True
+
+    def debug(self, event, **fields):
+        fields['sampled'] = self.skipped + 1
+        self.skipped = 0
+        self.logger.debug(event, extra={'fields': fields})
+
+
+def log_event(logger, level, event, **fields):
+    """logger.log with structured fields (for paths that are not hot enough to sample)"""
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={'fields': fields})
+
+
+def configure_logging(level=None, levels=None, fmt=None, stream=None):
+    """Install the queue handler on the bustracker logger once per process; returns it"""
+    global _listener, _queue_handler
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel((level or os.environ.get('LOG_LEVEL', 'INFO')).upper())
+    for override in filter(None, (levels if levels is not None else os.environ.get('LOG_LEVELS', '')).split(',')):
+        name, _, override_level = override.partition('=')
+        get_logger(name.strip()).setLevel(override_level.strip().upper())
+    if _queue_handler is not None:
+        return _queue_handler
+
+    stream_handler = logging.StreamHandler(stream or sys.stdout)
+    use_json = (fmt or os.environ.get('LOG_FORMAT', 'text')).lower() == 'json'
+    stream_handler.setFormatter(JSONFormatter() if use_json else TextFormatter())
+    _queue_handler = DroppingQueueHandler(_queue.Queue(LOG_QUEUE_SIZE))
+    _listener = NativeQueueListener(_queue_handler.queue, stream_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+    root.addHandler(_queue_handler)
+    root.propagate = False
+    return _queue_handler
@@ -0,0 +1,78 @@
+"""Shared fixtures: import app once against a temp copy of its data files"""
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Per-run state the tests reset between cases (everything else in app is config or caches)
+APP_STATE = ('active_buses', 'bus_speed_history', 'bus_start_location', 'bus_arrival_times',
+             'waiting_passengers', 'authenticated_drivers', 'parked_buses', 'bus_logged_locations',
+             'bus_last_passed_stop', 'bus_direction', 'bus_position_history', 'bus_current_stop',
+             'bus_capacity_status', 'bus_last_speed', 'waiting_reservations', 'reaper_orphan_candidates',
+             'retired_buses', 'driver_token_generations')
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    """The app module, imported with its background tasks off, running in a temp data dir"""
+    from loadtest import copy_app_data
+
+    cwd = os.getcwd()
+    data_dir = tempfile.mkdtemp(prefix='smartbus-tests-')
+    os.chdir(ROOT)
+    copy_app_data(data_dir)
+    os.chdir(data_dir)
+    os.environ.setdefault('SECRET_KEY', 'smartbus-tests')
+    os.environ['MODEL_RELOAD_INTERVAL'] = '0'
+    os.environ['REAPER_INTERVAL'] = '0'
+
+    import app
+    yield app
+    os.chdir(cwd)
+
+
+@pytest.fixture
+def app(app_module):
+    """The app module with its per-run state cleared"""
+    from reservation_store import ReservationStore
+    from session_index import SessionIndex
+
+    for name in APP_STATE:
+        getattr(app_module, name).clear()
+    app_module.reservation_store = ReservationStore(app_module.TOTAL_SEATS_PER_BUS)
+    app_module.session_index = SessionIndex()
+    yield app_module
+    pump(app_module)
+
+
+def pump(app, seconds=0.05):
+    """Let route actors and other green threads run"""
+    app.socketio.sleep(seconds)
+
+
+def received(client, event):
+    """Payloads of `event` delivered to a Socket.IO test client since the last call"""
+    return [packet['args'][0] for packet in client.get_received() if packet['name'] == event]
+
+
+def add_active_bus(app, route_id, bus_id, distance_from_start=0.0, sid=None, driver_id=None, timestamp=None):
+    """Put a bus on a route with the fields a driver's location fix would set"""
+    app.active_buses[route_id][bus_id] = {
+        'lat': 0.0, 'lng': 0.0, 'sid': sid, 'driver_id': driver_id, 'is_full': False,
+        'timestamp': (timestamp or datetime.now()).isoformat(), 'distance_from_start': distance_from_start}
+
+
+def connect_driver(app, route_id, bus_id, driver_id='DRIVER001', password='admin123'):
+    """A test client logged in as a driver and joined to route_id with bus_id; returns (client, sid)"""
+    before = set(app.authenticated_drivers)
+    client = app.socketio.test_client(app.app)
+    client.emit('driver_authenticate', {'driver_id': driver_id, 'password': password})
+    assert received(client, 'driver_authenticated')[0]['success']
+    sid, = set(app.authenticated_drivers) - before
+    client.emit('join_route', {'route_id': route_id, 'mode': 'bus', 'bus_id': bus_id})
+    return client, sid
@@ -0,0 +1,68 @@
+"""Round trips through the in-repo Socket.IO backplane broker (python -m pytest tests)"""
+import json
+import os
+import socket
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backplane import BackplaneBroker, BackplaneManager
+
+
+@pytest.fixture
+def broker():
+    broker = BackplaneBroker('127.0.0.1', 0)
+    broker.start_in_thread()
+    yield broker
+    broker.shutdown()
+    broker.server_close()
+
+
+def wait_for_clients(broker, count, timeout=5):
+    deadline = time.monotonic() + timeout
+    while len(broker.clients) < count:
+        assert time.monotonic() < deadline, f"{len(broker.clients)} of {count} clients connected"
+        time.sleep(0.01)
+
+
+def connect(broker):
+    sock = socket.create_connection(broker.server_address, timeout=5)
+    return sock, sock.makefile('rb')
+
+
+def test_broker_relays_to_other_clients_only(broker):
+    publisher, publisher_lines = connect(broker)
+    subscriber, subscriber_lines = connect(broker)
+    wait_for_clients(broker, 2)
+
+    publisher.sendall(b'{"channel": "socketio", "message": 1}\n')
+    assert json.loads(subscriber_lines.readline()) == {'channel': 'socketio', 'message': 1}
+
+    # The publisher never gets its own message back: the next line it reads is the subscriber's
+    subscriber.sendall(b'{"channel": "socketio", "message": 2}\n')
+    assert json.loads(publisher_lines.readline()) == {'channel': 'socketio', 'message': 2}
+
+    publisher.close()
+    subscriber.close()
+
+
+def test_manager_round_trip(broker):
+    url = 'backplane://%s:%s' % broker.server_address
+    sender = BackplaneManager(url, channel='flask-socketio')
+    receiver = BackplaneManager(url, channel='flask-socketio')
+    receiver._connect()
+    other_channel = BackplaneManager(url, channel='other')
+    other_channel._connect()
+    wait_for_clients(broker, 2)
+
+    message = {'method': 'emit', 'event': 'bus_update', 'data': {'bus_id': 'BUS1', 'eta': 4.5}, 'room': '48AC'}
+    other_channel._publish({'method': 'emit', 'event': 'ignored'})
+    sender._publish(message)
+
+    # Messages on another channel are skipped; the payload arrives unchanged
+    assert next(receiver._listen()) == message
+    for manager in (sender, receiver, other_channel):
+        manager._sock.close()
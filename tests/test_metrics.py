@@ -0,0 +1,17 @@
+"""/metrics exposition (python -m pytest tests)"""
+from conftest import add_active_bus, pump
+
+
+def test_socketio_events_record_dispatch_and_route_command_time(app):
+    route_id = sorted(app.STOP_COORDS)[0]
+    add_active_bus(app, route_id, 'bus1')
+    client = app.socketio.test_client(app.app)
+    client.emit('reserve_seat', {'route_id': route_id, 'passenger_name': 'Asha'})
+    pump(app)
+    client.disconnect()
+
+    body = app.app.test_client().get('/metrics').get_data(as_text=True)
+
+    assert 'bustracker_socketio_dispatch_seconds_count{event="reserve_seat"}' in body
+    assert f'bustracker_route_command_seconds_count{{route="{route_id}",command="apply_reserve_seat"}}' in body
+    assert 'socketio_handler_seconds' not in body
@@ -0,0 +1,92 @@
+"""Model registry validation, hot swap and rollback (python -m pytest tests)"""
+import csv
+
+import numpy as np
+import pytest
+
+import train
+from model_class import LinearRegressionNumpy
+from model_registry import ModelRegistry, publish_model
+
+rng = np.random.default_rng(7)
+X = np.column_stack((rng.uniform(0.1, 10, 200), rng.uniform(1, 3, 200)))
+Y = 2.5 * X[:, 0] + 0.8 * X[:, 1]
+
+
+def fit(y, trained_until=None):
+    model = LinearRegressionNumpy()
+    model.fit_closed_form(X, y)
+    model.trained_until = trained_until
+    return model
+
+
+@pytest.fixture
+def registry(tmp_path):
+    calls = []
+
+    def validation_sample(*models):
+        calls.append(models)
+        return X, Y
+
+    publish_model(fit(Y), str(tmp_path), version='20250101-000000')
+    registry = ModelRegistry(str(tmp_path), fallback_path=None, validation_sample=validation_sample)
+    registry.load_initial()
+    registry.sample_calls = calls
+    return registry
+
+
+def test_better_candidate_goes_live_and_can_be_rolled_back(registry):
+    publish_model(fit(Y + rng.normal(0, 0.1, len(Y))), registry.models_dir, version='20250102-000000')
+
+    assert registry.check_for_update()
+    assert registry.active.version == '20250102-000000'
+    assert registry.previous.version == '20250101-000000'
+
+    assert registry.rollback()
+    assert registry.active.version == '20250101-000000'
+    assert not registry.check_for_update() # The version rolled back from is not reloaded
+    assert registry.rejected['20250102-000000'] == 'rolled back'
+
+
+def test_clearly_worse_candidate_is_rejected(registry):
+    publish_model(fit(Y * 3 + 10), registry.models_dir, version='20250102-000000')
+
+    assert not registry.check_for_update()
+    assert registry.active.version == '20250101-000000'
+    assert 'validation MAE' in registry.rejected['20250102-000000']
+
+
+def test_non_finite_candidate_is_rejected(registry):
+    model = fit(Y)
+    model.weights = np.array([np.nan, 1.0])
+    publish_model(model, registry.models_dir, version='20250102-000000')
+
+    assert not registry.check_for_update()
+    assert registry.rejected['20250102-000000'] == 'non-finite predictions'
+
+
+def test_sample_excludes_rows_of_both_candidate_and_active(registry):
+    candidate = fit(Y)
+    publish_model(candidate, registry.models_dir, version='20250102-000000')
+    registry.check_for_update()
+
+    models, = registry.sample_calls
+    assert len(models) == 2
+    assert models[1] is registry.previous.model
+
+
+def test_validation_sample_only_has_rows_logged_after_training(tmp_path, monkeypatch):
+    path = tmp_path / 'bus_locations.csv'
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['timestamp', 'route_id', 'distance_to_stop_km', 'traffic_level', 'speed_kmh'])
+        for minute in range(10):
+            writer.writerow([f"2025-10-14T08:{minute:02d}:00", '48AC', minute + 1, 1, 30])
+    monkeypatch.setattr(train, 'LOCATIONS_FILE', str(path))
+
+    older = fit(Y, trained_until='2025-10-14T08:03:00')
+    newer = fit(Y, trained_until='2025-10-14T08:06:00')
+    X_sample, _ = train.load_validation_sample(older, newer)
+
+    assert X_sample[:, 0].tolist() == [8.0, 9.0, 10.0]
+    assert train.load_validation_sample(fit(Y, trained_until='2025-10-14T08:09:00')) is None
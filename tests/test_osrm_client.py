@@ -0,0 +1,63 @@
+"""OSRM client request de-duplication (python -m pytest tests)"""
+import threading
+import time
+
+import pytest
+
+from osrm_client import OSRMClient
+
+SEGMENT = (9.91, 78.11, 9.92, 78.12)
+OTHER = (9.92, 78.12, 9.93, 78.13)
+
+
+@pytest.fixture
+def client(tmp_path):
+    client = OSRMClient(server='http://osrm.invalid', cache_dir=str(tmp_path), max_workers=4, rate_limit=0)
+    client.requests = []
+
+    def fake_fetch(lat1, lng1, lat2, lng2):
+        client.requests.append((lat1, lng1, lat2, lng2))
+        time.sleep(0.05) # Long enough for the other workers to ask for the same segment
+        return {'code': 'Ok', 'routes': [{'distance': 1000.0, 'duration': 120.0, 'geometry': ''}]}
+
+    client._fetch = fake_fetch
+    return client
+
+
+def test_route_many_requests_repeated_segments_once(client):
+    routes = client.route_many([SEGMENT, OTHER, SEGMENT, SEGMENT])
+
+    assert sorted(client.requests) == sorted([SEGMENT, OTHER])
+    assert [route['distance'] for route in routes] == [1000.0] * 4
+    assert client.stats() == {'cache_hits': 0, 'fetched': 2, 'failed': 0}
+
+
+def test_concurrent_callers_share_one_request(client):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.route(*SEGMENT))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert client.requests == [SEGMENT]
+    assert len(results) == 4 and all(route is results[0] for route in results)
+
+
+def test_cached_segments_are_not_fetched_again(client, tmp_path):
+    client.route(*SEGMENT)
+    fresh = OSRMClient(server='http://osrm.invalid', cache_dir=str(tmp_path), rate_limit=0)
+    fresh._fetch = lambda *segment: pytest.fail('cached segment fetched again')
+
+    assert fresh.route(*SEGMENT)['distance'] == 1000.0
+    assert fresh.stats()['cache_hits'] == 1
+
+
+def test_a_failed_load_is_retried(client):
+    fetch = client._fetch
+    client._fetch = lambda *segment: (_ for _ in ()).throw(OSError('connection reset'))
+    with pytest.raises(OSError):
+        client.route(*SEGMENT)
+
+    client._fetch = fetch
+    assert client.route(*SEGMENT)['distance'] == 1000.0
@@ -0,0 +1,108 @@
+"""Reaper sweeps: stale buses, capacity flags, seats on departed buses (python -m pytest tests)"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import add_active_bus, connect_driver, pump, received
+
+
+@pytest.fixture
+def route_id(app):
+    return sorted(app.STOP_COORDS)[0]
+
+
+def long_ago(app):
+    return app.time.time() - app.DRIVER_RESUME_GRACE_SECONDS - 1
+
+
+def test_stale_bus_keeps_its_capacity_flag_for_the_resume_window(app, route_id):
+    add_active_bus(app, route_id, 'bus1', timestamp=datetime.now() - timedelta(seconds=app.BUS_STALE_SECONDS + 1))
+    app.bus_capacity_status['bus1'] = True
+
+    counts = app.reap_stale_state()
+
+    assert counts['stale_buses'] == 1
+    assert 'bus1' not in app.active_buses[route_id]
+    assert app.bus_capacity_status['bus1'] is True
+
+    app.retired_buses['bus1'] = long_ago(app)
+    app.reap_stale_state()
+    app.reap_stale_state()
+
+    assert 'bus1' not in app.bus_capacity_status
+
+
+def test_orphaned_tracking_state_needs_two_sweeps(app, route_id):
+    app.bus_direction['ghost'] = 'forward'
+    app.bus_capacity_status['ghost'] = True
+
+    app.reap_stale_state()
+    assert 'ghost' in app.bus_direction
+
+    app.reap_stale_state()
+    assert 'ghost' not in app.bus_direction
+    assert 'ghost' not in app.bus_capacity_status
+
+
+def test_seats_on_a_departed_bus_are_released_after_the_resume_window(app, route_id):
+    add_active_bus(app, route_id, 'bus1')
+    app.reservation_store.add(route_id, 'bus1', 'Asha', 's1')
+    app.session_index.add_reservation('s1', route_id)
+    del app.active_buses[route_id]['bus1']
+    app.reset_bus_route_tracking('bus1')
+
+    app.reap_stale_state()
+    assert app.reservation_store.bus_for_session(route_id, 's1') == 'bus1'
+
+    app.retired_buses['bus1'] = long_ago(app)
+    counts = app.reap_stale_state()
+
+    assert counts['bus_reservations'] == 1
+    assert not app.reservation_store.has_session(route_id, 's1')
+    assert not app.reservation_store.has_passenger(route_id, 'Asha')
+    assert app.session_index.routes('s1') == set()
+
+
+def test_seats_on_active_and_parked_buses_are_kept(app, route_id):
+    add_active_bus(app, route_id, 'bus1')
+    app.reservation_store.add(route_id, 'bus1', 'Asha', 's1')
+    app.reservation_store.add(route_id, 'bus2', 'Bala', 's2')
+    app.parked_buses['bus2'] = {'route_id': route_id, 'driver_id': 'DRIVER001', 'sid': None, 'parked_at': long_ago(app)}
+
+    counts = app.reap_stale_state()
+
+    assert counts['bus_reservations'] == 0
+    assert app.reservation_store.reserved_count(route_id, 'bus1') == 1
+    assert app.reservation_store.reserved_count(route_id, 'bus2') == 1
+
+
+def test_capacity_update_for_a_bus_the_driver_does_not_drive_is_rejected(app, route_id):
+    add_active_bus(app, route_id, 'bus1', sid='someone-else')
+    client, _ = connect_driver(app, route_id, 'mine')
+
+    for bus_id in ('bus1', 'made-up'):
+        client.emit('bus_capacity_update', {'route_id': route_id, 'bus_id': bus_id, 'is_full': True})
+    pump(app)
+
+    replies = received(client, 'capacity_updated')
+    assert [reply['success'] for reply in replies] == [False, False]
+    assert 'made-up' not in app.bus_capacity_status
+    assert app.bus_capacity_status.get('bus1', False) is False
+    assert app.active_buses[route_id]['bus1']['is_full'] is False
+    client.disconnect()
+
+
+def test_driver_can_flag_its_own_bus_before_and_after_its_first_fix(app, route_id):
+    client, sid = connect_driver(app, route_id, 'bus1')
+
+    client.emit('bus_capacity_update', {'route_id': route_id, 'bus_id': 'bus1', 'is_full': True})
+    pump(app)
+    assert app.bus_capacity_status['bus1'] is True
+
+    add_active_bus(app, route_id, 'bus1', sid=sid)
+    client.emit('bus_capacity_update', {'route_id': route_id, 'bus_id': 'bus1', 'is_full': False})
+    pump(app)
+
+    assert [reply['is_full'] for reply in received(client, 'capacity_updated')] == [True, False]
+    assert app.active_buses[route_id]['bus1']['is_full'] is False
+    client.disconnect()
@@ -0,0 +1,56 @@
+"""Seat reservation indexes (python -m pytest tests)"""
+from reservation_store import ReservationStore
+
+
+def test_add_indexes_by_bus_session_and_name():
+    store = ReservationStore(total_seats=2)
+    store.add('A', 'bus1', 'Asha', 's1')
+
+    assert store.has_passenger('A', 'ASHA')
+    assert store.has_session('A', 's1')
+    assert store.bus_for_session('A', 's1') == 'bus1'
+    assert store.available_seats('A', 'bus1') == 1
+    assert not store.has_session('B', 's1')
+
+
+def test_cancel_session_frees_the_seat_and_name():
+    store = ReservationStore(total_seats=2)
+    store.add('A', 'bus1', 'Asha', 's1')
+    store.add('A', 'bus1', 'Bala', 's2')
+
+    assert store.cancel_session('A', 's1') == 'bus1'
+    assert store.cancel_session('A', 's1') is None
+    assert not store.has_passenger('A', 'Asha')
+    assert [r['session_id'] for r in store.reservations_for_bus('A', 'bus1')] == ['s2']
+
+    store.cancel_session('A', 's2')
+    assert store.buses('A') == []
+    assert store.available_seats('A', 'bus1') == 2
+
+
+def test_cancel_bus_drops_every_reservation_on_it():
+    store = ReservationStore(total_seats=5)
+    store.add('A', 'bus1', 'Asha', 's1')
+    store.add('A', 'bus1', 'Bala', 's2')
+    store.add('A', 'bus2', 'Chitra', 's3')
+
+    assert sorted(store.cancel_bus('A', 'bus1')) == ['s1', 's2']
+    assert store.cancel_bus('A', 'bus1') == []
+    assert store.buses('A') == ['bus2']
+    assert not store.has_passenger('A', 'Bala')
+    assert store.has_passenger('A', 'Chitra')
+
+
+def test_lookups_do_not_create_entries():
+    store = ReservationStore(total_seats=5)
+
+    store.has_passenger('A', 'Asha')
+    store.has_session('A', 's1')
+    store.bus_for_session('A', 's1')
+    store.cancel_session('A', 's1')
+    store.cancel_bus('A', 'bus1')
+    store.available_seats('A', 'bus1')
+    store.reservations_for_bus('A', 'bus1')
+
+    assert store.routes() == []
+    assert store.buses('A') == []
@@ -0,0 +1,82 @@
+"""Driver session tokens: resume, revocation on leave/logout (python -m pytest tests)"""
+import pytest
+
+from conftest import add_active_bus, connect_driver, pump, received
+
+
+@pytest.fixture
+def route_id(app):
+    return sorted(app.STOP_COORDS)[0]
+
+
+@pytest.fixture
+def driver(app, route_id):
+    """A driver joined to route_id with bus1 and sending fixes; yields (client, sid, token)"""
+    client, sid = connect_driver(app, route_id, 'bus1')
+    token = received(client, 'bus_id_assigned')[0]['token']
+    add_active_bus(app, route_id, 'bus1', sid=sid, driver_id='DRIVER001')
+    app.session_index.add_bus(sid, route_id, 'bus1')
+    yield client, sid, token
+    if client.is_connected():
+        client.disconnect()
+
+
+def resume(app, token):
+    client = app.socketio.test_client(app.app)
+    client.emit('driver_resume', {'token': token})
+    pump(app)
+    reply, = received(client, 'driver_resumed')
+    client.disconnect()
+    return reply
+
+
+def test_dropped_driver_resumes_onto_its_parked_bus(app, route_id, driver):
+    client, _, token = driver
+    client.disconnect()
+    pump(app)
+    assert 'bus1' in app.parked_buses
+
+    reply = resume(app, token)
+
+    assert reply['success'] and reply['state_restored']
+    assert reply['bus_id'] == 'bus1'
+    assert 'bus1' not in app.parked_buses
+
+
+def test_forged_token_is_refused(app, driver):
+    _, _, token = driver
+    assert not resume(app, token[:-2] + 'xx')['success']
+
+
+def test_leave_route_revokes_tokens(app, route_id, driver):
+    client, _, token = driver
+    login_token = app.issue_driver_session_token(app.authenticated_drivers[driver[1]])
+
+    client.emit('leave_route', {'route_id': route_id, 'mode': 'bus', 'bus_id': 'bus1'})
+    pump(app)
+
+    assert 'bus1' not in app.active_buses[route_id]
+    assert not resume(app, token)['success']
+    assert not resume(app, login_token)['success']
+
+
+def test_tokens_issued_after_leaving_still_work(app, route_id, driver):
+    client, _, _ = driver
+    client.emit('leave_route', {'route_id': route_id, 'mode': 'bus', 'bus_id': 'bus1'})
+    client.emit('join_route', {'route_id': route_id, 'mode': 'bus', 'bus_id': 'bus2'})
+    pump(app)
+    token = received(client, 'bus_id_assigned')[-1]['token']
+
+    assert resume(app, token)['success']
+
+
+def test_logout_takes_the_bus_off_and_revokes_tokens(app, route_id, driver):
+    client, sid, token = driver
+
+    client.emit('driver_logout')
+    pump(app)
+
+    assert received(client, 'driver_logged_out')[0]['success']
+    assert sid not in app.authenticated_drivers
+    assert 'bus1' not in app.active_buses[route_id]
+    assert not resume(app, token)['success']
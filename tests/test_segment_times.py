@@ -0,0 +1,94 @@
+"""Segment travel-time tables built from the CSV logs (python -m pytest tests)"""
+import csv
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from conftest import ROOT
+import segment_times
+from segment_times import LOCATION_COLUMNS, SegmentTimeTable, build_tables, save_tables
+
+ARTIFACTS = os.path.join(ROOT, 'route_artifacts.json')
+LEGACY_LOCATION_COLUMNS = LOCATION_COLUMNS[:10] + ['speed_kmh']
+SPEED_KMH = 24.0
+START = datetime(2025, 10, 13, 8, 0) # A Monday, hour 8 of the week
+
+
+@pytest.fixture
+def logs(tmp_path, monkeypatch):
+    monkeypatch.setattr(segment_times, 'LOCATIONS_FILE', str(tmp_path / 'bus_locations.csv'))
+    monkeypatch.setattr(segment_times, 'HISTORY_FILE', str(tmp_path / 'bus_history.csv'))
+    return tmp_path
+
+
+@pytest.fixture
+def forward_route():
+    (route_id, _), (stop_ids, chainage) = next(
+        (key, value) for key, value in sorted(segment_times.load_stop_chainage(ARTIFACTS).items())
+        if key[1] == 'forward')
+    return route_id, stop_ids, chainage
+
+
+def trip_rows(route_id, stop_ids, chainage, bus_id, start):
+    """13-column location rows for one forward trip at SPEED_KMH, a fix every 30 s and one at the last stop"""
+    rows = []
+    trip_seconds = chainage[-1] / SPEED_KMH * 3600
+    for seconds in [*np.arange(0, trip_seconds, 30), trip_seconds]:
+        km = seconds * SPEED_KMH / 3600
+        stop_id = stop_ids[int(np.searchsorted(chainage, km, side='right')) - 1]
+        when = start + timedelta(seconds=float(seconds))
+        rows.append([when.isoformat(), route_id, bus_id, 'DRIVER001', '9.9', '78.1', '1', stop_id, 'Stop',
+                     '0.1', f"{km:.3f}", f"{SPEED_KMH:.2f}", '50'])
+    return rows
+
+
+def write_csv(path, header, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def test_legacy_header_with_newer_rows_is_read_by_row_width(logs, forward_route):
+    route_id, stop_ids, chainage = forward_route
+    legacy = [['2025-10-13T07:00:00', route_id, 'old', 'DRIVER001', '9.9', '78.1', '1', stop_ids[0], 'Stop', '0.1', '0.00']]
+    rows = trip_rows(route_id, stop_ids, chainage, 'new', START)
+    write_csv(segment_times.LOCATIONS_FILE, LEGACY_LOCATION_COLUMNS, legacy + rows)
+    write_csv(segment_times.HISTORY_FILE, ['timestamp', 'route_id', 'stop_id', 'predicted_time', 'distance_km'],
+              [['2025-10-13T07:00:00', route_id, stop_ids[0], '5', '1.0']])
+
+    fixes = segment_times._load_fixes()
+
+    assert set(fixes['bus_id']) == {'new'}
+    assert len(fixes) == len(rows)
+
+
+def test_logs_without_usable_rows_give_no_tables(logs, forward_route):
+    route_id, stop_ids, _ = forward_route
+    write_csv(segment_times.LOCATIONS_FILE, LEGACY_LOCATION_COLUMNS,
+              [['2025-10-13T07:00:00', route_id, 'old', 'DRIVER001', '9.9', '78.1', '1', stop_ids[0], 'Stop', '0.1', '0.00']])
+
+    assert build_tables(min_samples=1, route_artifacts_file=ARTIFACTS) == {}
+
+
+def test_tables_learn_segment_seconds_and_round_trip(logs, forward_route):
+    route_id, stop_ids, chainage = forward_route
+    rows = []
+    for day in range(3):
+        rows += trip_rows(route_id, stop_ids, chainage, f"bus{day}", START + timedelta(days=7 * day))
+    write_csv(segment_times.LOCATIONS_FILE, LOCATION_COLUMNS, rows)
+
+    tables = build_tables(percentiles=(50,), min_samples=1, route_artifacts_file=ARTIFACTS)
+    table = tables[(route_id, 'forward')]
+    expected = np.diff(chainage) / SPEED_KMH * 3600
+    learned = table['seconds'][:, 8, 0]
+    np.testing.assert_allclose(learned, expected, rtol=0.05, atol=5)
+
+    path = str(logs / 'segment_times.npz')
+    save_tables(tables, (50,), path)
+    loaded = SegmentTimeTable.load(path)
+    ahead, minutes = loaded.eta_minutes(route_id, 'forward', 0.0, START, percentile=50)
+    assert ahead == stop_ids[1:]
+    np.testing.assert_allclose(minutes, np.cumsum(expected) / 60, rtol=0.05, atol=0.1)
@@ -0,0 +1,83 @@
+"""Session resource index and disconnect cleanup (python -m pytest tests)"""
+import pytest
+
+from conftest import add_active_bus, pump, received
+from session_index import SessionIndex
+
+
+@pytest.fixture
+def route_id(app):
+    return sorted(app.STOP_COORDS)[0]
+
+
+def test_pop_route_returns_only_that_route_and_drops_empty_sessions():
+    index = SessionIndex()
+    index.add_bus('sid1', 'A', 'bus1')
+    index.add_reservation('sid1', 'A')
+    index.add_waitlist('sid1', 'B')
+    index.add_waiting_stop('sid1', 'A', 3)
+    index.add_waiting_stop('sid1', 'A', 3)
+
+    owned = index.pop_route('sid1', 'A')
+
+    assert owned['buses'] == {('A', 'bus1')}
+    assert owned['reservations'] == {'A'}
+    assert owned['waiting_stops'] == {('A', 3): 2}
+    assert index.routes('sid1') == {'B'}
+
+    index.pop_route('sid1', 'B')
+    assert len(index) == 0
+
+
+def test_remove_waiting_stop_only_counts_marks_the_session_made():
+    index = SessionIndex()
+    index.add_waiting_stop('sid1', 'A', 3)
+
+    assert index.remove_waiting_stop('sid1', 'A', 3)
+    assert not index.remove_waiting_stop('sid1', 'A', 3)
+    assert not index.remove_waiting_stop('other', 'A', 3)
+
+
+def test_socket_reservation_is_released_on_disconnect(app, route_id):
+    add_active_bus(app, route_id, 'bus1')
+    passenger = app.socketio.test_client(app.app)
+    passenger.emit('join_route', {'route_id': route_id, 'mode': 'passenger'})
+    passenger.emit('reserve_seat', {'route_id': route_id, 'passenger_name': 'Asha'})
+    pump(app)
+    assert received(passenger, 'reservation_result')[0]['bus_id'] == 'bus1'
+    assert len(app.session_index) == 1
+
+    passenger.disconnect()
+    pump(app)
+
+    assert app.reservation_store.reserved_count(route_id, 'bus1') == 0
+    assert not app.reservation_store.has_passenger(route_id, 'Asha')
+    assert len(app.session_index) == 0
+
+
+def test_socket_waitlist_entry_is_dropped_on_disconnect(app, route_id):
+    app.reservation_store.total_seats = 0
+    add_active_bus(app, route_id, 'bus1')
+    passenger = app.socketio.test_client(app.app)
+    passenger.emit('join_route', {'route_id': route_id, 'mode': 'passenger'})
+    passenger.emit('reserve_seat', {'route_id': route_id, 'passenger_name': 'Asha'})
+    pump(app)
+    assert received(passenger, 'reservation_result')[0]['waiting']
+
+    passenger.disconnect()
+    pump(app)
+
+    assert not app.waiting_reservations[route_id]
+    assert len(app.session_index) == 0
+
+
+def test_rest_bookings_are_not_indexed(app, route_id):
+    app.reservation_store.total_seats = 1
+    add_active_bus(app, route_id, 'bus1')
+    client = app.app.test_client()
+    for session_id, name in (('session_1', 'Asha'), ('session_2', 'Bala')):
+        client.post('/api/reserve_seat', json={'route_id': route_id, 'passenger_name': name, 'session_id': session_id})
+
+    assert app.reservation_store.has_session(route_id, 'session_1')
+    assert 'session_2' in app.waiting_reservations[route_id]
+    assert len(app.session_index) == 0
@@ -0,0 +1,86 @@
+"""Waiting-list promotion: heap order and who gets told (python -m pytest tests)"""
+import pytest
+
+from conftest import add_active_bus, pump, received
+from reservation_store import ReservationStore
+
+
+@pytest.fixture
+def route(app):
+    """A route with a near bus 'near' and a far bus 'far', one seat each"""
+    route_id = sorted(app.STOP_COORDS)[0]
+    app.reservation_store = ReservationStore(1)
+    add_active_bus(app, route_id, 'far', distance_from_start=5.0)
+    add_active_bus(app, route_id, 'near', distance_from_start=1.0)
+    return route_id
+
+
+def book_rest(app, route_id, session_id, name):
+    response = app.app.test_client().post('/api/reserve_seat', json={
+        'route_id': route_id, 'passenger_name': name, 'session_id': session_id})
+    return response.get_json()
+
+
+def release(app, route_id, session_id):
+    app.route_actors.call(route_id, app.reservation_store.cancel_session, route_id, session_id)
+    app.route_actors.call(route_id, app.assign_from_waiting_list, route_id)
+    pump(app)
+
+
+def test_bookings_fill_nearest_bus_first_then_wait(app, route):
+    assert book_rest(app, route, 's1', 'Asha')['bus_id'] == 'near'
+    assert book_rest(app, route, 's2', 'Bala')['bus_id'] == 'far'
+
+    result = book_rest(app, route, 's3', 'Chitra')
+    assert result['waiting'] and not result['success']
+    assert list(app.waiting_reservations[route]) == ['s3']
+
+
+def test_waiting_list_drains_in_arrival_order(app, route):
+    book_rest(app, route, 's1', 'Asha')
+    book_rest(app, route, 's2', 'Bala')
+    book_rest(app, route, 's3', 'Chitra')
+    book_rest(app, route, 's4', 'Dev')
+
+    release(app, route, 's2')
+
+    assert app.reservation_store.bus_for_session(route, 's3') == 'far'
+    assert list(app.waiting_reservations[route]) == ['s4']
+
+
+def test_rest_booking_is_told_through_the_route_room(app, route):
+    watcher = app.socketio.test_client(app.app)
+    watcher.emit('join_route', {'route_id': route, 'mode': 'passenger'})
+    book_rest(app, route, 's1', 'Asha')
+    book_rest(app, route, 's2', 'Bala')
+    book_rest(app, route, 'session_rest', 'Chitra')
+    watcher.get_received()
+
+    release(app, route, 's1')
+
+    assigned = received(watcher, 'reservation_assigned')
+    assert [(a['session_id'], a['bus_id']) for a in assigned] == [('session_rest', 'near')]
+    watcher.disconnect()
+
+
+def test_socket_booking_is_told_on_its_own_sid(app, route):
+    watcher = app.socketio.test_client(app.app)
+    passenger = app.socketio.test_client(app.app)
+    for client in (watcher, passenger):
+        client.emit('join_route', {'route_id': route, 'mode': 'passenger'})
+    book_rest(app, route, 's1', 'Asha')
+    book_rest(app, route, 's2', 'Bala')
+    passenger.emit('reserve_seat', {'route_id': route, 'passenger_name': 'Chitra'})
+    pump(app)
+    assert received(passenger, 'reservation_result')[0]['waiting']
+    watcher.get_received()
+
+    release(app, route, 's2')
+
+    assigned = received(passenger, 'reservation_assigned')
+    assert [a['bus_id'] for a in assigned] == ['far']
+    assert received(watcher, 'reservation_assigned') == []
+    for update in received(watcher, 'reservation_update'):
+        assert all('sid' not in a for a in update.get('assigned', []))
+    watcher.disconnect()
+    passenger.disconnect()
@@ -1,11 +1,22 @@
 import numpy as np
-import pickle
 import csv
 from model_class import LinearRegressionNumpy
+from model_registry import MODELS_DIR, publish_model
 import pandas as pd
 import os
+import io
+import time
+import argparse
+import hashlib
 from datetime import datetime
 
+LOCATIONS_FILE = 'bus_locations.csv'
+MODEL_FILE = 'model.npz'
+TRAINING_COLUMNS = ['timestamp', 'distance_to_stop_km', 'traffic_level', 'speed_kmh']
+VALIDATION_ROWS = 2000 # Newest rows kept out of each fit, so the server can check the model on rows it never saw
+VALIDATION_FRACTION = 0.2 # ...but never more than this share of the rows being fit
+SIGNATURE_BYTES = 512 # Bytes before csv_offset hashed to tell whether the file was rewritten since
+
 # Import or define the model class
 try:
     from model_class import LinearRegressionNumpy
@@ -37,62 +48,150 @@ except ImportError:
             ss_res = np.sum((y - y_pred) ** 2)
             return 1 - (ss_res / ss_tot)
 
+def compute_eta_labels(df):
+    """
+    Vectorized ETA labels (minutes) for a frame of location rows
+    ETA = (distance_km / speed_kmh) * 60, falling back to a traffic-adjusted
+    30 km/h when the logged speed is 0, with a 0.5 minute floor
+    """
+    distance = df['distance_to_stop_km'].to_numpy(dtype=float)
+    traffic = df['traffic_level'].to_numpy(dtype=float)
+    speed = df['speed_kmh'].to_numpy(dtype=float)
+    
+    base_speed = 30  # km/h
+    fallback_speed = np.full(len(df), float(base_speed))
+    np.divide(base_speed, traffic, out=fallback_speed, where=traffic > 0)
+    effective_speed = np.where(speed > 0, speed, fallback_speed)
+    
+    return np.maximum(0.5, (distance / effective_speed) * 60)
+
+def read_location_rows(start_offset=0):
+    """
+    Parse bus_locations.csv from a byte offset (0 = whole file)
+    Returns (DataFrame, end offset); a half-written last line is left for next time.
+    The frame's 'row_offset' column is the byte offset each row starts at.
+    """
+    with open(LOCATIONS_FILE, 'rb') as f:
+        header = f.readline()
+        if start_offset:
+            f.seek(start_offset)
+        else:
+            start_offset = f.tell()
+        chunk = f.read()
+    
+    chunk = chunk[:chunk.rfind(b'\n') + 1]
+    df = pd.read_csv(io.BytesIO(header + chunk), usecols=TRAINING_COLUMNS)
+    
+    # Line starts, skipping blank lines as read_csv does (if they still don't line up, every row
+    # gets the chunk's start, which only makes the next online update reread more)
+    data = np.frombuffer(chunk, dtype=np.uint8)
+    newlines = np.flatnonzero(data == ord('\n'))
+    starts = np.concatenate(([0], newlines[:-1] + 1))
+    lengths = newlines - starts
+    blank = (lengths == 0) | ((lengths == 1) & (data[newlines - 1] == ord('\r')))
+    starts = starts[~blank]
+    df['row_offset'] = start_offset + starts if len(starts) == len(df) else start_offset
+    return df, start_offset + len(chunk)
+
+def location_signature(offset):
+    """
+    Hash of the (up to SIGNATURE_BYTES) data bytes before `offset` in bus_locations.csv; the
+    server's trim rewrites the file in place, so after a trim they differ even if the file
+    has grown past the offset again
+    """
+    with open(LOCATIONS_FILE, 'rb') as f:
+        data_start = len(f.readline())
+        start = max(data_start, offset - SIGNATURE_BYTES)
+        f.seek(start)
+        data = f.read(max(0, offset - start))
+    return hashlib.sha1(data).hexdigest()
+
+def split_held_out(df, rows=VALIDATION_ROWS):
+    """
+    (fit rows, held-out rows): the newest rows by timestamp, at most `rows` and at most
+    VALIDATION_FRACTION of df, are held out. Every held-out row is newer than every fit
+    row, so the held-out rows are exactly those after the fit's trained_until.
+    """
+    held_out = min(rows, int(len(df) * VALIDATION_FRACTION))
+    if held_out == 0:
+        return df, df.iloc[:0]
+    timestamps = df['timestamp'].astype(str)
+    cutoff = np.sort(timestamps.to_numpy())[len(df) - held_out]
+    fit = timestamps < cutoff
+    if not fit.any():
+        return df, df.iloc[:0]
+    return df[fit], df[~fit]
+
+def fit_meta(fit_df, held_out_df, end_offset):
+    """csv_offset / trained_until for a model fit on fit_df; the next online update rereads from the held-out rows"""
+    csv_offset = int(held_out_df['row_offset'].min()) if len(held_out_df) else end_offset
+    return {'csv_offset': csv_offset, 'csv_signature': location_signature(csv_offset),
+            'trained_until': str(fit_df['timestamp'].max()), 'held_out': len(held_out_df)}
+
+def load_validation_sample(*models, rows=VALIDATION_ROWS):
+    """
+    (X, y) from the newest logged rows (up to `rows`) that none of `models` was fit on, i.e. logged
+    after their trained_until; used by the server's model registry to vet new models
+    """
+    if not os.path.isfile(LOCATIONS_FILE):
+        return None
+    df, _ = read_location_rows()
+    trained_until = max(filter(None, (getattr(model, 'trained_until', None) for model in models)), default=None)
+    if trained_until:
+        df = df[df['timestamp'].astype(str) > trained_until]
+    df = df.tail(rows)
+    if len(df) == 0:
+        return None
+    return df[['distance_to_stop_km', 'traffic_level']].to_numpy(dtype=float), compute_eta_labels(df)
+
 def load_historical_data():
-    """Load and process historical bus location data"""
+    """Load and process historical bus location data
+    
+    Returns (X, y, meta) where meta records how far into bus_locations.csv the
+    data goes, so train_online() can pick up from there. The newest rows are
+    held out (split_held_out) and not returned.
+    """
     print("=" * 70)
     print("📊 Loading Historical Bus Location Data")
     print("=" * 70)
     
-    if not os.path.isfile('bus_locations.csv'):
+    if not os.path.isfile(LOCATIONS_FILE):
         print("⚠ No historical data found in bus_locations.csv")
         print("📝 Generating sample training data instead...")
-        return generate_sample_data()
+        return generate_sample_data() + ({},)
     
     try:
-        df = pd.read_csv('bus_locations.csv')
+        df, end_offset = read_location_rows()
         print(f"✓ Loaded {len(df)} records from bus_locations.csv")
         
         if len(df) < 10:
             print("⚠ Insufficient historical data (< 10 records)")
             print("📝 Combining with sample data...")
             sample_data = generate_sample_data()
-            return sample_data
+            return sample_data + ({},)
+        
+        # The newest rows stay out of the fit; the server validates the model on them
+        df, held_out_df = split_held_out(df)
+        print(f"✓ Held out the newest {len(held_out_df)} records for validation by the server")
         
         # Extract features
-        X = df[['distance_to_stop_km', 'traffic_level']].values
+        X = df[['distance_to_stop_km', 'traffic_level']].to_numpy(dtype=float)
         
         # Calculate actual time based on speed and distance
-        # ETA (minutes) = (distance_km / speed_kmh) * 60
-        # If speed is 0, use fallback calculation
-        y = []
-        for idx, row in df.iterrows():
-            distance = row['distance_to_stop_km']
-            traffic = row['traffic_level']
-            speed = row['speed_kmh']
-            
-            if speed > 0:
-                eta = (distance / speed) * 60  # Convert to minutes
-            else:
-                # Fallback: use traffic-adjusted speed
-                base_speed = 30  # km/h
-                adjusted_speed = base_speed / traffic if traffic > 0 else base_speed
-                eta = (distance / adjusted_speed) * 60
-            
-            y.append(max(0.5, eta))  # Minimum 0.5 minutes
-        
-        y = np.array(y)
+        y = compute_eta_labels(df)
         
         print(f"✓ Processed {len(X)} training samples")
         print(f"  - Distance range: {X[:, 0].min():.2f} to {X[:, 0].max():.2f} km")
         print(f"  - Traffic range: {X[:, 1].min():.2f} to {X[:, 1].max():.2f}")
         print(f"  - ETA range: {y.min():.2f} to {y.max():.2f} minutes")
         
-        return X, y
+        meta = fit_meta(df, held_out_df, end_offset)
+        return X, y, meta
         
     except Exception as e:
         print(f"✗ Error loading historical data: {e}")
         print("📝 Generating sample training data instead...")
-        return generate_sample_data()
+        return generate_sample_data() + ({},)
 
 def generate_sample_data():
     """Generate sample training data"""
@@ -168,7 +267,7 @@ def train_model():
     print("=" * 70)
     
     # Load data (historical or sample)
-    X, y = load_historical_data()
+    X, y, meta = load_historical_data()
     
     # Split into train/test (80/20)
     split_idx = int(0.8 * len(X))
@@ -184,9 +283,12 @@ def train_model():
     print(f"  - Testing samples: {len(X_test)}")
     
     # Create and train model
-    print(f"\n⚙️ Training Linear Regression Model...")
+    print(f"\n⚙️ Training Linear Regression Model (closed-form least squares)...")
+    fit_start = time.perf_counter()
     model = LinearRegressionNumpy()
-    model.fit(X_train, y_train, learning_rate=0.01, epochs=2000)
+    model.fit_closed_form(X_train, y_train)
+    fit_ms = (time.perf_counter() - fit_start) * 1000
+    print(f"  - Fit time: {fit_ms:.1f} ms")
     
     # Evaluate model
     train_score = model.score(X_train, y_train)
@@ -215,14 +317,24 @@ def train_model():
     print(f"  - Weight (Traffic):  {model.weights[1]:.4f}")
     print(f"  - Bias:              {model.bias:.4f}")
     
+    # Fold the test rows in too, so the saved statistics cover everything up to meta['csv_offset']
+    # (the rows held out by load_historical_data stay out)
+    model.partial_fit(X_test, y_test)
+    model.csv_offset = meta.get('csv_offset', 0)
+    model.csv_signature = meta.get('csv_signature')
+    model.trained_until = meta.get('trained_until')
+    
     # Save model
-    with open('model.pkl', 'wb') as f:
-        pickle.dump(model, f)
+    model.save(MODEL_FILE)
     
-    model_size = os.path.getsize('model.pkl')
-    print(f"\n💾 Model saved to model.pkl")
+    model_size = os.path.getsize(MODEL_FILE)
+    print(f"\n💾 Model saved to {MODEL_FILE}")
     print(f"  - Size: {model_size} bytes (~{model_size/1024:.1f} KB)")
     
+    # Publish a versioned copy; a running server picks it up without a restart
+    published = publish_model(model, MODELS_DIR)
+    print(f"  - Published {published} (hot-reloaded by the server)")
+    
     # Test predictions with various scenarios
     print(f"\n🧪 Sample Predictions:")
     print(f"  {'Distance':<12} {'Traffic':<12} {'Predicted ETA':<15} {'Expected':<15}")
@@ -247,11 +359,89 @@ def train_model():
     print("=" * 70)
     print("\n💡 Next Steps:")
     print("  1. Run 'python app.py' to start the bus tracking server")
-    print("  2. The model will automatically load and provide ETA predictions")
+    print("  2. The model will automatically load (a running server hot-reloads it) and provide ETA predictions")
     print("  3. As buses operate, more data will be collected in bus_locations.csv")
     print("  4. Retrain periodically with: python train.py")
     print("\n" + "=" * 70)
 
+def train_online():
+    """
+    Update the saved model with rows logged since it was last trained
+    Only XᵀX / Xᵀy are updated, so earlier history is never re-read
+    """
+    print("\n" + "=" * 70)
+    print("🔁 Online Model Update")
+    print("=" * 70)
+    
+    try:
+        model = LinearRegressionNumpy.load(MODEL_FILE)
+    except (FileNotFoundError, ValueError, KeyError) as e:
+        print(f"⚠ No usable {MODEL_FILE} ({e}), running full training instead")
+        return train_model()
+    
+    if getattr(model, 'xtx', None) is None:
+        print("⚠ Saved model has no sufficient statistics (gradient-descent model), running full training instead")
+        return train_model()
+    
+    if not os.path.isfile(LOCATIONS_FILE):
+        print("⚠ No bus_locations.csv, nothing to add")
+        return model
+    
+    offset = getattr(model, 'csv_offset', 0)
+    signature = getattr(model, 'csv_signature', None)
+    trained_until = getattr(model, 'trained_until', None)
+    
+    update_start = time.perf_counter()
+    if offset and offset <= os.path.getsize(LOCATIONS_FILE) and signature == location_signature(offset):
+        df, end_offset = read_location_rows(offset)
+    else:
+        # The server trimmed (rewrote) the file since the last run: fall back to timestamps
+        print("⚠ bus_locations.csv was rewritten since the last update, rescanning it by timestamp")
+        df, end_offset = read_location_rows()
+    if trained_until:
+        df = df[df['timestamp'].astype(str) > trained_until]
+    
+    # Hold out the newest of the new rows, as train_model does; the next update fits them
+    df, held_out_df = split_held_out(df)
+    if len(df) == 0:
+        print("✓ No new rows since the last update")
+        return model
+    
+    X = df[['distance_to_stop_km', 'traffic_level']].to_numpy(dtype=float)
+    y = compute_eta_labels(df)
+    model.partial_fit(X, y)
+    meta = fit_meta(df, held_out_df, end_offset)
+    model.csv_offset = meta['csv_offset']
+    model.csv_signature = meta['csv_signature']
+    model.trained_until = meta['trained_until']
+    
+    model.save(MODEL_FILE)
+    published = publish_model(model, MODELS_DIR)
+    
+    print(f"✓ Added {len(df)} rows in {(time.perf_counter() - update_start) * 1000:.1f} ms "
+          f"({model.n_samples} samples total, newest {len(held_out_df)} held out for validation)")
+    print(f"  - Published {published}")
+    print(f"  - Weight (Distance): {model.weights[0]:.4f}")
+    print(f"  - Weight (Traffic):  {model.weights[1]:.4f}")
+    print(f"  - Bias:              {model.bias:.4f}")
+    return model
+
+def convert_pickle_model(path):
+    """One-off migration of a model.pkl from older versions to the .npz weights format"""
+    import pickle
+    with open(path, 'rb') as f:
+        legacy = pickle.load(f) # Only ever run this on files you trained yourself
+    
+    model = LinearRegressionNumpy()
+    model.weights = np.asarray(legacy.weights, dtype=float)
+    model.bias = float(legacy.bias)
+    for attr in ('xtx', 'xty', 'n_samples', 'csv_offset', 'trained_until'):
+        if getattr(legacy, attr, None) is not None:
+            setattr(model, attr, getattr(legacy, attr))
+    model.save(MODEL_FILE)
+    print(f"✓ Converted {path} -> {MODEL_FILE}")
+    return model
+
 def analyze_historical_data():
     """Analyze historical data if available"""
     if not os.path.isfile('bus_locations.csv'):
@@ -302,6 +492,21 @@ def analyze_historical_data():
         print(f"Error analyzing data: {e}")
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train the bus ETA model')
+    parser.add_argument('--online', action='store_true',
+                        help='Only add rows logged since the last training run to the saved model')
+    parser.add_argument('--convert-pickle', metavar='PATH',
+                        help=f'Convert a model.pkl from an older version to {MODEL_FILE} and exit')
+    args = parser.parse_args()
+    
+    if args.convert_pickle:
+        convert_pickle_model(args.convert_pickle)
+        raise SystemExit(0)
+    
+    if args.online:
+        train_online()
+        raise SystemExit(0)
+    
     print("\n")
     print("╔" + "═" * 68 + "╗")
     print("║" + " " * 15 + "🚌 Bus Tracking ML Model Trainer" + " " * 20 + "║")